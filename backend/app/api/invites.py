@@ -17,6 +17,7 @@ from app.models.invite import (
     InviteStatsResponse,
 )
 from app.database import db, InviteDB, PlexUserDB, PlexStatsDB
+from app.services.db_writer import db_writer
 from app.utils.logger import logger
 from app.middleware.auth import require_auth
 from app.config import settings
@@ -149,6 +150,35 @@ def db_invite_to_pydantic(
     return Invite(**base_data)
 
 
+def db_user_to_pydantic(db_user: PlexUserDB) -> PlexUser:
+    """Convert database Plex user to Pydantic model"""
+    return PlexUser(
+        id=db_user.id,  # type: ignore
+        email=db_user.email,  # type: ignore
+        username=db_user.username,  # type: ignore
+        plex_id=db_user.plex_id,  # type: ignore
+        thumb=db_user.thumb,  # type: ignore
+        invite_id=db_user.invite_id,  # type: ignore
+        created_at=db_user.created_at,  # type: ignore
+        last_seen=db_user.last_seen,  # type: ignore
+        expires_at=db_user.expires_at,  # type: ignore
+        is_active=db_user.is_active,  # type: ignore
+    )
+
+
+def apply_plex_user_info(session, user_id: int, user_info: dict) -> Optional[PlexUser]:
+    """Store username, plex_id and avatar fetched from Plex on a user"""
+    db_user = session.query(PlexUserDB).filter_by(id=user_id).first()
+    if not db_user:
+        return None
+    db_user.username = user_info.get("username")  # type: ignore
+    db_user.plex_id = user_info.get("id")  # type: ignore
+    db_user.thumb = user_info.get("thumb")  # type: ignore
+    session.commit()
+    session.refresh(db_user)
+    return db_user_to_pydantic(db_user)
+
+
 async def invite_plex_user(
     email: str,
     plex_config: dict,
@@ -228,71 +258,69 @@ async def create_invite(
     invite_data: InviteCreate, username: str = Depends(require_auth)
 ):
     """Create a new invite code"""
-    try:
-        session = db.get_session()
-        try:
-            # Use custom code if provided, otherwise generate one
-            if invite_data.custom_code:
-                code = invite_data.custom_code.strip().upper()
-                # Validate custom code
-                if len(code) < 4:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="Custom code must be at least 4 characters long",
-                    )
-                if not code.replace("-", "").replace("_", "").isalnum():
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="Custom code can only contain letters, numbers, hyphens, and underscores",
-                    )
-                # Check if code already exists
-                if session.query(InviteDB).filter_by(code=code).first():
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail="This invite code already exists",
-                    )
-            else:
-                # Generate unique code
+
+    def insert_invite(session):
+        # Use custom code if provided, otherwise generate one
+        if invite_data.custom_code:
+            code = invite_data.custom_code.strip().upper()
+            # Validate custom code
+            if len(code) < 4:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Custom code must be at least 4 characters long",
+                )
+            if not code.replace("-", "").replace("_", "").isalnum():
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Custom code can only contain letters, numbers, hyphens, and underscores",
+                )
+            # Check if code already exists
+            if session.query(InviteDB).filter_by(code=code).first():
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="This invite code already exists",
+                )
+        else:
+            # Generate unique code
+            code = generate_invite_code()
+            while session.query(InviteDB).filter_by(code=code).first():
                 code = generate_invite_code()
-                while session.query(InviteDB).filter_by(code=code).first():
-                    code = generate_invite_code()
-
-            # Calculate expiration
-            expires_at = None
-            if invite_data.expires_in_days:
-                expires_at = datetime.now(timezone.utc).replace(
-                    tzinfo=None
-                ) + timedelta(days=invite_data.expires_in_days)
-
-            # Create invite
-            db_invite = InviteDB(
-                code=code,
-                created_by=username,
-                expires_at=expires_at,
-                usage_limit=invite_data.usage_limit,
-                allow_sync=invite_data.allow_sync,
-                allow_camera_upload=invite_data.allow_camera_upload,
-                allow_channels=invite_data.allow_channels,
-                plex_home=invite_data.plex_home,
-                libraries=invite_data.libraries,
-            )
 
-            session.add(db_invite)
-            session.commit()
-            session.refresh(db_invite)
+        # Calculate expiration
+        expires_at = None
+        if invite_data.expires_in_days:
+            expires_at = datetime.now(timezone.utc).replace(
+                tzinfo=None
+            ) + timedelta(days=invite_data.expires_in_days)
+
+        # Create invite
+        db_invite = InviteDB(
+            code=code,
+            created_by=username,
+            expires_at=expires_at,
+            usage_limit=invite_data.usage_limit,
+            allow_sync=invite_data.allow_sync,
+            allow_camera_upload=invite_data.allow_camera_upload,
+            allow_channels=invite_data.allow_channels,
+            plex_home=invite_data.plex_home,
+            libraries=invite_data.libraries,
+        )
 
-            logger.info(f"Created invite {code} by {username}")
+        session.add(db_invite)
+        session.commit()
+        session.refresh(db_invite)
 
-            # Get Plex server name from config
-            from app.config import settings
+        logger.info(f"Created invite {code} by {username}")
 
-            plex_server = settings.PLEX_SERVER_NAME or "Plex Server"
+        # Get Plex server name from config
+        from app.config import settings
 
-            return db_invite_to_pydantic(db_invite, plex_server=plex_server)
+        plex_server = settings.PLEX_SERVER_NAME or "Plex Server"
 
-        finally:
-            session.close()
+        return db_invite_to_pydantic(db_invite, plex_server=plex_server)
 
+    try:
+        return await db.run_in_session(insert_invite)
     except Exception as e:
         logger.error(f"Error creating invite: {e}", exc_info=True)
         raise HTTPException(
@@ -306,73 +334,70 @@ async def list_invites(
     include_inactive: bool = False, username: str = Depends(require_auth)
 ) -> List[InviteWithUsers]:
     """List all invites"""
+
+    def invite_query(session):
+        query = session.query(InviteDB)
+
+        if not include_inactive:
+            query = query.filter_by(is_active=True)
+
+        return query.order_by(InviteDB.created_at.desc())
+
+    def find_incomplete_users(session):
+        return [
+            (user.id, user.email)
+            for invite in invite_query(session)
+            for user in invite.users
+            # Check if user is missing thumb or username
+            if not user.thumb or not user.username
+        ]
+
+    def load_invites(session, user_updates, plex_server):
+        for user_id, user_info in user_updates:
+            user = session.get(PlexUserDB, user_id)
+            if user:
+                user.username = user_info.get("username") or user.username
+                user.plex_id = user_info.get("id") or user.plex_id
+                user.thumb = user_info.get("thumb") or user.thumb
+        if user_updates:
+            session.commit()
+
+        return [
+            db_invite_to_pydantic(inv, include_users=True, plex_server=plex_server)
+            for inv in invite_query(session).all()
+        ]
+
     try:
-        session = db.get_session()
-        try:
-            # Get Plex server name from settings
-            plex_config = get_plex_config_from_settings()
-            plex_server = plex_config["server_name"] if plex_config else "Plex Server"
-            logger.info(f"Using Plex server name: {plex_server}")
-
-            query = session.query(InviteDB)
-
-            if not include_inactive:
-                query = query.filter_by(is_active=True)
-
-            invites = query.order_by(InviteDB.created_at.desc()).all()
-
-            # Auto-update missing user info (username, plex_id, thumb) for users without thumb
-            if plex_config and plex_config.get("token"):
-                for invite in invites:
-                    if invite.users:
-                        for user in invite.users:
-                            # Check if user is missing thumb or username
-                            if not user.thumb or not user.username:
-                                try:
-                                    logger.info(
-                                        f"Auto-fetching missing info for user {user.email}"
-                                    )
-                                    from app.utils.plex_invite import get_plex_user_info
-
-                                    user_info = await get_plex_user_info(
-                                        token=plex_config["token"], email=user.email
-                                    )
-
-                                    if user_info:
-                                        logger.info(
-                                            f"Successfully fetched info for {user.email}: {user_info}"
-                                        )
-                                        user.username = (
-                                            user_info.get("username") or user.username
-                                        )
-                                        user.plex_id = (
-                                            user_info.get("id") or user.plex_id
-                                        )
-                                        user.thumb = (
-                                            user_info.get("thumb") or user.thumb
-                                        )
-                                        session.commit()
-                                        logger.info(
-                                            f"Updated user {user.email} with avatar and info"
-                                        )
-                                    else:
-                                        logger.warning(
-                                            f"Could not fetch info for user {user.email}"
-                                        )
-                                except Exception as user_error:
-                                    logger.warning(
-                                        f"Error auto-updating user {user.email}: {user_error}"
-                                    )
-                                    # Continue processing other users even if one fails
-                                    continue
-
-            return [
-                db_invite_to_pydantic(inv, include_users=True, plex_server=plex_server)
-                for inv in invites
-            ]
+        # Get Plex server name from settings
+        plex_config = get_plex_config_from_settings()
+        plex_server = plex_config["server_name"] if plex_config else "Plex Server"
+        logger.info(f"Using Plex server name: {plex_server}")
+
+        # Auto-update missing user info (username, plex_id, thumb) for users without thumb
+        user_updates = []
+        if plex_config and plex_config.get("token"):
+            for user_id, email in await db.run_in_session(find_incomplete_users):
+                try:
+                    logger.info(f"Auto-fetching missing info for user {email}")
+                    from app.utils.plex_invite import get_plex_user_info
 
-        finally:
-            session.close()
+                    user_info = await get_plex_user_info(
+                        token=plex_config["token"], email=email
+                    )
+
+                    if user_info:
+                        logger.info(
+                            f"Successfully fetched info for {email}: {user_info}"
+                        )
+                        user_updates.append((user_id, user_info))
+                    else:
+                        logger.warning(f"Could not fetch info for user {email}")
+                except Exception as user_error:
+                    logger.warning(f"Error auto-updating user {email}: {user_error}")
+                    # Continue processing other users even if one fails
+                    continue
+
+        return await db.run_in_session(load_invites, user_updates, plex_server)
 
     except Exception as e:
         logger.error(f"Error listing invites: {e}", exc_info=True)
@@ -428,58 +453,56 @@ async def get_plex_config(username: str = Depends(require_auth)):
 @router.get("/stats", response_model=InviteStatsResponse)
 async def get_invite_stats(username: str = Depends(require_auth)):
     """Get invite statistics"""
-    try:
-        session = db.get_session()
-        try:
-            now = datetime.now(timezone.utc).replace(tzinfo=None)
-
-            total_invites = session.query(InviteDB).count()
-
-            # Active invites: is_active=True AND not expired AND not exhausted
-            active_invites = (
-                session.query(InviteDB)
-                .filter(
-                    InviteDB.is_active == True,
-                    (InviteDB.expires_at.is_(None)) | (InviteDB.expires_at > now),
-                    (InviteDB.usage_limit.is_(None))
-                    | (InviteDB.used_count < InviteDB.usage_limit),
-                )
-                .count()
-            )
 
-            total_users = session.query(PlexUserDB).count()
-            active_users = session.query(PlexUserDB).filter_by(is_active=True).count()
+    def count_invites(session):
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
 
-            # Calculate used up invites (where used_count >= usage_limit and usage_limit is not null)
-            used_up_invites = (
-                session.query(InviteDB)
-                .filter(
-                    InviteDB.usage_limit.isnot(None),
-                    InviteDB.used_count >= InviteDB.usage_limit,
-                )
-                .count()
-            )
+        total_invites = session.query(InviteDB).count()
 
-            # Calculate total redemptions (sum of all used_count)
-            total_redemptions = (
-                session.query(InviteDB)
-                .with_entities(func.sum(InviteDB.used_count))
-                .scalar()
-                or 0
+        # Active invites: is_active=True AND not expired AND not exhausted
+        active_invites = (
+            session.query(InviteDB)
+            .filter(
+                InviteDB.is_active == True,
+                (InviteDB.expires_at.is_(None)) | (InviteDB.expires_at > now),
+                (InviteDB.usage_limit.is_(None))
+                | (InviteDB.used_count < InviteDB.usage_limit),
             )
+            .count()
+        )
+
+        total_users = session.query(PlexUserDB).count()
+        active_users = session.query(PlexUserDB).filter_by(is_active=True).count()
 
-            return InviteStatsResponse(
-                total_invites=total_invites,
-                active_invites=active_invites,
-                used_up_invites=used_up_invites,
-                total_redemptions=total_redemptions,
-                total_users=total_users,
-                active_users=active_users,
+        # Calculate used up invites (where used_count >= usage_limit and usage_limit is not null)
+        used_up_invites = (
+            session.query(InviteDB)
+            .filter(
+                InviteDB.usage_limit.isnot(None),
+                InviteDB.used_count >= InviteDB.usage_limit,
             )
+            .count()
+        )
 
-        finally:
-            session.close()
+        # Calculate total redemptions (sum of all used_count)
+        total_redemptions = (
+            session.query(InviteDB)
+            .with_entities(func.sum(InviteDB.used_count))
+            .scalar()
+            or 0
+        )
 
+        return InviteStatsResponse(
+            total_invites=total_invites,
+            active_invites=active_invites,
+            used_up_invites=used_up_invites,
+            total_redemptions=total_redemptions,
+            total_users=total_users,
+            active_users=active_users,
+        )
+
+    try:
+        return await db.run_in_session(count_invites)
     except Exception as e:
         logger.error(f"Error getting invite stats: {e}", exc_info=True)
         raise HTTPException(
@@ -491,27 +514,25 @@ async def get_invite_stats(username: str = Depends(require_auth)):
 @router.get("/{invite_id}", response_model=InviteWithUsers)
 async def get_invite(invite_id: int, username: str = Depends(require_auth)):
     """Get a specific invite by ID"""
-    try:
-        session = db.get_session()
-        try:
-            db_invite = session.query(InviteDB).filter_by(id=invite_id).first()
 
-            if not db_invite:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND, detail="Invite not found"
-                )
-
-            # Get Plex server name from settings
-            plex_config = get_plex_config_from_settings()
-            plex_server = plex_config["server_name"] if plex_config else "Plex Server"
+    def load_invite(session):
+        db_invite = session.query(InviteDB).filter_by(id=invite_id).first()
 
-            return db_invite_to_pydantic(
-                db_invite, include_users=True, plex_server=plex_server
+        if not db_invite:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Invite not found"
             )
 
-        finally:
-            session.close()
+        # Get Plex server name from settings
+        plex_config = get_plex_config_from_settings()
+        plex_server = plex_config["server_name"] if plex_config else "Plex Server"
+
+        return db_invite_to_pydantic(
+            db_invite, include_users=True, plex_server=plex_server
+        )
 
+    try:
+        return await db.run_in_session(load_invite)
     except HTTPException:
         raise
     except Exception as e:
@@ -527,37 +548,35 @@ async def update_invite(
     invite_id: int, invite_data: InviteUpdate, username: str = Depends(require_auth)
 ):
     """Update an existing invite"""
-    try:
-        session = db.get_session()
-        try:
-            db_invite = session.query(InviteDB).filter_by(id=invite_id).first()
 
-            if not db_invite:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND, detail="Invite not found"
-                )
+    def apply_update(session):
+        db_invite = session.query(InviteDB).filter_by(id=invite_id).first()
 
-            # Update fields - use model_fields_set to detect explicitly provided fields
-            update_data = invite_data.model_dump(exclude_unset=True)
+        if not db_invite:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Invite not found"
+            )
 
-            for field, value in update_data.items():
-                if hasattr(db_invite, field):
-                    setattr(db_invite, field, value)  # type: ignore
+        # Update fields - use model_fields_set to detect explicitly provided fields
+        update_data = invite_data.model_dump(exclude_unset=True)
 
-            session.commit()
-            session.refresh(db_invite)
+        for field, value in update_data.items():
+            if hasattr(db_invite, field):
+                setattr(db_invite, field, value)  # type: ignore
 
-            logger.info(f"Updated invite {db_invite.code} by {username}")
+        session.commit()
+        session.refresh(db_invite)
 
-            # Get Plex server name from settings
-            plex_config = get_plex_config_from_settings()
-            plex_server = plex_config["server_name"] if plex_config else "Plex Server"
+        logger.info(f"Updated invite {db_invite.code} by {username}")
 
-            return db_invite_to_pydantic(db_invite, plex_server=plex_server)
+        # Get Plex server name from settings
+        plex_config = get_plex_config_from_settings()
+        plex_server = plex_config["server_name"] if plex_config else "Plex Server"
 
-        finally:
-            session.close()
+        return db_invite_to_pydantic(db_invite, plex_server=plex_server)
 
+    try:
+        return await db.run_in_session(apply_update)
     except HTTPException:
         raise
     except Exception as e:
@@ -571,45 +590,40 @@ async def update_invite(
 @router.delete("/{invite_id}")
 async def delete_invite(invite_id: int, username: str = Depends(require_auth)):
     """Delete an invite code (does not remove users from Plex - use User Accounts page for that)"""
-    try:
-        session = db.get_session()
-        try:
-            db_invite = session.query(InviteDB).filter_by(id=invite_id).first()
 
-            if not db_invite:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND, detail="Invite not found"
-                )
+    def remove_invite(session):
+        db_invite = session.query(InviteDB).filter_by(id=invite_id).first()
 
-            code = db_invite.code
+        if not db_invite:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Invite not found"
+            )
 
-            # Check if invite has associated users
-            users = session.query(PlexUserDB).filter_by(invite_id=invite_id).all()
-            user_count = len(users)
+        code = db_invite.code
 
-            if user_count > 0:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Cannot delete invite with {user_count} active user(s). Please remove users first from User Accounts page.",
-                )
+        # Check if invite has associated users
+        users = session.query(PlexUserDB).filter_by(invite_id=invite_id).all()
+        user_count = len(users)
 
-            # Delete invite
-            session.delete(db_invite)
-            session.commit()
+        if user_count > 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Cannot delete invite with {user_count} active user(s). Please remove users first from User Accounts page.",
+            )
 
-            logger.info(f"Deleted invite {code} by {username}")
+        # Delete invite
+        session.delete(db_invite)
+        session.commit()
 
-            return {
-                "success": True,
-                "message": "Invite deleted successfully",
-            }
+        logger.info(f"Deleted invite {code} by {username}")
 
-        except Exception as e:
-            session.rollback()
-            raise
-        finally:
-            session.close()
+        return {
+            "success": True,
+            "message": "Invite deleted successfully",
+        }
 
+    try:
+        return await db.run_in_session(remove_invite)
     except HTTPException:
         raise
     except Exception as e:
@@ -626,60 +640,58 @@ async def delete_invite(invite_id: int, username: str = Depends(require_auth)):
 @router.post("/validate", response_model=ValidateInviteResponse)
 async def validate_invite(code: str):
     """Validate an invite code (public endpoint)"""
-    try:
-        session = db.get_session()
-        try:
-            db_invite = session.query(InviteDB).filter_by(code=code.upper()).first()
-
-            if not db_invite:
-                return ValidateInviteResponse(
-                    valid=False,
-                    message="Einladungscode nicht gefunden",
-                    invite=None,
-                    plex_server_name=None,
-                )
 
-            if not db_invite.is_active:
-                return ValidateInviteResponse(
-                    valid=False,
-                    message="Diese Einladung wurde deaktiviert",
-                    invite=None,
-                    plex_server_name=None,
-                )
+    def check_invite(session):
+        db_invite = session.query(InviteDB).filter_by(code=code.upper()).first()
 
-            now = datetime.now(timezone.utc).replace(tzinfo=None)
+        if not db_invite:
+            return ValidateInviteResponse(
+                valid=False,
+                message="Einladungscode nicht gefunden",
+                invite=None,
+                plex_server_name=None,
+            )
 
-            if db_invite.expires_at and db_invite.expires_at < now:
-                return ValidateInviteResponse(
-                    valid=False,
-                    message="Diese Einladung ist abgelaufen",
-                    invite=None,
-                    plex_server_name=None,
-                )
+        if not db_invite.is_active:
+            return ValidateInviteResponse(
+                valid=False,
+                message="Diese Einladung wurde deaktiviert",
+                invite=None,
+                plex_server_name=None,
+            )
 
-            if db_invite.usage_limit and db_invite.used_count >= db_invite.usage_limit:
-                return ValidateInviteResponse(
-                    valid=False,
-                    message="Diese Einladung hat das maximale Nutzungslimit erreicht",
-                    invite=None,
-                    plex_server_name=None,
-                )
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
 
-            # Get Plex server name from config
-            # Get Plex server name from settings
-            plex_config = get_plex_config_from_settings()
-            server_name = plex_config["server_name"] if plex_config else "Plex Server"
+        if db_invite.expires_at and db_invite.expires_at < now:
+            return ValidateInviteResponse(
+                valid=False,
+                message="Diese Einladung ist abgelaufen",
+                invite=None,
+                plex_server_name=None,
+            )
 
+        if db_invite.usage_limit and db_invite.used_count >= db_invite.usage_limit:
             return ValidateInviteResponse(
-                valid=True,
-                message="Valid invite code",
-                invite=db_invite_to_pydantic(db_invite, plex_server=server_name),
-                plex_server_name=server_name,
+                valid=False,
+                message="Diese Einladung hat das maximale Nutzungslimit erreicht",
+                invite=None,
+                plex_server_name=None,
             )
 
-        finally:
-            session.close()
+        # Get Plex server name from config
+        # Get Plex server name from settings
+        plex_config = get_plex_config_from_settings()
+        server_name = plex_config["server_name"] if plex_config else "Plex Server"
 
+        return ValidateInviteResponse(
+            valid=True,
+            message="Valid invite code",
+            invite=db_invite_to_pydantic(db_invite, plex_server=server_name),
+            plex_server_name=server_name,
+        )
+
+    try:
+        return await db.run_in_session(check_invite)
     except Exception as e:
         logger.error(f"Error validating invite: {e}", exc_info=True)
         raise HTTPException(
@@ -691,164 +703,145 @@ async def validate_invite(code: str):
 @router.post("/redeem")
 async def redeem_invite(request: RedeemInviteRequest):
     """Redeem an invite code and invite user to Plex (public endpoint)"""
-    try:
-        session = db.get_session()
-        try:
-            # Validate invite
-            db_invite = (
-                session.query(InviteDB).filter_by(code=request.code.upper()).first()
-            )
+    email = request.email.lower()
 
-            if not db_invite:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Invite code not found",
-                )
+    def load_invite(session):
+        # Validate invite
+        db_invite = session.query(InviteDB).filter_by(code=request.code.upper()).first()
 
-            if not db_invite.is_active:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="This invite has been disabled",
-                )
+        if not db_invite:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Invite code not found",
+            )
+
+        if not db_invite.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="This invite has been disabled",
+            )
 
-            now = datetime.now(timezone.utc).replace(tzinfo=None)
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
 
-            if db_invite.expires_at and db_invite.expires_at < now:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="This invite has expired",
-                )
+        if db_invite.expires_at and db_invite.expires_at < now:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="This invite has expired",
+            )
 
-            if db_invite.usage_limit and db_invite.used_count >= db_invite.usage_limit:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="This invite has reached its usage limit",
-                )
+        if db_invite.usage_limit and db_invite.used_count >= db_invite.usage_limit:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="This invite has reached its usage limit",
+            )
 
-            # Check if user already redeemed an invite
-            existing_user = (
-                session.query(PlexUserDB).filter_by(email=request.email.lower()).first()
+        # Check if user already redeemed an invite
+        existing_user = session.query(PlexUserDB).filter_by(email=email).first()
+        if existing_user and existing_user.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="This email has already been invited and is currently active",
             )
-            if existing_user and existing_user.is_active:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="This email has already been invited and is currently active",
-                )
 
-            # Get Plex config from settings
-            plex_config = get_plex_config_from_settings()
-            if not plex_config:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Plex server not configured",
-                )
+        session.expunge(db_invite)
+        return db_invite
 
-            # Invite user to Plex
-            success, error = await invite_plex_user(
-                email=str(request.email),
-                plex_config=plex_config,
-                libraries=db_invite.libraries,  # type: ignore
-                allow_sync=db_invite.allow_sync,  # type: ignore
-                allow_camera_upload=db_invite.allow_camera_upload,  # type: ignore
-                allow_channels=db_invite.allow_channels,  # type: ignore
-                plex_home=db_invite.plex_home,  # type: ignore
+    def record_redemption(session, invite_id: int) -> PlexUser:
+        db_invite = session.get(InviteDB, invite_id)
+
+        # If user previously existed but was inactive, reactivate them
+        plex_user = session.query(PlexUserDB).filter_by(email=email).first()
+        if plex_user:
+            logger.info(f"Reactivating previously removed user: {request.email}")
+            plex_user.is_active = True  # type: ignore
+            plex_user.invite_id = invite_id  # type: ignore
+            plex_user.created_at = datetime.now(timezone.utc).replace(tzinfo=None)  # type: ignore
+        else:
+            # Create new user record
+            plex_user = PlexUserDB(
+                email=email,
+                invite_id=invite_id,
+                username=None,  # Will be populated when user accepts invite
+                plex_id=None,  # Will be populated when user accepts invite
+                thumb=None,  # Will be populated when user accepts invite
             )
+            session.add(plex_user)
 
-            if not success:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail=f"Failed to invite user to Plex: {error}",
-                )
+        # Update invite usage
+        db_invite.used_count += 1  # type: ignore
 
-            # If user previously existed but was inactive, reactivate them
-            if existing_user:
-                logger.info(f"Reactivating previously removed user: {request.email}")
-                existing_user.is_active = True  # type: ignore
-                existing_user.invite_id = db_invite.id  # type: ignore
-                existing_user.created_at = datetime.now(timezone.utc).replace(tzinfo=None)  # type: ignore
-                plex_user = existing_user
-            else:
-                # Create new user record
-                plex_user = PlexUserDB(
-                    email=request.email.lower(),
-                    invite_id=db_invite.id,
-                    username=None,  # Will be populated when user accepts invite
-                    plex_id=None,  # Will be populated when user accepts invite
-                    thumb=None,  # Will be populated when user accepts invite
-                )
-                session.add(plex_user)
+        session.commit()
+        session.refresh(plex_user)
+        return db_user_to_pydantic(plex_user)
 
-            # Update invite usage
-            db_invite.used_count += 1  # type: ignore
+    try:
+        db_invite = await db.run_in_session(load_invite)
 
-            session.commit()
-            session.refresh(plex_user)
+        # Get Plex config from settings
+        plex_config = get_plex_config_from_settings()
+        if not plex_config:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Plex server not configured",
+            )
 
-            # Try to fetch user info from Plex (may not be available until user accepts)
-            # This runs in the background and doesn't block the response
-            from app.utils.plex_invite import get_plex_user_info
-            import asyncio
+        # Invite user to Plex
+        success, error = await invite_plex_user(
+            email=str(request.email),
+            plex_config=plex_config,
+            libraries=db_invite.libraries,  # type: ignore
+            allow_sync=db_invite.allow_sync,  # type: ignore
+            allow_camera_upload=db_invite.allow_camera_upload,  # type: ignore
+            allow_channels=db_invite.allow_channels,  # type: ignore
+            plex_home=db_invite.plex_home,  # type: ignore
+        )
 
-            try:
-                # Wait a moment for Plex to process
-                await asyncio.sleep(2)
+        if not success:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to invite user to Plex: {error}",
+            )
 
-                user_info = await get_plex_user_info(
-                    token=plex_config["token"],
-                    email=str(request.email),
-                )
+        plex_user = await db.run_in_session(record_redemption, db_invite.id)
 
-                if user_info:
-                    logger.info(
-                        f"Successfully fetched user info for {request.email}: username={user_info.get('username')}"
-                    )
-                    # Update the user record with the info
-                    session2 = db.get_session()
-                    try:
-                        db_user = (
-                            session2.query(PlexUserDB)
-                            .filter_by(id=plex_user.id)
-                            .first()
-                        )
-                        if db_user:
-                            db_user.username = user_info.get("username")  # type: ignore
-                            db_user.plex_id = user_info.get("id")  # type: ignore
-                            db_user.thumb = user_info.get("thumb")  # type: ignore
-                            session2.commit()
-                            session2.refresh(db_user)
-                            # Update local reference
-                            plex_user = db_user
-                            logger.info(f"Updated user record for {request.email}")
-                    finally:
-                        session2.close()
-                else:
-                    logger.info(
-                        f"User info not yet available for {request.email} - will be populated when they accept the invitation"
-                    )
-            except Exception as e:
-                logger.warning(f"Could not fetch user info immediately: {e}")
+        # Try to fetch user info from Plex (may not be available until user accepts)
+        from app.utils.plex_invite import get_plex_user_info
+        import asyncio
 
-            logger.info(f"User {request.email} redeemed invite {db_invite.code}")
+        try:
+            # Wait a moment for Plex to process
+            await asyncio.sleep(2)
 
-            return {
-                "success": True,
-                "message": f"Successfully invited to Plex! Check {request.email} for the invitation email.",
-                "user": PlexUser(
-                    id=plex_user.id,  # type: ignore
-                    email=plex_user.email,  # type: ignore
-                    username=plex_user.username,  # type: ignore
-                    plex_id=plex_user.plex_id,  # type: ignore
-                    thumb=plex_user.thumb,  # type: ignore
-                    invite_id=plex_user.invite_id,  # type: ignore
-                    created_at=plex_user.created_at,  # type: ignore
-                    last_seen=plex_user.last_seen,  # type: ignore
-                    expires_at=plex_user.expires_at,  # type: ignore
-                    is_active=plex_user.is_active,  # type: ignore
-                ),
-            }
+            user_info = await get_plex_user_info(
+                token=plex_config["token"],
+                email=str(request.email),
+            )
+
+            if user_info:
+                logger.info(
+                    f"Successfully fetched user info for {request.email}: username={user_info.get('username')}"
+                )
+                # Update the user record with the info
+                updated = await db.run_in_session(
+                    apply_plex_user_info, plex_user.id, user_info
+                )
+                if updated:
+                    plex_user = updated
+                    logger.info(f"Updated user record for {request.email}")
+            else:
+                logger.info(
+                    f"User info not yet available for {request.email} - will be populated when they accept the invitation"
+                )
+        except Exception as e:
+            logger.warning(f"Could not fetch user info immediately: {e}")
 
-        finally:
-            session.close()
+        logger.info(f"User {request.email} redeemed invite {db_invite.code}")
+
+        return {
+            "success": True,
+            "message": f"Successfully invited to Plex! Check {request.email} for the invitation email.",
+            "user": plex_user,
+        }
 
     except HTTPException:
         raise
@@ -863,32 +856,31 @@ async def redeem_invite(request: RedeemInviteRequest):
 @router.get("/users", response_model=List[PlexUser])
 async def list_plex_users(username: str = Depends(require_auth)):
     """List all Plex users created via invites"""
-    try:
-        session = db.get_session()
-        try:
-            users = (
-                session.query(PlexUserDB).order_by(PlexUserDB.created_at.desc()).all()
-            )
 
-            users = [
-                PlexUser(
-                    id=u.id,  # type: ignore
-                    email=u.email,  # type: ignore
-                    username=u.username,  # type: ignore
-                    plex_id=u.plex_id,  # type: ignore
-                    thumb=u.thumb,  # type: ignore
-                    invite_id=u.invite_id,  # type: ignore
-                    created_at=u.created_at,  # type: ignore
-                    last_seen=u.last_seen,  # type: ignore
-                    expires_at=u.expires_at,  # type: ignore
-                    is_active=u.is_active,  # type: ignore
-                )
-                for u in users
-            ]
+    def load_users(session):
+        users = (
+            session.query(PlexUserDB).order_by(PlexUserDB.created_at.desc()).all()
+        )
 
-        finally:
-            session.close()
+        users = [
+            PlexUser(
+                id=u.id,  # type: ignore
+                email=u.email,  # type: ignore
+                username=u.username,  # type: ignore
+                plex_id=u.plex_id,  # type: ignore
+                thumb=u.thumb,  # type: ignore
+                invite_id=u.invite_id,  # type: ignore
+                created_at=u.created_at,  # type: ignore
+                last_seen=u.last_seen,  # type: ignore
+                expires_at=u.expires_at,  # type: ignore
+                is_active=u.is_active,  # type: ignore
+            )
+            for u in users
+        ]
+        return users
 
+    try:
+        return await db.run_in_session(load_users)
     except Exception as e:
         logger.error(f"Error listing plex users: {e}", exc_info=True)
         raise HTTPException(
@@ -906,64 +898,48 @@ async def get_tmdb_api_key():
 @router.post("/users/{user_id}/refresh", response_model=PlexUser)
 async def refresh_user_info(user_id: int, username: str = Depends(require_auth)):
     """Refresh user information from Plex (username, plex_id, avatar)"""
-    try:
-        session = db.get_session()
-        try:
-            db_user = session.query(PlexUserDB).filter_by(id=user_id).first()
 
-            if not db_user:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-                )
+    def load_user(session) -> PlexUser:
+        db_user = session.query(PlexUserDB).filter_by(id=user_id).first()
 
-            # Get Plex config
-            plex_config = get_plex_config_from_settings()
-            if not plex_config:
-                raise HTTPException(
-                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                    detail="Plex server not configured",
-                )
+        if not db_user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+            )
+        return db_user_to_pydantic(db_user)
 
-            # Fetch fresh user info from Plex
-            from app.utils.plex_invite import get_plex_user_info
+    try:
+        user = await db.run_in_session(load_user)
 
-            user_info = await get_plex_user_info(
-                token=plex_config["token"],
-                email=str(db_user.email),  # type: ignore
+        # Get Plex config
+        plex_config = get_plex_config_from_settings()
+        if not plex_config:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Plex server not configured",
             )
 
-            if user_info:
-                # Update user info
-                db_user.username = user_info.get("username")  # type: ignore
-                db_user.plex_id = user_info.get("id")  # type: ignore
-                db_user.thumb = user_info.get("thumb")  # type: ignore
+        # Fetch fresh user info from Plex
+        from app.utils.plex_invite import get_plex_user_info
 
-                session.commit()
-                session.refresh(db_user)
+        user_info = await get_plex_user_info(
+            token=plex_config["token"],
+            email=str(user.email),
+        )
 
-                logger.info(
-                    f"Refreshed Plex info for user {db_user.email} by {username}"
-                )
-            else:
-                logger.warning(
-                    f"Could not fetch Plex info for user {db_user.email} - user may not exist on Plex"
-                )
+        if user_info:
+            # Update user info
+            updated = await db.run_in_session(apply_plex_user_info, user_id, user_info)
+            if updated:
+                user = updated
 
-            return PlexUser(
-                id=db_user.id,  # type: ignore
-                email=db_user.email,  # type: ignore
-                username=db_user.username,  # type: ignore
-                plex_id=db_user.plex_id,  # type: ignore
-                thumb=db_user.thumb,  # type: ignore
-                invite_id=db_user.invite_id,  # type: ignore
-                created_at=db_user.created_at,  # type: ignore
-                last_seen=db_user.last_seen,  # type: ignore
-                expires_at=db_user.expires_at,  # type: ignore
-                is_active=db_user.is_active,  # type: ignore
+            logger.info(f"Refreshed Plex info for user {user.email} by {username}")
+        else:
+            logger.warning(
+                f"Could not fetch Plex info for user {user.email} - user may not exist on Plex"
             )
 
-        finally:
-            session.close()
+        return user
 
     except HTTPException:
         raise
@@ -978,69 +954,69 @@ async def refresh_user_info(user_id: int, username: str = Depends(require_auth))
 @router.delete("/users/{user_id}")
 async def delete_user(user_id: int, username: str = Depends(require_auth)):
     """Delete a user from database and remove from Plex server"""
-    try:
-        session = db.get_session()
-        try:
-            db_user = session.query(PlexUserDB).filter_by(id=user_id).first()
 
-            if not db_user:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-                )
+    def load_email(session):
+        db_user = session.query(PlexUserDB).filter_by(id=user_id).first()
 
-            user_email = db_user.email
+        if not db_user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+            )
+        return db_user.email
 
-            # Get Plex config
-            plex_config = get_plex_config_from_settings()
+    def remove_user(session):
+        db_user = session.query(PlexUserDB).filter_by(id=user_id).first()
+        if not db_user:
+            return
 
-            # Remove user from Plex server
-            if plex_config and user_email:
-                from app.utils.plex_invite import remove_plex_user
+        # Delete user from database
+        invite_id = db_user.invite_id
+        session.delete(db_user)
+        session.commit()
 
-                success, error = await remove_plex_user(
-                    token=plex_config["token"], email=str(user_email)
-                )
+        logger.info(f"Deleted user {user_email} by {username}")
 
-                if success:
-                    logger.info(f"Removed {user_email} from Plex server")
-                else:
-                    logger.warning(f"Failed to remove {user_email} from Plex: {error}")
-                    # Continue with database deletion even if Plex removal fails
+        # Check if this was the last user for this invite
+        # If so, automatically delete the invite as well
+        if invite_id:
+            remaining_users = (
+                session.query(PlexUserDB).filter_by(invite_id=invite_id).count()
+            )
+            if remaining_users == 0:
+                # No more users for this invite, delete it
+                invite = session.query(InviteDB).filter_by(id=invite_id).first()
+                if invite:
+                    invite_code = invite.code
+                    session.delete(invite)
+                    session.commit()
+                    logger.info(
+                        f"Auto-deleted invite {invite_code} (no remaining users)"
+                    )
 
-            # Delete user from database
-            invite_id = db_user.invite_id
-            session.delete(db_user)
-            session.commit()
+    try:
+        user_email = await db.run_in_session(load_email)
 
-            logger.info(f"Deleted user {user_email} by {username}")
+        # Get Plex config
+        plex_config = get_plex_config_from_settings()
 
-            # Check if this was the last user for this invite
-            # If so, automatically delete the invite as well
-            if invite_id:
-                remaining_users = (
-                    session.query(PlexUserDB).filter_by(invite_id=invite_id).count()
-                )
-                if remaining_users == 0:
-                    # No more users for this invite, delete it
-                    invite = session.query(InviteDB).filter_by(id=invite_id).first()
-                    if invite:
-                        invite_code = invite.code
-                        session.delete(invite)
-                        session.commit()
-                        logger.info(
-                            f"Auto-deleted invite {invite_code} (no remaining users)"
-                        )
+        # Remove user from Plex server
+        if plex_config and user_email:
+            success, error = await remove_plex_user(
+                token=plex_config["token"], email=str(user_email)
+            )
 
-            return {
-                "success": True,
-                "message": f"User {user_email} removed from Plex and database",
-            }
+            if success:
+                logger.info(f"Removed {user_email} from Plex server")
+            else:
+                logger.warning(f"Failed to remove {user_email} from Plex: {error}")
+                # Continue with database deletion even if Plex removal fails
 
-        except Exception as e:
-            session.rollback()
-            raise
-        finally:
-            session.close()
+        await db.run_in_session(remove_user)
+
+        return {
+            "success": True,
+            "message": f"User {user_email} removed from Plex and database",
+        }
 
     except HTTPException:
         raise
@@ -1057,45 +1033,43 @@ async def update_user_expiration(
     user_id: int, expiration_data: dict, username: str = Depends(require_auth)
 ):
     """Update a user's expiration date"""
-    try:
-        session = db.get_session()
-        try:
-            db_user = session.query(PlexUserDB).filter_by(id=user_id).first()
-
-            if not db_user:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
-                )
 
-            # Update expiration date
-            expires_at_str = expiration_data.get("expires_at")
-            if expires_at_str:
-                # Parse ISO datetime string
-                db_user.expires_at = datetime.fromisoformat(expires_at_str.replace("Z", "+00:00")).replace(tzinfo=None)  # type: ignore
-            else:
-                db_user.expires_at = None  # type: ignore
+    def apply_expiration(session):
+        db_user = session.query(PlexUserDB).filter_by(id=user_id).first()
 
-            session.commit()
-            session.refresh(db_user)
-
-            logger.info(f"Updated expiration for user {db_user.email} by {username}")
-
-            return PlexUser(
-                id=db_user.id,  # type: ignore
-                email=db_user.email,  # type: ignore
-                username=db_user.username,  # type: ignore
-                plex_id=db_user.plex_id,  # type: ignore
-                thumb=db_user.thumb,  # type: ignore
-                invite_id=db_user.invite_id,  # type: ignore
-                created_at=db_user.created_at,  # type: ignore
-                last_seen=db_user.last_seen,  # type: ignore
-                expires_at=db_user.expires_at,  # type: ignore
-                is_active=db_user.is_active,  # type: ignore
+        if not db_user:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
             )
 
-        finally:
-            session.close()
+        # Update expiration date
+        expires_at_str = expiration_data.get("expires_at")
+        if expires_at_str:
+            # Parse ISO datetime string
+            db_user.expires_at = datetime.fromisoformat(expires_at_str.replace("Z", "+00:00")).replace(tzinfo=None)  # type: ignore
+        else:
+            db_user.expires_at = None  # type: ignore
+
+        session.commit()
+        session.refresh(db_user)
+
+        logger.info(f"Updated expiration for user {db_user.email} by {username}")
+
+        return PlexUser(
+            id=db_user.id,  # type: ignore
+            email=db_user.email,  # type: ignore
+            username=db_user.username,  # type: ignore
+            plex_id=db_user.plex_id,  # type: ignore
+            thumb=db_user.thumb,  # type: ignore
+            invite_id=db_user.invite_id,  # type: ignore
+            created_at=db_user.created_at,  # type: ignore
+            last_seen=db_user.last_seen,  # type: ignore
+            expires_at=db_user.expires_at,  # type: ignore
+            is_active=db_user.is_active,  # type: ignore
+        )
 
+    try:
+        return await db.run_in_session(apply_expiration)
     except HTTPException:
         raise
     except Exception as e:
@@ -1108,102 +1082,99 @@ async def update_user_expiration(
 
 async def check_expired_invites():
     """Background task to check for expired user accounts and remove them from Plex"""
-    try:
-        session = db.get_session()
+
+    def find_users(session):
         now = datetime.now(timezone.utc).replace(tzinfo=None)
 
-        try:
-            # First, try to update user info for users missing username/plex_id/thumb
-            users_missing_info = (
-                session.query(PlexUserDB)
-                .filter(
-                    PlexUserDB.is_active == True,
-                    (PlexUserDB.username.is_(None) | PlexUserDB.thumb.is_(None)),
-                )
-                .all()
+        # Users missing username/plex_id/thumb
+        missing_info = (
+            session.query(PlexUserDB.id, PlexUserDB.email)
+            .filter(
+                PlexUserDB.is_active == True,
+                (PlexUserDB.username.is_(None) | PlexUserDB.thumb.is_(None)),
             )
+            .all()
+        )
+        # Expired user accounts
+        expired = (
+            session.query(PlexUserDB.id, PlexUserDB.email)
+            .filter(
+                PlexUserDB.expires_at.isnot(None),
+                PlexUserDB.expires_at < now,
+                PlexUserDB.is_active == True,
+            )
+            .all()
+        )
+        return missing_info, expired
 
-            if users_missing_info:
-                logger.info(
-                    f"Found {len(users_missing_info)} users with missing info, attempting to update"
-                )
-                plex_config = get_plex_config_from_settings()
-
-                if plex_config:
-                    from app.utils.plex_invite import get_plex_user_info
+    def delete_users(session, user_ids: List[int]):
+        session.query(PlexUserDB).filter(PlexUserDB.id.in_(user_ids)).delete(
+            synchronize_session=False
+        )
 
-                    for user in users_missing_info:
-                        try:
-                            user_info = await get_plex_user_info(
-                                token=plex_config["token"],
-                                email=str(user.email),  # type: ignore
-                            )
+    try:
+        users_missing_info, expired_users = await db.run_in_session(find_users)
 
-                            if user_info:
-                                user.username = user_info.get("username")  # type: ignore
-                                user.plex_id = user_info.get("id")  # type: ignore
-                                user.thumb = user_info.get("thumb")  # type: ignore
-                                logger.info(
-                                    f"Updated info for user {user.email}: username={user_info.get('username')}"
-                                )
-                        except Exception as e:
-                            logger.debug(f"Could not update info for {user.email}: {e}")
-
-            # Get all expired user accounts
-            expired_users = (
-                session.query(PlexUserDB)
-                .filter(
-                    PlexUserDB.expires_at.isnot(None),
-                    PlexUserDB.expires_at < now,
-                    PlexUserDB.is_active == True,
-                )
-                .all()
+        # First, try to update user info for users missing username/plex_id/thumb
+        if users_missing_info:
+            logger.info(
+                f"Found {len(users_missing_info)} users with missing info, attempting to update"
             )
+            plex_config = get_plex_config_from_settings()
 
-            if expired_users:
-                logger.info(f"Found {len(expired_users)} expired user accounts")
+            if plex_config:
+                from app.utils.plex_invite import get_plex_user_info
 
-                # Get Plex config
-                plex_config = get_plex_config_from_settings()
+                for user_id, email in users_missing_info:
+                    try:
+                        user_info = await get_plex_user_info(
+                            token=plex_config["token"],
+                            email=str(email),
+                        )
 
-                if plex_config:
-                    for user in expired_users:
-                        try:
-                            # Remove user from Plex
-                            user_email = str(user.email)  # type: ignore
-                            success, error_msg = await remove_plex_user(
-                                plex_config["token"], user_email
+                        if user_info:
+                            await db.run_in_session(
+                                apply_plex_user_info, user_id, user_info
                             )
-
-                            if success:
-                                logger.info(
-                                    f"Removed expired user {user_email} from Plex"
-                                )
-                                # Delete the user record
-                                session.delete(user)
-                            else:
-                                logger.warning(
-                                    f"Failed to remove expired user {user_email} from Plex: {error_msg}"
-                                )
-                        except Exception as e:
-                            logger.error(
-                                f"Error removing expired user {user.email}: {e}"
+                            logger.info(
+                                f"Updated info for user {email}: username={user_info.get('username')}"
                             )
-                else:
-                    logger.warning(
-                        "Plex config not available, cannot remove expired users"
-                    )
+                    except Exception as e:
+                        logger.debug(f"Could not update info for {email}: {e}")
 
-            session.commit()
+        if expired_users:
+            logger.info(f"Found {len(expired_users)} expired user accounts")
+
+            # Get Plex config
+            plex_config = get_plex_config_from_settings()
 
-            if expired_users:
-                logger.info(f"Processed {len(expired_users)} expired user accounts")
+            if plex_config:
+                removed: List[int] = []
+                for user_id, email in expired_users:
+                    try:
+                        # Remove user from Plex
+                        user_email = str(email)
+                        success, error_msg = await remove_plex_user(
+                            plex_config["token"], user_email
+                        )
 
-        except Exception as e:
-            session.rollback()
-            logger.error(f"Error checking expired user accounts: {e}", exc_info=True)
-        finally:
-            session.close()
+                        if success:
+                            logger.info(f"Removed expired user {user_email} from Plex")
+                            removed.append(user_id)
+                        else:
+                            logger.warning(
+                                f"Failed to remove expired user {user_email} from Plex: {error_msg}"
+                            )
+                    except Exception as e:
+                        logger.error(f"Error removing expired user {email}: {e}")
+
+                # Delete the user records
+                if removed:
+                    await db_writer.submit(delete_users, removed)
+            else:
+                logger.warning("Plex config not available, cannot remove expired users")
+
+            logger.info(f"Processed {len(expired_users)} expired user accounts")
 
     except Exception as e:
         logger.error(f"Error in check_expired_invites: {e}", exc_info=True)
@@ -209,8 +209,7 @@ async def redeem_with_plex_oauth(request: PlexRedeemRequest):
         f"=== OAUTH REDEEM CALLED === Email: {request.email}, Invite: {request.invite_code}"
     )
 
-    session = db.get_session()
-    try:
+    def load_invite(session):
         # Validate invite
         invite = (
             session.query(InviteDB)
@@ -249,6 +248,41 @@ async def redeem_with_plex_oauth(request: PlexRedeemRequest):
                 detail="You have already redeemed this invite",
             )
 
+        # Detached once the session closes; only its loaded columns are read
+        return invite
+
+    def record_redemption(session, invite_id: int):
+        existing_user = (
+            session.query(PlexUserDB).filter(PlexUserDB.email == request.email).first()
+        )
+        if existing_user:
+            # Update existing user record with new invite
+            existing_user.invite_id = invite_id  # type: ignore
+            existing_user.username = request.username  # type: ignore
+            existing_user.plex_id = request.plex_id  # type: ignore
+            existing_user.is_active = True  # type: ignore
+            user_record = existing_user
+        else:
+            # Create new user record
+            user_record = PlexUserDB(
+                invite_id=invite_id,
+                email=request.email,
+                username=request.username,
+                plex_id=request.plex_id,
+            )
+            session.add(user_record)
+
+        # Update invite usage
+        invite = session.get(InviteDB, invite_id)
+        invite.used_count += 1  # type: ignore
+
+        session.commit()
+        session.refresh(user_record)
+        return user_record.created_at
+
+    try:
+        invite = await db.run_in_session(load_invite)
+
         # ALWAYS invite/update the user in Plex, even if they exist in our database
         # This ensures library access is updated if they're redeeming a different invite
         from app.utils.plex_invite import invite_plex_user_oauth
@@ -288,28 +322,7 @@ async def redeem_with_plex_oauth(request: PlexRedeemRequest):
                     detail=error_msg or "Failed to add user to Plex server",
                 )
 
-        if existing_user:
-            # Update existing user record with new invite
-            existing_user.invite_id = invite.id  # type: ignore
-            existing_user.username = request.username  # type: ignore
-            existing_user.plex_id = request.plex_id  # type: ignore
-            existing_user.is_active = True  # type: ignore
-            user_record = existing_user
-        else:
-            # Create new user record
-            user_record = PlexUserDB(
-                invite_id=invite.id,
-                email=request.email,
-                username=request.username,
-                plex_id=request.plex_id,
-            )
-            session.add(user_record)
-
-        # Update invite usage
-        invite.used_count += 1  # type: ignore
-
-        session.commit()
-        session.refresh(user_record)
+        created_at = await db.run_in_session(record_redemption, invite.id)
 
         logger.info(
             f"User {request.email} redeemed invite {request.invite_code} via OAuth"
@@ -321,7 +334,7 @@ async def redeem_with_plex_oauth(request: PlexRedeemRequest):
             "user": {
                 "email": request.email,
                 "username": request.username,
-                "created_at": user_record.created_at.isoformat(),
+                "created_at": created_at.isoformat(),
             },
         }
 
@@ -329,10 +342,7 @@ async def redeem_with_plex_oauth(request: PlexRedeemRequest):
         raise
     except Exception as e:
         logger.error(f"Redeem error: {e}")
-        session.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to redeem invite: {str(e)}",
         )
-    finally:
-        session.close()
@@ -1,16 +1,17 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Query, status
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, HttpUrl
 import httpx
 import json
 import shutil
 from pathlib import Path
-from typing import Optional, cast, Dict, Any
+from typing import Optional, cast, Dict, Any, List
 from datetime import datetime, timezone, timedelta
 
 from app.utils.logger import logger
-from app.database import db, PlexStatsDB
+from app.database import db, PlexStatsDB, WatchHistoryDB
 from app.services.redis_cache import cache_get, cache_set, cache_delete
+from app.services.watch_history_search import load_ordered, search_ids
 
 router = APIRouter(prefix="/api/plex", tags=["plex"])
 
@@ -764,6 +765,20 @@ async def get_plex_activities():
         return {"error": True, "message": str(e), "activities": []}
 
 
+def _load_peak_stats(session) -> tuple[int, Optional[datetime]]:
+    """Peak concurrent count and when it was set, creating the stats record"""
+    stats = session.query(PlexStatsDB).first()
+
+    if not stats:
+        # Create initial stats record
+        stats = PlexStatsDB(peak_concurrent=0, last_updated=None)
+        session.add(stats)
+        session.commit()
+        session.refresh(stats)
+
+    return stats.peak_concurrent, stats.last_updated
+
+
 @router.get("/stats", response_model=PlexStats)
 async def get_plex_stats():
     """Get Plex statistics including peak concurrent activities"""
@@ -776,56 +791,45 @@ async def get_plex_stats():
         if cached:
             return cached
 
-        session = db.get_session()
-        try:
-            # Get the first (and only) stats record
-            stats = session.query(PlexStatsDB).first()
+        # Get the first (and only) stats record
+        peak_concurrent, last_updated = await db.run_in_session(_load_peak_stats)
 
-            if not stats:
-                # Create initial stats record
-                stats = PlexStatsDB(peak_concurrent=0, last_updated=None)
-                session.add(stats)
-                session.commit()
-                session.refresh(stats)
-
-            # Fetch live statistics from Plex
-            total_users = 0
-            total_movies = 0
-            total_tv_shows = 0
-
-            if plex_config and plex_config.get("url") and plex_config.get("token"):
-                try:
-                    total_users, total_movies, total_tv_shows = (
-                        await fetch_plex_statistics(
-                            plex_config["url"], plex_config["token"]
-                        )
+        # Fetch live statistics from Plex
+        total_users = 0
+        total_movies = 0
+        total_tv_shows = 0
+
+        if plex_config and plex_config.get("url") and plex_config.get("token"):
+            try:
+                total_users, total_movies, total_tv_shows = (
+                    await fetch_plex_statistics(
+                        plex_config["url"], plex_config["token"]
                     )
-                except Exception as e:
-                    logger.warning(f"Failed to fetch live Plex stats: {e}")
-
-            response = PlexStats(
-                peak_concurrent=stats.peak_concurrent,  # type: ignore
-                last_updated=stats.last_updated.isoformat() if stats.last_updated else None,  # type: ignore
-                server_url=plex_config.get("url", "") if plex_config else "",
-                server_name=(
-                    plex_config.get("server_name", "Plex Server")
-                    if plex_config
-                    else "Plex Server"
-                ),
-                token_configured=bool(
-                    plex_config and plex_config.get("url") and plex_config.get("token")
-                ),
-                total_users=total_users,
-                total_movies=total_movies,
-                total_tv_shows=total_tv_shows,
-            )
+                )
+            except Exception as e:
+                logger.warning(f"Failed to fetch live Plex stats: {e}")
+
+        response = PlexStats(
+            peak_concurrent=peak_concurrent,
+            last_updated=last_updated.isoformat() if last_updated else None,
+            server_url=plex_config.get("url", "") if plex_config else "",
+            server_name=(
+                plex_config.get("server_name", "Plex Server")
+                if plex_config
+                else "Plex Server"
+            ),
+            token_configured=bool(
+                plex_config and plex_config.get("url") and plex_config.get("token")
+            ),
+            total_users=total_users,
+            total_movies=total_movies,
+            total_tv_shows=total_tv_shows,
+        )
 
-            # Cache as dict for serialization safety
-            cache_set("plex:stats", response.dict(), ttl_seconds=60)
+        # Cache as dict for serialization safety
+        cache_set("plex:stats", response.dict(), ttl_seconds=60)
 
-            return response
-        finally:
-            session.close()
+        return response
     except Exception as e:
         logger.error(f"Error getting Plex stats: {e}")
         raise HTTPException(
@@ -891,34 +895,34 @@ async def get_live_plex_stats():
 @router.post("/stats/peak")
 async def update_peak_concurrent(request: UpdatePeakRequest):
     """Update peak concurrent activities count"""
-    try:
-        session = db.get_session()
-        try:
-            # Get or create stats record
-            stats = session.query(PlexStatsDB).first()
 
-            if not stats:
-                stats = PlexStatsDB(
-                    peak_concurrent=request.peak_concurrent,
-                    last_updated=datetime.now(timezone.utc).replace(tzinfo=None),
-                )
-                session.add(stats)
-            else:
-                # Only update if new value is higher
-                if request.peak_concurrent > stats.peak_concurrent:  # type: ignore
-                    stats.peak_concurrent = request.peak_concurrent  # type: ignore
-                    stats.last_updated = datetime.now(timezone.utc).replace(tzinfo=None)  # type: ignore
+    def update_peak(session):
+        # Get or create stats record
+        stats = session.query(PlexStatsDB).first()
 
-            session.commit()
-            session.refresh(stats)
+        if not stats:
+            stats = PlexStatsDB(
+                peak_concurrent=request.peak_concurrent,
+                last_updated=datetime.now(timezone.utc).replace(tzinfo=None),
+            )
+            session.add(stats)
+        else:
+            # Only update if new value is higher
+            if request.peak_concurrent > stats.peak_concurrent:  # type: ignore
+                stats.peak_concurrent = request.peak_concurrent  # type: ignore
+                stats.last_updated = datetime.now(timezone.utc).replace(tzinfo=None)  # type: ignore
 
-            return {
-                "success": True,
-                "peak_concurrent": stats.peak_concurrent,  # type: ignore
-                "last_updated": stats.last_updated.isoformat() if stats.last_updated else None,  # type: ignore
-            }
-        finally:
-            session.close()
+        session.commit()
+        session.refresh(stats)
+
+        return {
+            "success": True,
+            "peak_concurrent": stats.peak_concurrent,  # type: ignore
+            "last_updated": stats.last_updated.isoformat() if stats.last_updated else None,  # type: ignore
+        }
+
+    try:
+        return await db.run_in_session(update_peak)
     except Exception as e:
         logger.error(f"Error updating peak concurrent: {e}")
         raise HTTPException(
@@ -930,24 +934,24 @@ async def update_peak_concurrent(request: UpdatePeakRequest):
 @router.post("/stats/reset")
 async def reset_peak_concurrent():
     """Reset peak concurrent activities count to 0"""
-    try:
-        session = db.get_session()
-        try:
-            stats = session.query(PlexStatsDB).first()
 
-            if stats:
-                stats.peak_concurrent = 0  # type: ignore
-                stats.last_updated = datetime.now(timezone.utc).replace(tzinfo=None)  # type: ignore
-                session.commit()
-                session.refresh(stats)
+    def reset_peak(session):
+        stats = session.query(PlexStatsDB).first()
 
-            return {
-                "success": True,
-                "peak_concurrent": 0,
-                "last_updated": stats.last_updated.isoformat() if stats else None,  # type: ignore
-            }
-        finally:
-            session.close()
+        if stats:
+            stats.peak_concurrent = 0  # type: ignore
+            stats.last_updated = datetime.now(timezone.utc).replace(tzinfo=None)  # type: ignore
+            session.commit()
+            session.refresh(stats)
+
+        return {
+            "success": True,
+            "peak_concurrent": 0,
+            "last_updated": stats.last_updated.isoformat() if stats else None,  # type: ignore
+        }
+
+    try:
+        return await db.run_in_session(reset_peak)
     except Exception as e:
         logger.error(f"Error resetting peak concurrent: {e}")
         raise HTTPException(
@@ -1059,16 +1063,14 @@ async def proxy_plex_image(url: str):
     """
     try:
         # Get Plex config to verify SSL settings
-        session = db.get_session()
-        try:
-            config = session.query(PlexStatsDB).first()
-            if not config:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Plex server not configured",
-                )
-        finally:
-            session.close()
+        configured = await db.run_in_session(
+            lambda session: session.query(PlexStatsDB.id).first() is not None
+        )
+        if not configured:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Plex server not configured",
+            )
 
         # Fetch image from Plex server with SSL verification disabled
         async with httpx.AsyncClient(
@@ -1364,11 +1366,70 @@ async def get_plex_sessions():
         return {"error": True, "message": str(e), "sessions": []}
 
 
+def _load_watch_history(session) -> List[Dict[str, Any]]:
+    """Read the newest watch history rows as API dicts (runs on a DB thread)"""
+    # Query all watch history from database
+    history_items = (
+        session.query(WatchHistoryDB)
+        .order_by(WatchHistoryDB.viewed_at.desc())
+        .limit(500)  # Limit to last 500 items
+        .all()
+    )
+
+    return [_watch_history_item(item) for item in history_items]
+
+
+def _watch_history_item(item: WatchHistoryDB) -> Dict[str, Any]:
+    """Convert a watch history row to its API dict"""
+    # Parse genres back to list
+    genres = []
+    if item.genres:
+        genres = item.genres.split(",")
+
+    # Get progress value and ensure it's a float for type checking
+    progress_value = 0.0
+    if item.progress is not None:
+        progress_value = float(cast(float, item.progress))
+
+    # Convert direct Plex thumbnail URL to proxy URL to avoid SSL issues
+    thumb_url = None
+    if item.thumb:
+        # Ensure thumb is a string value, not a Column object
+        thumb_value = str(item.thumb) if item.thumb else None
+        # If it's already a full URL with the Plex server, proxy it
+        if thumb_value and thumb_value.startswith("http"):
+            from urllib.parse import quote
+
+            thumb_url = f"/api/plex/proxy/image?url={quote(thumb_value)}"
+        else:
+            thumb_url = thumb_value
+
+    return {
+        "user_id": item.user_id,
+        "email": item.username or item.email,  # Use username as display name
+        "type": item.type,
+        "title": item.title,
+        "grandparent_title": item.grandparent_title,
+        "parent_index": item.parent_index,
+        "index": item.index,
+        "viewed_at": item.viewed_at.isoformat() if item.viewed_at else None,
+        "duration": item.duration,  # already in seconds
+        "view_offset": item.view_offset,  # already in seconds
+        "progress": round(progress_value, 2),
+        "view_count": item.view_count,
+        "rating": item.rating,
+        "year": item.year,
+        "thumb": thumb_url,
+        "content_rating": item.content_rating,
+        "studio": item.studio,
+        "summary": item.summary,
+        "genres": genres,
+    }
+
+
 @router.get("/watch-history")
 async def get_watch_history():
     """Get watch history from database (fast) with caching - synced by background task"""
-    from app.database import db, WatchHistoryDB
-
     # Check Redis cache first
     now = datetime.now()
     redis_cached = cache_get("plex:watch_history")
@@ -1394,85 +1455,20 @@ async def get_watch_history():
     logger.info("Fetching watch history from database")
 
     try:
-        session = db.get_session()
-        try:
-            # Query all watch history from database
-            history_items = (
-                session.query(WatchHistoryDB)
-                .order_by(WatchHistoryDB.viewed_at.desc())
-                .limit(500)  # Limit to last 500 items
-                .all()
-            )
+        watch_history = await db.run_in_session(_load_watch_history)
 
-            watch_history = []
-            for item in history_items:
-                # Parse genres back to list
-                genres = []
-                if item.genres:
-                    genres = item.genres.split(",")
-
-                # Get progress value and ensure it's a float for type checking
-                progress_value = 0.0
-                if item.progress is not None:
-                    progress_value = float(cast(float, item.progress))
-
-                # Convert direct Plex thumbnail URL to proxy URL to avoid SSL issues
-                thumb_url = None
-                if item.thumb:
-                    # Ensure thumb is a string value, not a Column object
-                    thumb_value = str(item.thumb) if item.thumb else None
-                    # If it's already a full URL with the Plex server, proxy it
-                    if thumb_value and thumb_value.startswith("http"):
-                        from urllib.parse import quote
-
-                        thumb_url = f"/api/plex/proxy/image?url={quote(thumb_value)}"
-                    else:
-                        thumb_url = thumb_value
-
-                watch_history.append(
-                    {
-                        "user_id": item.user_id,
-                        "email": item.username
-                        or item.email,  # Use username as display name
-                        "type": item.type,
-                        "title": item.title,
-                        "grandparent_title": item.grandparent_title,
-                        "parent_index": item.parent_index,
-                        "index": item.index,
-                        "viewed_at": (
-                            item.viewed_at.isoformat() if item.viewed_at else None
-                        ),
-                        "duration": item.duration,  # already in seconds
-                        "view_offset": item.view_offset,  # already in seconds
-                        "progress": round(progress_value, 2),
-                        "view_count": item.view_count,
-                        "rating": item.rating,
-                        "year": item.year,
-                        "thumb": thumb_url,
-                        "content_rating": item.content_rating,
-                        "studio": item.studio,
-                        "summary": item.summary,
-                        "genres": genres,
-                    }
-                )
+        logger.info(f"Returned {len(watch_history)} watch history items from database")
 
-            logger.info(
-                f"Returned {len(watch_history)} watch history items from database"
-            )
-
-            # Update caches
-            _watch_history_cache["data"] = watch_history
-            _watch_history_cache["last_fetched"] = now
-            cache_set(
-                "plex:watch_history",
-                watch_history,
-                ttl_seconds=_watch_history_cache["ttl_seconds"],
-            )
-
-            return watch_history
+        # Update caches
+        _watch_history_cache["data"] = watch_history
+        _watch_history_cache["last_fetched"] = now
+        cache_set(
+            "plex:watch_history",
+            watch_history,
+            ttl_seconds=_watch_history_cache["ttl_seconds"],
+        )
 
-        finally:
-            session.close()
+        return watch_history
 
     except Exception as e:
         logger.error(f"Error fetching watch history from database: {e}")
@@ -1483,6 +1479,41 @@ async def get_watch_history():
         return []
 
 
+def _search_watch_history(
+    session, query: str, limit: int, offset: int
+) -> Dict[str, Any]:
+    """One page of watch history search results (runs on a DB thread)"""
+    ids, total = search_ids(session, query, limit, offset)
+    return {
+        "query": query,
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "items": [_watch_history_item(item) for item in load_ordered(session, ids)],
+    }
+
+
+@router.get("/watch-history/search")
+async def search_watch_history(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+):
+    """Search watch history by title, series, user, studio or genre.
+
+    Every word matches as a prefix ("break bad" finds Breaking Bad). Results
+    are ranked by relevance, then by most recent view.
+    """
+    try:
+        return await db.run_in_session(_search_watch_history, q, limit, offset)
+    except Exception as e:
+        logger.error(f"Error searching watch history: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to search watch history",
+        )
+
+
 @router.post("/watch-history/sync")
 async def sync_watch_history_now():
     """Manually trigger watch history sync (admin only)"""
@@ -1,6 +1,18 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
-from app.models.service import Service, ServiceCreate, ServiceUpdate
+from fastapi import APIRouter, HTTPException, Query
+from datetime import datetime
+from typing import List, Literal, Optional
+from app.models.service import (
+    HistoryRange,
+    HistorySeries,
+    Service,
+    ServiceCreate,
+    ServiceUpdate,
+)
+from app.services.history_query import (
+    DEFAULT_MAX_POINTS,
+    MAX_POINTS_LIMIT,
+    resolve_range,
+)
 from app.services.monitor import monitor
 from app.utils.logger import logger
 import uuid
@@ -19,12 +31,42 @@ async def get_services():
             # Keep the traffic data but clear current metrics to hide from UI
             # This preserves historical totals in the database
             service.traffic = None
-            service.traffic_history = []
+            service.traffic_history.clear()
 
     logger.debug(f"Returning {len(services)} services")
     return services
 
 
+@router.get("/monitor/stats")
+async def get_monitor_stats():
+    """Get monitor metrics: scheduler/executor queues, last flush, pruning,
+    rollups, database writer queue, database size/checkpoint state and
+    time-series segment files"""
+    from app.database import db
+    from app.services.db_maintenance import db_maintenance
+    from app.services.db_writer import db_writer
+    from app.services.persistence import persistence
+    from app.services.retention import history_retention
+    from app.services.rollups import history_rollups
+    from app.services.tsdb import tsdb
+
+    return {
+        **monitor.get_stats(),
+        "persistence": {
+            "pending": persistence.pending,
+            "last_flush": persistence.last_flush,
+        },
+        "retention": history_retention.last_run,
+        "rollups": history_rollups.last_run,
+        "database": {
+            **db.get_stats(),
+            "last_maintenance": db_maintenance.last_run,
+            "writer": db_writer.get_stats(),
+            "tsdb": await db.run(tsdb.get_stats),
+        },
+    }
+
+
 @router.get("/{service_id}", response_model=Service)
 async def get_service(service_id: str):
     """Get a specific service by ID"""
@@ -35,11 +77,39 @@ async def get_service(service_id: str):
     return service
 
 
+@router.get("/{service_id}/rollups/{series}", response_model=HistoryRange)
+async def get_history_rollups(
+    service_id: str,
+    series: HistorySeries,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    max_points: int = Query(DEFAULT_MAX_POINTS, ge=3, le=MAX_POINTS_LIMIT),
+    resolution: Optional[Literal["raw", "1m", "15m", "1h"]] = None,
+):
+    """Get a service's history for a time range (default: the last 24 hours)
+    from raw history or the cheapest rollup tier that covers it"""
+    from app.database import db
+    from app.services.rollups import history_rollups
+
+    if not monitor.get_service(service_id):
+        logger.warning(f"Service not found: {service_id}")
+        raise HTTPException(status_code=404, detail="Service not found")
+
+    try:
+        start, end = resolve_range(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return await db.run(
+        history_rollups.query, service_id, series, start, end, max_points, resolution
+    )
+
+
 @router.post("/", response_model=Service, status_code=201)
 async def create_service(service_data: ServiceCreate):
     """Create a new service to monitor"""
     service = Service(id=str(uuid.uuid4()), **service_data.model_dump())
-    monitor.add_service(service)
+    await monitor.add_service(service)
 
     # Perform initial check
     await monitor.check_service(service)
@@ -65,7 +135,8 @@ async def update_service(service_id: str, service_data: ServiceUpdate):
     await monitor.check_service(service)
 
     # Save changes to database
-    monitor._save_service(service)
+    await monitor._save_service(service)
+    monitor.reschedule(service)
 
     logger.info(f"Updated service: {service.name}")
     return service
@@ -79,7 +150,7 @@ async def delete_service(service_id: str):
         logger.warning(f"Service not found: {service_id}")
         raise HTTPException(status_code=404, detail="Service not found")
 
-    monitor.remove_service(service_id)
+    await monitor.remove_service(service_id)
     logger.info(f"Deleted service: {service.name}")
     return None
 
@@ -93,7 +164,7 @@ async def check_service(service_id: str):
         raise HTTPException(status_code=404, detail="Service not found")
 
     await monitor.check_service(service)
-    monitor._save_service(service)  # Save the updated status and last_check
+    await monitor._save_service(service)  # Save the updated status and last_check
     logger.info(f"Manually checked service: {service.name}")
     return service
 
@@ -1,7 +1,22 @@
-from fastapi import APIRouter, HTTPException
-from typing import List
-from app.models.storage import StorageUpdate, StorageDataPoint
+from fastapi import APIRouter, HTTPException, Query
+from typing import List, Optional
+from app.models.service import Service
+from app.models.storage import (
+    StorageBatch,
+    StorageDataPoint,
+    StorageMetrics,
+    StorageUpdate,
+)
+from app.database import db
+from app.services.history_query import (
+    DEFAULT_MAX_POINTS,
+    MAX_POINTS_LIMIT,
+    query_history,
+    resolve_range,
+)
+from app.services.ingest import ingest_history, normalize_timestamps
 from app.services.monitor import monitor
+from app.services.persistence import persistence
 from app.utils.logger import logger
 from datetime import datetime, timezone
 
@@ -18,94 +33,108 @@ async def update_storage(storage_data: StorageUpdate):
         )
         raise HTTPException(status_code=404, detail="Service not found")
 
-    # Update current storage metrics
-    if service.storage is None:
-        from app.models.storage import StorageMetrics
-
-        service.storage = StorageMetrics(
-            hostname=storage_data.hostname,
-            storage_paths=[],
-            raid_arrays=[],
-            zfs_pools=[],
-            disks=[],
-        )
-
-    service.storage.hostname = storage_data.hostname
-    service.storage.storage_paths = storage_data.storage_paths
-    service.storage.raid_arrays = storage_data.raid_arrays
-    service.storage.zfs_pools = storage_data.zfs_pools
-    service.storage.disks = storage_data.disks
-    service.storage.last_updated = datetime.now(timezone.utc)
-
-    # Calculate aggregated metrics for history
-    total_capacity = sum(path.total for path in storage_data.storage_paths)
-    total_used = sum(path.used for path in storage_data.storage_paths)
-    total_free = sum(path.free for path in storage_data.storage_paths)
-    average_usage = (
-        sum(path.percent for path in storage_data.storage_paths)
-        / len(storage_data.storage_paths)
-        if storage_data.storage_paths
-        else 0
-    )
-
-    # Count RAID array statuses (mdadm + ZFS pools)
-    raid_healthy = sum(
-        1 for raid in storage_data.raid_arrays if raid.status == "healthy"
-    ) + sum(1 for pool in storage_data.zfs_pools if pool.status == "healthy")
-
-    raid_degraded = sum(
-        1 for raid in storage_data.raid_arrays if raid.status == "degraded"
-    ) + sum(1 for pool in storage_data.zfs_pools if pool.status == "degraded")
-
-    raid_failed = sum(
-        1
-        for raid in storage_data.raid_arrays
-        if raid.status not in ["healthy", "degraded", "recovering"]
-    ) + sum(
-        1
-        for pool in storage_data.zfs_pools
-        if pool.status not in ["healthy", "degraded", "recovering"]
-    )
+    now = datetime.now(timezone.utc)
+    _apply_storage(service, storage_data, now)
 
     # Add to history
-    data_point = StorageDataPoint(
-        timestamp=datetime.now(timezone.utc),
-        hostname=storage_data.hostname,
-        total_capacity=round(total_capacity, 2),
-        total_used=round(total_used, 2),
-        total_free=round(total_free, 2),
-        average_usage_percent=round(average_usage, 2),
-        raid_healthy=raid_healthy,
-        raid_degraded=raid_degraded,
-        raid_failed=raid_failed,
-    )
+    data_point = _storage_point(storage_data, now)
     service.storage_history.append(data_point)
 
-    # Keep only last 100 data points in memory
-    if len(service.storage_history) > 100:
-        service.storage_history = service.storage_history[-100:]
-
     # Save to database
-    monitor._save_service(service)
+    await monitor._save_service(service)
 
     logger.debug(
         f"Updated storage for {service.name}: "
-        f"{total_used:.2f}GB / {total_capacity:.2f}GB ({average_usage:.1f}%)"
+        f"{data_point.total_used:.2f}GB / {data_point.total_capacity:.2f}GB "
+        f"({data_point.average_usage_percent:.1f}%)"
     )
     return {"status": "success", "message": "Storage data updated"}
 
 
+@router.post("/batch")
+async def update_storage_batch(batch: StorageBatch):
+    """Receive buffered storage samples, for one or many services.
+
+    Samples keep their own timestamps; ones older than what the dashboard
+    already has are stored as history without touching current metrics.
+    Samples for unknown services are skipped and listed in the response.
+    """
+    try:
+        timestamps = normalize_timestamps(
+            [sample.timestamp for sample in batch.samples]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    services: dict[str, Service] = {}
+    unknown: set[str] = set()
+    points: dict[str, list[StorageDataPoint]] = {}
+    for sample, timestamp in zip(batch.samples, timestamps):
+        service_id = sample.service_id
+        if service_id not in services and service_id not in unknown:
+            service = monitor.get_service(service_id)
+            if service is None:
+                unknown.add(service_id)
+            else:
+                services[service_id] = service
+        if service_id in unknown:
+            continue
+
+        _apply_storage(services[service_id], sample, timestamp)
+        points.setdefault(service_id, []).append(_storage_point(sample, timestamp))
+
+    if unknown:
+        logger.warning(f"Storage batch for unknown services: {sorted(unknown)}")
+    if not points:
+        raise HTTPException(status_code=404, detail="Service not found")
+
+    counts = await ingest_history("storage", points, services)
+    return {
+        "status": "success",
+        "accepted": counts["appended"] + counts["direct"],
+        "unknown_services": sorted(unknown),
+    }
+
+
 @router.get("/{service_id}/history", response_model=List[StorageDataPoint])
-async def get_storage_history(service_id: str, limit: int = 100):
-    """Get storage history for a service"""
+async def get_storage_history(
+    service_id: str,
+    limit: int = 100,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    max_points: Optional[int] = Query(None, ge=3, le=MAX_POINTS_LIMIT),
+):
+    """Get storage history for a service.
+
+    Without `from`, `to` or `max_points` this returns the last `limit` points
+    held in memory. With any of them, the range (default: the last 24 hours)
+    is read from the database, plus points not yet flushed to it, and
+    downsampled to `max_points` with LTTB.
+    """
     service = monitor.get_service(service_id)
     if not service:
         logger.warning(f"Service not found: {service_id}")
         raise HTTPException(status_code=404, detail="Service not found")
 
-    # Return last N data points
-    history = service.storage_history[-limit:] if service.storage_history else []
-    return history
+    if start is None and end is None and max_points is None:
+        # Return last N data points
+        history = service.storage_history[-limit:] if service.storage_history else []
+        return history
+
+    try:
+        start, end = resolve_range(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await db.run(
+        query_history,
+        service_id,
+        "storage",
+        start,
+        end,
+        max_points or DEFAULT_MAX_POINTS,
+        # Taken here, on the event loop that appends to the history
+        persistence.unflushed(service, "storage"),
+    )
 
 
 @router.get("/{service_id}/current")
@@ -197,3 +226,68 @@ async def get_storage_summary():
     summary["total_free"] = round(summary["total_free"], 2)
 
     return summary
+
+
+def _apply_storage(service: Service, update: StorageUpdate, timestamp: datetime):
+    """Set a service's current storage metrics, unless they're newer"""
+    if service.storage is None:
+        service.storage = StorageMetrics(
+            hostname=update.hostname,
+            storage_paths=[],
+            raid_arrays=[],
+            zfs_pools=[],
+            disks=[],
+        )
+    storage = service.storage
+    if storage.last_updated is not None and storage.last_updated > timestamp:
+        return
+
+    storage.hostname = update.hostname
+    storage.storage_paths = update.storage_paths
+    storage.raid_arrays = update.raid_arrays
+    storage.zfs_pools = update.zfs_pools
+    storage.disks = update.disks
+    storage.last_updated = timestamp
+
+
+def _storage_point(update: StorageUpdate, timestamp: datetime) -> StorageDataPoint:
+    """History point with the aggregated metrics of a storage update"""
+    total_capacity = sum(path.total for path in update.storage_paths)
+    total_used = sum(path.used for path in update.storage_paths)
+    total_free = sum(path.free for path in update.storage_paths)
+    average_usage = (
+        sum(path.percent for path in update.storage_paths) / len(update.storage_paths)
+        if update.storage_paths
+        else 0
+    )
+
+    # Count RAID array statuses (mdadm + ZFS pools)
+    raid_healthy = sum(
+        1 for raid in update.raid_arrays if raid.status == "healthy"
+    ) + sum(1 for pool in update.zfs_pools if pool.status == "healthy")
+
+    raid_degraded = sum(
+        1 for raid in update.raid_arrays if raid.status == "degraded"
+    ) + sum(1 for pool in update.zfs_pools if pool.status == "degraded")
+
+    raid_failed = sum(
+        1
+        for raid in update.raid_arrays
+        if raid.status not in ["healthy", "degraded", "recovering"]
+    ) + sum(
+        1
+        for pool in update.zfs_pools
+        if pool.status not in ["healthy", "degraded", "recovering"]
+    )
+
+    return StorageDataPoint(
+        timestamp=timestamp,
+        hostname=update.hostname,
+        total_capacity=round(total_capacity, 2),
+        total_used=round(total_used, 2),
+        total_free=round(total_free, 2),
+        average_usage_percent=round(average_usage, 2),
+        raid_healthy=raid_healthy,
+        raid_degraded=raid_degraded,
+        raid_failed=raid_failed,
+    )
@@ -1,46 +1,277 @@
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
-from typing import List
-from app.models.service import TrafficUpdate, TrafficDataPoint
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from typing import List, Optional
+from app.models.service import (
+    Service,
+    TrafficBatch,
+    TrafficDataPoint,
+    TrafficMetrics,
+    TrafficSubscription,
+    TrafficUpdate,
+)
+from app.database import db
+from app.services.history_query import (
+    DEFAULT_MAX_POINTS,
+    MAX_POINTS_LIMIT,
+    query_history,
+    resolve_range,
+)
+from app.services.ingest import ingest_history, normalize_timestamps
 from app.services.monitor import monitor
+from app.services.persistence import persistence
 from app.utils.logger import logger
+from collections import deque
 from datetime import datetime, timezone
+from pydantic import ValidationError
 import asyncio
 import json
 
+# MessagePack frames are only offered when the optional msgpack package is
+# installed
+try:
+    import msgpack
+
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
 router = APIRouter(prefix="/api/traffic", tags=["traffic"])
 
 
+# Seconds between WebSocket delta broadcasts
+BROADCAST_INTERVAL = 1.0
+
+# History points per service in a snapshot
+SNAPSHOT_POINTS = 60
+
+# Frames queued for a WebSocket client before they're replaced by a snapshot
+CLIENT_QUEUE_SIZE = 8
+
+# Seconds a single send may take before the client is disconnected
+SEND_TIMEOUT = 10.0
+
+# WebSocket subprotocols selecting the frame encoding. Without one, frames
+# are JSON with a list of points per service; "columnar" sends each
+# service's history as one array per field with epoch-millisecond
+# timestamps, as JSON text or as binary MessagePack.
+COLUMNAR_PROTOCOL = "komandorr.columnar"
+MSGPACK_PROTOCOL = "komandorr.msgpack"
+
+
+class TrafficClient:
+    """A WebSocket connection with its subscription and outgoing queue.
+
+    Frames are sent by the client's own writer task. A queued None stands
+    for a snapshot, built when the writer reaches it.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        services: Optional[List[str]] = None,
+        groups: Optional[List[str]] = None,
+        encoding: Optional[str] = None,
+    ):
+        self.websocket = websocket
+        # Negotiated subprotocol, None for plain JSON
+        self.encoding = encoding
+        self.queue: deque[str | bytes | None] = deque()
+        self.ready = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.subscribe(services, groups)
+
+    @property
+    def filtered(self) -> bool:
+        return self.services is not None or self.groups is not None
+
+    def subscribe(
+        self, services: Optional[List[str]], groups: Optional[List[str]]
+    ):
+        """Receive only these services and groups (neither = all), starting
+        with a fresh snapshot"""
+        self.services = set(services) if services else None
+        self.groups = set(groups) if groups else None
+        self.resync()
+
+    def wants(self, service: Service) -> bool:
+        if not self.filtered:
+            return True
+        return bool(
+            (self.services and service.id in self.services)
+            or (self.groups and service.group in self.groups)
+        )
+
+    def send(self, message: str | bytes):
+        """Queue a frame; on overflow, replace all pending frames with a
+        snapshot"""
+        if len(self.queue) >= CLIENT_QUEUE_SIZE:
+            self.dropped += len(self.queue)
+            logger.debug(
+                f"WebSocket client too slow, dropped {len(self.queue)} frames"
+            )
+            self.resync()
+            return
+        self.queue.append(message)
+        self.ready.set()
+
+    def resync(self):
+        """Drop pending frames and queue a snapshot"""
+        self.queue.clear()
+        self.queue.append(None)
+        self.ready.set()
+
+
 # WebSocket connection manager for real-time traffic updates
 class TrafficConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
+    """Sends each client a full snapshot on connect, then one delta per tick.
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.debug(
-            f"WebSocket client connected. Total: {len(self.active_connections)}"
-        )
+    Agent updates only mark their service as changed. Once per
+    BROADCAST_INTERVAL, the changed services' current metrics and new
+    history points are queued for every client, so the work per tick
+    follows the update rate rather than services x history. Each client is
+    written by its own task from a bounded queue, so a slow or dead client
+    never delays the others or the agents.
+    """
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        logger.debug(
-            f"WebSocket client disconnected. Total: {len(self.active_connections)}"
+    def __init__(self):
+        self.clients: list[TrafficClient] = []
+        self.task: Optional[asyncio.Task] = None
+        # Services updated since the last tick
+        self._changed: set[str] = set()
+        # Newest history timestamp sent per service
+        self._sent_until: dict[str, Optional[datetime]] = {}
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        services: Optional[List[str]] = None,
+        groups: Optional[List[str]] = None,
+    ) -> TrafficClient:
+        encoding = _negotiate_encoding(websocket.scope.get("subprotocols", []))
+        await websocket.accept(subprotocol=encoding)
+        client = TrafficClient(websocket, services, groups, encoding)
+        client.task = asyncio.create_task(self._write_loop(client))
+        self.clients.append(client)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._tick_loop())
+        logger.debug(f"WebSocket client connected. Total: {len(self.clients)}")
+        return client
+
+    def disconnect(self, client: TrafficClient):
+        if client not in self.clients:
+            return
+        self.clients.remove(client)
+        if client.task is not None and client.task is not asyncio.current_task():
+            client.task.cancel()
+        logger.debug(f"WebSocket client disconnected. Total: {len(self.clients)}")
+
+    def note_snapshot(self, services: List[Service]):
+        """Start delta cursors of never-sent services at a snapshot, so
+        their first delta doesn't repeat its history"""
+        for service in services:
+            history = service.traffic_history
+            if service.id not in self._sent_until and history:
+                self._sent_until[service.id] = history[-1].timestamp
+
+    def mark_changed(self, service_id: str):
+        """Include a service in the next delta"""
+        self._changed.add(service_id)
+
+    async def _write_loop(self, client: TrafficClient):
+        """Send a client's queued frames until it fails or times out"""
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                while client.queue:
+                    message = client.queue.popleft()
+                    if message is None:
+                        message = self._snapshot(client)
+                    if isinstance(message, bytes):
+                        send = client.websocket.send_bytes(message)
+                    else:
+                        send = client.websocket.send_text(message)
+                    await asyncio.wait_for(send, SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            logger.debug(f"Dropping WebSocket client: {e!r}")
+        self.disconnect(client)
+        try:
+            await client.websocket.close()
+        except Exception:
+            pass
+
+    def _snapshot(self, client: TrafficClient) -> str | bytes:
+        services = [
+            service for service in monitor.get_all_services() if client.wants(service)
+        ]
+        self.note_snapshot(services)
+        columnar = client.encoding is not None
+        return _encode(
+            {"type": "snapshot", **_build_traffic_summary(services, columnar)},
+            client.encoding,
         )
 
-    async def broadcast(self, data: dict):
-        """Send traffic data to all connected WebSocket clients"""
-        if not self.active_connections:
-            return
-        message = json.dumps(data, default=str)
-        disconnected = []
-        for connection in self.active_connections:
+    async def _tick_loop(self):
+        """Queue a delta every tick while clients are connected"""
+        while self.clients:
             try:
-                await connection.send_text(message)
-            except Exception:
-                disconnected.append(connection)
-        for conn in disconnected:
-            self.active_connections.remove(conn)
+                await asyncio.sleep(BROADCAST_INTERVAL)
+                self._send_delta()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Failed to broadcast traffic update: {e}")
+
+    def _send_delta(self):
+        """Queue the changes since the last tick for each client"""
+        removed = [
+            service_id
+            for service_id in self._sent_until
+            if service_id not in monitor.services
+        ]
+        for service_id in removed:
+            del self._sent_until[service_id]
+        changed, self._changed = self._changed, set()
+        if not changed and not removed:
+            return
+
+        # (service, history range) of each changed service, encoded per client
+        updates: list[tuple[Service, dict]] = []
+        for service_id in changed:
+            service = monitor.get_service(service_id)
+            if service is None or not service.traffic:
+                continue
+            if service_id in self._sent_until:
+                points_range = {"since": self._sent_until[service_id]}
+            else:
+                points_range = {"last": SNAPSHOT_POINTS}
+            history = service.traffic_history
+            self._sent_until[service_id] = history[-1].timestamp if history else None
+            updates.append((service, points_range))
+
+        all_services = monitor.get_all_services()
+        # Unfiltered clients share one frame per encoding
+        shared: dict[Optional[str], str | bytes] = {}
+        for client in self.clients:
+            if not client.filtered:
+                if client.encoding not in shared:
+                    shared[client.encoding] = _encode_delta(
+                        all_services, updates, removed, client.encoding
+                    )
+                client.send(shared[client.encoding])
+                continue
+            client_updates = [update for update in updates if client.wants(update[0])]
+            if client_updates or removed:
+                client.send(
+                    _encode_delta(
+                        [service for service in all_services if client.wants(service)],
+                        client_updates,
+                        removed,
+                        client.encoding,
+                    )
+                )
 
 
 ws_manager = TrafficConnectionManager()
@@ -48,7 +279,12 @@ ws_manager = TrafficConnectionManager()
 
 @router.post("/update")
 async def update_traffic(traffic_data: TrafficUpdate):
-    """Receive traffic data from monitoring agent"""
+    """Receive traffic data from monitoring agent.
+
+    Only in-memory state changes here; the sample reaches the database with
+    the next write-behind flush (every few seconds), so the agent never
+    waits on disk.
+    """
     service = monitor.get_service(traffic_data.service_id)
     if not service:
         logger.warning(
@@ -56,64 +292,145 @@ async def update_traffic(traffic_data: TrafficUpdate):
         )
         raise HTTPException(status_code=404, detail="Service not found")
 
-    # Update current traffic metrics
-    if service.traffic is None:
-        from app.models.service import TrafficMetrics
-
-        service.traffic = TrafficMetrics()
+    now = datetime.now(timezone.utc)
+    _apply_traffic(service, traffic_data, now)
 
-    service.traffic.bandwidth_up = traffic_data.bandwidth_up
-    service.traffic.bandwidth_down = traffic_data.bandwidth_down
-    service.traffic.total_up = traffic_data.total_up
-    service.traffic.total_down = traffic_data.total_down
-    if traffic_data.max_bandwidth is not None:
-        service.traffic.max_bandwidth = traffic_data.max_bandwidth
-    if traffic_data.cpu_percent is not None:
-        service.traffic.cpu_percent = traffic_data.cpu_percent
-    if traffic_data.memory_percent is not None:
-        service.traffic.memory_percent = traffic_data.memory_percent
-    service.traffic.last_updated = datetime.now(timezone.utc)
-
-    # Add to history (keep last 100 data points)
-    data_point = TrafficDataPoint(
-        timestamp=datetime.now(timezone.utc),
+    # Add to the in-memory history; the write-behind flush persists it
+    service.traffic_history.append_values(
+        now,
         bandwidth_up=traffic_data.bandwidth_up,
         bandwidth_down=traffic_data.bandwidth_down,
         total_up=traffic_data.total_up,
         total_down=traffic_data.total_down,
     )
-    service.traffic_history.append(data_point)
-
-    # Keep only last 100 data points in memory
-    if len(service.traffic_history) > 100:
-        service.traffic_history = service.traffic_history[-100:]
-
-    # Save to database
-    monitor._save_service(service)
+    persistence.mark_dirty(service)
 
     logger.debug(
         f"Updated traffic for {service.name}: "
         f"↑{traffic_data.bandwidth_up:.2f}MB/s ↓{traffic_data.bandwidth_down:.2f}MB/s"
     )
 
-    # Broadcast real-time update to all WebSocket clients
-    summary = await _build_traffic_summary()
-    await ws_manager.broadcast(summary)
+    # Sent to WebSocket clients with the next tick
+    ws_manager.mark_changed(service.id)
 
     return {"status": "success", "message": "Traffic data updated"}
 
 
+@router.post("/batch")
+async def update_traffic_batch(batch: TrafficBatch):
+    """Receive buffered traffic samples, for one or many services.
+
+    Samples keep their own timestamps; ones older than what the dashboard
+    already has are stored as history without touching current metrics.
+    Samples for unknown services are skipped and listed in the response.
+    """
+    try:
+        timestamps = normalize_timestamps(
+            [sample.timestamp for sample in batch.samples]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    services: dict[str, Service] = {}
+    unknown: set[str] = set()
+    points: dict[str, list[TrafficDataPoint]] = {}
+    for sample, timestamp in zip(batch.samples, timestamps):
+        service_id = sample.service_id
+        if service_id not in services and service_id not in unknown:
+            service = monitor.get_service(service_id)
+            if service is None:
+                unknown.add(service_id)
+            else:
+                services[service_id] = service
+        if service_id in unknown:
+            continue
+
+        _apply_traffic(services[service_id], sample, timestamp)
+        points.setdefault(service_id, []).append(
+            TrafficDataPoint(
+                timestamp=timestamp,
+                bandwidth_up=sample.bandwidth_up,
+                bandwidth_down=sample.bandwidth_down,
+                total_up=sample.total_up,
+                total_down=sample.total_down,
+            )
+        )
+
+    if unknown:
+        logger.warning(f"Traffic batch for unknown services: {sorted(unknown)}")
+    if not points:
+        raise HTTPException(status_code=404, detail="Service not found")
+
+    counts = await ingest_history("traffic", points, services)
+    for service_id in services:
+        ws_manager.mark_changed(service_id)
+    return {
+        "status": "success",
+        "accepted": counts["appended"] + counts["direct"],
+        "unknown_services": sorted(unknown),
+    }
+
+
+def _apply_traffic(service: Service, update: TrafficUpdate, timestamp: datetime):
+    """Set a service's current traffic metrics, unless they're newer"""
+    if service.traffic is None:
+        service.traffic = TrafficMetrics()
+    traffic = service.traffic
+    if traffic.last_updated is not None and traffic.last_updated > timestamp:
+        return
+
+    traffic.bandwidth_up = update.bandwidth_up
+    traffic.bandwidth_down = update.bandwidth_down
+    traffic.total_up = update.total_up
+    traffic.total_down = update.total_down
+    if update.max_bandwidth is not None:
+        traffic.max_bandwidth = update.max_bandwidth
+    if update.cpu_percent is not None:
+        traffic.cpu_percent = update.cpu_percent
+    if update.memory_percent is not None:
+        traffic.memory_percent = update.memory_percent
+    traffic.last_updated = timestamp
+
+
 @router.get("/{service_id}/history", response_model=List[TrafficDataPoint])
-async def get_traffic_history(service_id: str, limit: int = 100):
-    """Get traffic history for a service"""
+async def get_traffic_history(
+    service_id: str,
+    limit: int = 100,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    max_points: Optional[int] = Query(None, ge=3, le=MAX_POINTS_LIMIT),
+):
+    """Get traffic history for a service.
+
+    Without `from`, `to` or `max_points` this returns the last `limit` points
+    held in memory. With any of them, the range (default: the last 24 hours)
+    is read from the database, plus points not yet flushed to it, and
+    downsampled to `max_points` with LTTB.
+    """
     service = monitor.get_service(service_id)
     if not service:
         logger.warning(f"Service not found: {service_id}")
         raise HTTPException(status_code=404, detail="Service not found")
 
-    # Return last N data points
-    history = service.traffic_history[-limit:] if service.traffic_history else []
-    return history
+    if start is None and end is None and max_points is None:
+        # Return last N data points
+        history = service.traffic_history[-limit:] if service.traffic_history else []
+        return history
+
+    try:
+        start, end = resolve_range(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await db.run(
+        query_history,
+        service_id,
+        "traffic",
+        start,
+        end,
+        max_points or DEFAULT_MAX_POINTS,
+        # Taken here, on the event loop that appends to the history
+        persistence.unflushed(service, "traffic"),
+    )
 
 
 @router.get("/{service_id}/current")
@@ -139,64 +456,149 @@ async def get_current_traffic(service_id: str):
 @router.get("/summary")
 async def get_traffic_summary():
     """Get traffic summary for all services"""
-    return await _build_traffic_summary()
+    return _build_traffic_summary(monitor.get_all_services())
 
 
 @router.websocket("/ws")
-async def traffic_websocket(websocket: WebSocket):
-    """WebSocket endpoint for real-time traffic updates"""
-    await ws_manager.connect(websocket)
+async def traffic_websocket(
+    websocket: WebSocket,
+    services: Optional[str] = Query(None),
+    groups: Optional[str] = Query(None),
+):
+    """WebSocket endpoint for real-time traffic updates.
+
+    `services` and `groups` (comma-separated) limit the updates to those
+    services; a `{"type": "subscribe", "services": [...], "groups": [...]}`
+    message changes the subscription later.
+    """
+    client = await ws_manager.connect(websocket, _split(services), _split(groups))
     try:
-        # Send initial data immediately
-        summary = await _build_traffic_summary()
-        await websocket.send_text(json.dumps(summary, default=str))
-        # Keep connection alive, wait for client disconnect
+        # The snapshot is already queued; deltas follow every tick
         while True:
-            await websocket.receive_text()
+            message = await websocket.receive_text()
+            try:
+                subscription = TrafficSubscription.model_validate_json(message)
+            except ValidationError:
+                logger.debug("Ignoring invalid traffic WebSocket message")
+                continue
+            client.subscribe(subscription.services, subscription.groups)
     except WebSocketDisconnect:
-        ws_manager.disconnect(websocket)
+        pass
     except Exception:
-        ws_manager.disconnect(websocket)
+        pass
+    finally:
+        ws_manager.disconnect(client)
+
+
+def _negotiate_encoding(offered: List[str]) -> Optional[str]:
+    """First supported subprotocol the client offered, or None for JSON"""
+    for protocol in offered:
+        if protocol == COLUMNAR_PROTOCOL or (
+            protocol == MSGPACK_PROTOCOL and MSGPACK_AVAILABLE
+        ):
+            return protocol
+    return None
 
 
-async def _build_traffic_summary() -> dict:
+def _split(value: Optional[str]) -> Optional[List[str]]:
+    if not value:
+        return None
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def _build_traffic_summary(services: List[Service], columnar: bool = False) -> dict:
     """Build the traffic summary dict (shared by REST and WebSocket)"""
-    services = monitor.get_all_services()
+    return {
+        **_summary_totals(services),
+        "services": [
+            {
+                **_service_metrics(service, columnar),
+                "traffic_history": _history(
+                    service, {"last": SNAPSHOT_POINTS}, columnar
+                ),
+            }
+            for service in services
+            if service.traffic and service.traffic.last_updated
+        ],
+    }
+
 
-    summary = {
+def _encode_delta(
+    services: List[Service],
+    updates: List[tuple[Service, dict]],
+    removed: List[str],
+    encoding: Optional[str],
+) -> str | bytes:
+    """Delta frame with the totals of `services` and the history range of
+    each updated service"""
+    columnar = encoding is not None
+    return _encode(
+        {
+            "type": "delta",
+            **_summary_totals(services),
+            "services": [
+                {
+                    **_service_metrics(service, columnar),
+                    "points": _history(service, points_range, columnar),
+                }
+                for service, points_range in updates
+            ],
+            "removed": removed,
+        },
+        encoding,
+    )
+
+
+def _encode(message: dict, encoding: Optional[str]) -> str | bytes:
+    if encoding == MSGPACK_PROTOCOL:
+        return msgpack.packb(message)
+    if encoding == COLUMNAR_PROTOCOL:
+        return json.dumps(message, separators=(",", ":"))
+    return json.dumps(message, default=str)
+
+
+def _history(service: Service, points_range: dict, columnar: bool):
+    if columnar:
+        return service.traffic_history.to_columns(**points_range)
+    return service.traffic_history.to_dicts(**points_range)
+
+
+def _summary_totals(services: List[Service]) -> dict:
+    """Service counts and summed traffic of all services"""
+    totals = {
         "total_services": len(services),
         "services_with_traffic": 0,
         "total_bandwidth_up": 0.0,
         "total_bandwidth_down": 0.0,
         "total_traffic_up": 0.0,
         "total_traffic_down": 0.0,
-        "services": [],
     }
-
     for service in services:
         if service.traffic and service.traffic.last_updated:
-            summary["services_with_traffic"] += 1
-            summary["total_bandwidth_up"] += service.traffic.bandwidth_up
-            summary["total_bandwidth_down"] += service.traffic.bandwidth_down
-            summary["total_traffic_up"] += service.traffic.total_up
-            summary["total_traffic_down"] += service.traffic.total_down
-
-            summary["services"].append(
-                {
-                    "id": service.id,
-                    "name": service.name,
-                    "bandwidth_up": service.traffic.bandwidth_up,
-                    "bandwidth_down": service.traffic.bandwidth_down,
-                    "total_up": service.traffic.total_up,
-                    "total_down": service.traffic.total_down,
-                    "max_bandwidth": service.traffic.max_bandwidth,
-                    "cpu_percent": service.traffic.cpu_percent,
-                    "memory_percent": service.traffic.memory_percent,
-                    "last_updated": service.traffic.last_updated,
-                    "traffic_history": (
-                        service.traffic_history[-60:] if service.traffic_history else []
-                    ),
-                }
-            )
-
-    return summary
+            totals["services_with_traffic"] += 1
+            totals["total_bandwidth_up"] += service.traffic.bandwidth_up
+            totals["total_bandwidth_down"] += service.traffic.bandwidth_down
+            totals["total_traffic_up"] += service.traffic.total_up
+            totals["total_traffic_down"] += service.traffic.total_down
+    return totals
+
+
+def _service_metrics(service: Service, columnar: bool = False) -> dict:
+    """Current traffic metrics of one service (columnar: last_updated in
+    epoch milliseconds)"""
+    traffic = service.traffic
+    last_updated = traffic.last_updated  # type: ignore
+    if columnar and last_updated is not None:
+        last_updated = int(last_updated.timestamp() * 1000)
+    return {
+        "id": service.id,
+        "name": service.name,
+        "bandwidth_up": traffic.bandwidth_up,  # type: ignore
+        "bandwidth_down": traffic.bandwidth_down,  # type: ignore
+        "total_up": traffic.total_up,  # type: ignore
+        "total_down": traffic.total_down,  # type: ignore
+        "max_bandwidth": traffic.max_bandwidth,  # type: ignore
+        "cpu_percent": traffic.cpu_percent,  # type: ignore
+        "memory_percent": traffic.memory_percent,  # type: ignore
+        "last_updated": last_updated,
+    }
@@ -1,4 +1,4 @@
-"""Database models and utilities for SQLite storage"""
+"""Database models and utilities for SQLite or PostgreSQL storage"""
 
 from sqlalchemy import (
     create_engine,
@@ -9,16 +9,34 @@ from sqlalchemy import (
     Integer,
     Boolean,
     ForeignKey,
+    LargeBinary,
+    Index,
     UniqueConstraint,
+    desc,
+    event,
+    make_url,
 )
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timezone
+from functools import partial
 from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, TypeVar
+import asyncio
+from app.config import settings
 from app.utils.logger import logger
 
 Base = declarative_base()
 
+T = TypeVar("T")
+
+# pg_advisory_lock key held while replicas create tables and migrate
+SCHEMA_LOCK_ID = 0x6B6F6D61
+
 
 class ServiceDB(Base):
     """SQLAlchemy model for Service"""
@@ -36,6 +54,10 @@ class ServiceDB(Base):
     icon = Column(String, nullable=True)
     group = Column(String, nullable=True)
     enabled = Column(Boolean, default=True)
+    check_interval = Column(Integer, nullable=True)  # Seconds, None = default
+    check_timeout = Column(Float, nullable=True)  # Seconds, None = default
+    probe = Column(String, default="auto")  # auto, tcp, head, get
+    probe_keyword = Column(String, nullable=True)  # Required in GET body
 
     # Traffic metrics (current state)
     bandwidth_up = Column(Float, default=0.0)
@@ -47,7 +69,10 @@ class ServiceDB(Base):
 
     # Storage metrics (current state)
     storage_hostname = Column(String, nullable=True)
-    storage_data = Column(String, nullable=True)  # JSON string of StorageMetrics
+    storage_data = Column(String, nullable=True)  # Legacy JSON of StorageMetrics
+    # zlib-compressed compact JSON, see app.services.storage_snapshot
+    storage_topology = Column(LargeBinary, nullable=True)
+    storage_usage = Column(LargeBinary, nullable=True)
     storage_last_updated = Column(DateTime, nullable=True)  # Store as naive UTC
 
     # Relationships
@@ -71,10 +96,26 @@ class ResponseHistoryDB(Base):
     service_id = Column(String, ForeignKey("services.id"), nullable=False)
     timestamp = Column(DateTime, nullable=False)  # Store as naive UTC
     response_time = Column(Float, nullable=False)
+    # Phase breakdown in ms (NULL when the phase didn't happen)
+    dns_time = Column(Float, nullable=True)
+    connect_time = Column(Float, nullable=True)
+    tls_time = Column(Float, nullable=True)
+    ttfb_time = Column(Float, nullable=True)
 
     # Relationship
     service = relationship("ServiceDB", back_populates="response_history")
 
+    # Loads, range reads and pruning filter by service, newest first; one
+    # point per timestamp, so a retried ingest batch isn't stored twice
+    __table_args__ = (
+        Index(
+            "ix_response_history_service_timestamp",
+            "service_id",
+            desc("timestamp"),
+            unique=True,
+        ),
+    )
+
 
 class TrafficHistoryDB(Base):
     """SQLAlchemy model for Traffic History"""
@@ -92,6 +133,17 @@ class TrafficHistoryDB(Base):
     # Relationship
     service = relationship("ServiceDB", back_populates="traffic_history")
 
+    # Loads, range reads and pruning filter by service, newest first; one
+    # point per timestamp, so a retried ingest batch isn't stored twice
+    __table_args__ = (
+        Index(
+            "ix_traffic_history_service_timestamp",
+            "service_id",
+            desc("timestamp"),
+            unique=True,
+        ),
+    )
+
 
 class StorageHistoryDB(Base):
     """SQLAlchemy model for Storage History"""
@@ -113,6 +165,58 @@ class StorageHistoryDB(Base):
     # Relationship
     service = relationship("ServiceDB", back_populates="storage_history")
 
+    # Loads, range reads and pruning filter by service, newest first; one
+    # point per timestamp, so a retried ingest batch isn't stored twice
+    __table_args__ = (
+        Index(
+            "ix_storage_history_service_timestamp",
+            "service_id",
+            desc("timestamp"),
+            unique=True,
+        ),
+    )
+
+
+class HistoryRollupDB(Base):
+    """SQLAlchemy model for downsampled history (one metric, one bucket)"""
+
+    __tablename__ = "history_rollups"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    service_id = Column(String, nullable=False)
+    series = Column(String, nullable=False)  # response, traffic, storage
+    metric = Column(String, nullable=False)  # History column, e.g. bandwidth_up
+    resolution = Column(Integer, nullable=False)  # Bucket width in seconds
+    bucket = Column(DateTime, nullable=False)  # Bucket start, naive UTC
+    count = Column(Integer, nullable=False)  # Raw samples aggregated
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+    avg = Column(Float, nullable=False)
+    p95 = Column(Float, nullable=False)
+
+    # Range reads and re-aggregation filter by service/series/tier and time
+    __table_args__ = (
+        Index(
+            "ix_history_rollups_lookup",
+            "service_id",
+            "series",
+            "resolution",
+            "bucket",
+            "metric",
+            unique=True,
+        ),
+    )
+
+
+class RollupStateDB(Base):
+    """SQLAlchemy model for rollup progress (everything before watermark is aggregated)"""
+
+    __tablename__ = "rollup_state"
+
+    series = Column(String, primary_key=True)
+    resolution = Column(Integer, primary_key=True)
+    watermark = Column(DateTime, nullable=False)  # Naive UTC
+
 
 class PlexStatsDB(Base):
     """SQLAlchemy model for Plex Statistics (peak tracking only)"""
@@ -245,129 +349,277 @@ class WatchHistoryDB(Base):
     )
 
 
+def database_url(url: Optional[str] = None) -> URL:
+    """SQLAlchemy URL of `url`, DATABASE_URL, or SQLite at DATABASE_PATH
+    (the first one set)"""
+    parsed = make_url(
+        url or settings.DATABASE_URL or f"sqlite:///{settings.DATABASE_PATH}"
+    )
+    if parsed.drivername in ("postgresql", "postgres"):
+        # Bare postgresql:// would pick psycopg2; we ship psycopg 3
+        parsed = parsed.set(drivername="postgresql+psycopg")
+    return parsed
+
+
 class Database:
     """Database connection and session management"""
 
-    def __init__(self, db_path: str = "data/komandorr.db"):
-        """Initialize database connection"""
-        self.db_path = Path(db_path)
-        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+    def __init__(self, url: Optional[str] = None):
+        """Initialize database connection.
+
+        `url` defaults to DATABASE_URL, or SQLite at DATABASE_PATH when that
+        is empty.
+        """
+        self.url = database_url(url)
+        self.is_sqlite = self.url.get_backend_name() == "sqlite"
+
+        if self.is_sqlite:
+            self.db_path: Optional[Path] = Path(self.url.database or "")
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self.engine = create_engine(
+                self.url,
+                echo=False,  # Set to True for SQL logging
+                connect_args={"check_same_thread": False},  # Needed for SQLite
+            )
+            # Apply the performance profile to every new pooled connection
+            event.listen(self.engine, "connect", self._configure_connection)
+        else:
+            self.db_path = None
+            # Every replica holds up to pool_size + max_overflow connections;
+            # size max_connections on the server accordingly
+            self.engine = create_engine(
+                self.url,
+                echo=False,
+                pool_size=settings.DB_POOL_SIZE,
+                max_overflow=settings.DB_MAX_OVERFLOW,
+                pool_timeout=settings.DB_POOL_TIMEOUT,
+                pool_recycle=settings.DB_POOL_RECYCLE,
+                # Replace connections dropped by a server restart or failover
+                pool_pre_ping=True,
+            )
 
-        # Create engine with SQLite
-        self.engine = create_engine(
-            f"sqlite:///{self.db_path}",
-            echo=False,  # Set to True for SQL logging
-            connect_args={"check_same_thread": False},  # Needed for SQLite
-        )
+        # Result of the most recent WAL checkpoint (see checkpoint())
+        self.last_checkpoint: Dict[str, Any] = {}
 
         # Create session factory
         self.SessionLocal = sessionmaker(
             autocommit=False, autoflush=False, bind=self.engine
         )
 
+        # Blocking database work from async code runs on these threads so
+        # SQLite I/O never stalls the event loop (see run/run_in_session)
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.DB_THREADS, thread_name_prefix="db"
+        )
+
         # Create tables
         self._create_tables()
 
+    @staticmethod
+    def _configure_connection(dbapi_connection, connection_record):
+        """Set per-connection PRAGMAs for concurrent writers"""
+        cursor = dbapi_connection.cursor()
+        try:
+            # Only takes effect on a new, empty database (existing ones are
+            # converted by a full VACUUM during maintenance)
+            cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            # WAL lets readers run alongside the single writer; NORMAL sync is
+            # durable across application crashes and only fsyncs on checkpoint
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA mmap_size={int(settings.DB_MMAP_SIZE)}")
+            # Negative cache_size is in KiB rather than pages
+            cursor.execute(f"PRAGMA cache_size=-{int(settings.DB_CACHE_SIZE_KB)}")
+            cursor.execute(f"PRAGMA busy_timeout={int(settings.DB_BUSY_TIMEOUT_MS)}")
+        finally:
+            cursor.close()
+
     def _create_tables(self):
         """Create all tables if they don't exist"""
-        Base.metadata.create_all(bind=self.engine)
-        logger.info(f"Database initialized at {self.db_path}")
+        with self._schema_lock():
+            Base.metadata.create_all(bind=self.engine)
+            logger.info(
+                f"Database initialized at "
+                f"{self.db_path or self.url.render_as_string(hide_password=True)}"
+            )
 
-        # Run migrations for existing databases
-        self._migrate_database()
+            # Run migrations for existing databases
+            self._migrate_database()
+
+    @contextmanager
+    def _schema_lock(self) -> Iterator[None]:
+        """Keep replicas sharing a PostgreSQL database from migrating at once"""
+        if self.is_sqlite:
+            yield
+            return
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql(f"SELECT pg_advisory_lock({SCHEMA_LOCK_ID})")
+            try:
+                yield
+            finally:
+                conn.exec_driver_sql(f"SELECT pg_advisory_unlock({SCHEMA_LOCK_ID})")
 
     def _migrate_database(self):
-        """Apply database migrations for schema updates"""
-        try:
-            import sqlite3
-
-            conn = sqlite3.connect(str(self.db_path))
-            cursor = conn.cursor()
-
-            # Check if new columns exist in services table
-            cursor.execute("PRAGMA table_info(services)")
-            service_columns = [row[1] for row in cursor.fetchall()]
-
-            # Add max_bandwidth column if it doesn't exist
-            if "max_bandwidth" not in service_columns:
-                logger.info("Adding max_bandwidth column to services table")
-                cursor.execute("ALTER TABLE services ADD COLUMN max_bandwidth REAL")
-
-            # Add storage_hostname column if it doesn't exist
-            if "storage_hostname" not in service_columns:
-                logger.info("Adding storage_hostname column to services table")
-                cursor.execute("ALTER TABLE services ADD COLUMN storage_hostname TEXT")
-
-            # Add storage_last_updated column if it doesn't exist
-            if "storage_last_updated" not in service_columns:
-                logger.info("Adding storage_last_updated column to services table")
-                cursor.execute(
-                    "ALTER TABLE services ADD COLUMN storage_last_updated DATETIME"
-                )
+        """Apply pending versioned schema migrations"""
+        from app.migrations import run_migrations
 
-            # Add storage_data column if it doesn't exist
-            if "storage_data" not in service_columns:
-                logger.info("Adding storage_data column to services table")
-                cursor.execute("ALTER TABLE services ADD COLUMN storage_data TEXT")
+        try:
+            version = run_migrations(self.engine)
+            logger.info(f"Database schema at version {version}")
+        except Exception as e:
+            logger.error(f"Error during database migration: {e}")
 
-            # Check if new columns exist in plex_stats table
-            cursor.execute("PRAGMA table_info(plex_stats)")
-            columns = [row[1] for row in cursor.fetchall()]
+    def get_session(self):
+        """Get a new database session"""
+        return self.SessionLocal()
 
-            # Add total_users column if it doesn't exist
-            if "total_users" not in columns:
-                logger.info("Adding total_users column to plex_stats table")
-                cursor.execute(
-                    "ALTER TABLE plex_stats ADD COLUMN total_users INTEGER DEFAULT 0"
-                )
+    def insert(self, table):
+        """INSERT for the active dialect, with on_conflict_do_nothing() and
+        on_conflict_do_update() for idempotent writes"""
+        if self.is_sqlite:
+            return sqlite.insert(table)
+        return postgresql.insert(table)
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run blocking database code on the database thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(func, *args, **kwargs)
+        )
 
-            # Add total_movies column if it doesn't exist
-            if "total_movies" not in columns:
-                logger.info("Adding total_movies column to plex_stats table")
-                cursor.execute(
-                    "ALTER TABLE plex_stats ADD COLUMN total_movies INTEGER DEFAULT 0"
+    async def run_in_session(
+        self, func: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        """Run `func(session, *args)` on the database thread pool.
+
+        The session lives for this one call: it is rolled back if `func`
+        raises and always closed afterwards, so `func` commits its own
+        writes and should return plain values rather than ORM objects.
+        """
+
+        def task() -> T:
+            session = self.SessionLocal()
+            try:
+                return func(session, *args, **kwargs)
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+
+        return await self.run(task)
+
+    def _autocommit(self):
+        """Connection outside any transaction (required for VACUUM)"""
+        return self.engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+    def checkpoint(self, mode: str = "PASSIVE") -> Dict[str, Any]:
+        """Checkpoint the WAL (PASSIVE, FULL, RESTART or TRUNCATE). SQLite only."""
+        if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+            raise ValueError(f"Unknown checkpoint mode: {mode}")
+        with self._autocommit() as conn:
+            busy, wal_frames, checkpointed = conn.exec_driver_sql(
+                f"PRAGMA wal_checkpoint({mode})"
+            ).one()
+        self.last_checkpoint = {
+            "mode": mode,
+            "busy": bool(busy),
+            "wal_frames": wal_frames,
+            "checkpointed_frames": checkpointed,
+            # Frames a reader or writer kept from being copied back
+            "lag_frames": max(wal_frames - checkpointed, 0),
+            "at": datetime.now(timezone.utc),
+        }
+        return self.last_checkpoint
+
+    def optimize(self) -> None:
+        """Refresh query planner statistics where SQLite thinks they're stale.
+        SQLite only."""
+        with self._autocommit() as conn:
+            conn.exec_driver_sql("PRAGMA analysis_limit=400")
+            conn.exec_driver_sql("PRAGMA optimize")
+
+    def incremental_vacuum(self, pages: int) -> int:
+        """Release up to `pages` free pages back to the OS.
+
+        Databases created before auto_vacuum was enabled are converted with a
+        one-off full VACUUM first. Returns the number of pages released.
+        SQLite only.
+        """
+        with self._autocommit() as conn:
+            freelist = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+            auto_vacuum = conn.exec_driver_sql("PRAGMA auto_vacuum").scalar()
+            if auto_vacuum != 2:
+                logger.info("Converting database to incremental auto-vacuum")
+                conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.exec_driver_sql("VACUUM")
+            else:
+                # Each step frees one page and sqlite3's execute() only steps
+                # once for statements without result columns; executescript()
+                # runs the pragma to completion
+                conn.connection.driver_connection.executescript(
+                    f"PRAGMA incremental_vacuum({int(pages)})"
                 )
-
-            # Add total_tv_shows column if it doesn't exist
-            if "total_tv_shows" not in columns:
-                logger.info("Adding total_tv_shows column to plex_stats table")
-                cursor.execute(
-                    "ALTER TABLE plex_stats ADD COLUMN total_tv_shows INTEGER DEFAULT 0"
+            remaining = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        return freelist - remaining
+
+    def get_stats(self) -> Dict[str, Any]:
+        """File sizes, page usage and checkpoint lag (pool usage on PostgreSQL)"""
+        if not self.is_sqlite:
+            with self.engine.connect() as conn:
+                size = conn.exec_driver_sql(
+                    "SELECT pg_database_size(current_database())"
+                ).scalar()
+            pool = self.engine.pool
+            return {
+                "backend": "postgresql",
+                "url": self.url.render_as_string(hide_password=True),
+                "size_bytes": size,
+                "pool": {
+                    "size": pool.size(),  # type: ignore[attr-defined]
+                    "checked_out": pool.checkedout(),  # type: ignore[attr-defined]
+                    "overflow": pool.overflow(),  # type: ignore[attr-defined]
+                },
+            }
+
+        wal_path = Path(f"{self.db_path}-wal")
+        with self._autocommit() as conn:
+            pragmas = {
+                name: conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+                for name in (
+                    "page_size",
+                    "page_count",
+                    "freelist_count",
+                    "journal_mode",
+                    "auto_vacuum",
                 )
+            }
 
-            # Check if new columns exist in plex_users table
-            cursor.execute("PRAGMA table_info(plex_users)")
-            plex_users_columns = [row[1] for row in cursor.fetchall()]
-
-            # Add expires_at column if it doesn't exist
-            if "expires_at" not in plex_users_columns:
-                logger.info("Adding expires_at column to plex_users table")
-                cursor.execute("ALTER TABLE plex_users ADD COLUMN expires_at DATETIME")
-
-            # Add thumb column if it doesn't exist
-            if "thumb" not in plex_users_columns:
-                logger.info("Adding thumb column to plex_users table")
-                cursor.execute("ALTER TABLE plex_users ADD COLUMN thumb TEXT")
-
-            # Check if watch_history table exists
-            cursor.execute(
-                "SELECT name FROM sqlite_master WHERE type='table' AND name='watch_history'"
+        checkpoint = dict(self.last_checkpoint)
+        if checkpoint:
+            checkpoint["seconds_ago"] = round(
+                (datetime.now(timezone.utc) - checkpoint["at"]).total_seconds(), 1
             )
-            if not cursor.fetchone():
-                logger.info("watch_history table doesn't exist, it will be created")
-
-            conn.commit()
-            conn.close()
-            logger.info("Database migration completed successfully")
-        except Exception as e:
-            logger.error(f"Error during database migration: {e}")
-
-    def get_session(self):
-        """Get a new database session"""
-        return self.SessionLocal()
+            checkpoint["at"] = checkpoint["at"].isoformat()
+
+        return {
+            "backend": "sqlite",
+            "path": str(self.db_path),
+            "size_bytes": self.db_path.stat().st_size if self.db_path.exists() else 0,  # type: ignore
+            "wal_bytes": wal_path.stat().st_size if wal_path.exists() else 0,
+            "page_size": pragmas["page_size"],
+            "page_count": pragmas["page_count"],
+            "free_pages": pragmas["freelist_count"],
+            "journal_mode": pragmas["journal_mode"],
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(
+                pragmas["auto_vacuum"], pragmas["auto_vacuum"]
+            ),
+            "last_checkpoint": checkpoint or None,
+        }
 
     def close(self):
         """Close database connection"""
+        self.executor.shutdown(wait=True)
         self.engine.dispose()
         logger.info("Database connection closed")
 
@@ -45,8 +45,9 @@ async def lifespan(app: FastAPI):
 
     # Migrate Plex config from JSON to database if needed
     from app.api.plex import migrate_plex_config_if_needed
+    from app.database import db
 
-    migrate_plex_config_if_needed()
+    await db.run(migrate_plex_config_if_needed)
 
     # Background task to check for expired invites
     async def check_expired_invites_loop():
@@ -62,9 +63,34 @@ async def lifespan(app: FastAPI):
             except Exception as e:
                 logger.error(f"Error in expiration check loop: {e}")
 
+    # Start the single database writer first; background jobs queue writes to it
+    from app.services.db_writer import db_writer
+
+    db_writer_task = asyncio.create_task(db_writer.start_writer_loop())
+
     # Start monitoring in background
     monitoring_task = asyncio.create_task(monitor.start_monitoring(interval=10))
 
+    # Start write-behind flush of monitor state
+    from app.services.persistence import persistence
+
+    persistence_task = asyncio.create_task(persistence.start_flush_loop())
+
+    # Start history retention (prunes old history rows periodically)
+    from app.services.retention import history_retention
+
+    retention_task = asyncio.create_task(history_retention.start_retention_loop())
+
+    # Start history rollups (1m/15m/1h buckets for long-range charts)
+    from app.services.rollups import history_rollups
+
+    rollup_task = asyncio.create_task(history_rollups.start_rollup_loop())
+
+    # Start database maintenance (WAL checkpoints, off-peak optimize/vacuum)
+    from app.services.db_maintenance import db_maintenance
+
+    db_maintenance_task = asyncio.create_task(db_maintenance.start_maintenance_loop())
+
     # Start invite expiration checker
     expiration_task = asyncio.create_task(check_expired_invites_loop())
 
@@ -93,15 +119,39 @@ async def lifespan(app: FastAPI):
     watch_history_sync.stop()
     stats_cache.stop()
     cache_warmer.stop()
+    persistence.stop()
+    history_retention.stop()
+    history_rollups.stop()
+    db_maintenance.stop()
     monitoring_task.cancel()
     expiration_task.cancel()
     watch_history_task.cancel()
     stats_cache_task.cancel()
     cache_warmer_task.cancel()
+    persistence_task.cancel()
+    retention_task.cancel()
+    rollup_task.cancel()
+    db_maintenance_task.cancel()
     try:
         await monitoring_task
     except asyncio.CancelledError:
         pass
+    try:
+        await persistence_task
+    except asyncio.CancelledError:
+        pass
+    try:
+        await retention_task
+    except asyncio.CancelledError:
+        pass
+    try:
+        await rollup_task
+    except asyncio.CancelledError:
+        pass
+    try:
+        await db_maintenance_task
+    except asyncio.CancelledError:
+        pass
     try:
         await expiration_task
     except asyncio.CancelledError:
@@ -119,6 +169,17 @@ async def lifespan(app: FastAPI):
     except asyncio.CancelledError:
         pass
 
+    # Drain buffered monitor state before exiting
+    await persistence.flush()
+
+    # Stop the writer last, once nothing queues writes anymore
+    db_writer.stop()
+    db_writer_task.cancel()
+    try:
+        await db_writer_task
+    except asyncio.CancelledError:
+        pass
+
 
 app = FastAPI(
     title="Komandorr Dashboard API",
@@ -0,0 +1,246 @@
+"""
+Versioned Schema Migrations
+
+Each migration runs once, in version order, in its own transaction, and is
+recorded in the schema_migrations table. Tables that don't exist yet are
+created from the models by create_all() before migrations run, so every
+migration must also be safe on a database that already has its change.
+DDL is compiled for the connection's dialect (SQLite or PostgreSQL).
+"""
+
+from datetime import datetime, timezone
+from typing import Callable, List, NamedTuple
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Float,
+    Integer,
+    LargeBinary,
+    MetaData,
+    String,
+    Table,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+from app.utils.logger import logger
+
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, description: str):
+    """Register a migration function under a schema version"""
+
+    def register(func: Callable[[Connection], None]):
+        MIGRATIONS.append(Migration(version, description, func))
+        return func
+
+    return register
+
+
+def _add_columns(conn: Connection, table: str, columns: List[Column]):
+    """Add the columns missing from `table`"""
+    existing = {column["name"] for column in inspect(conn).get_columns(table)}
+    for column in columns:
+        if column.name not in existing:
+            logger.info(f"Adding {column.name} column to {table} table")
+            ddl = CreateColumn(column).compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {ddl}")
+
+
+# Migrations
+
+
+@migration(1, "Columns added before schema versioning")
+def _baseline(conn: Connection):
+    _add_columns(
+        conn,
+        "services",
+        [
+            Column("max_bandwidth", Float),
+            Column("storage_hostname", String),
+            Column("storage_last_updated", DateTime),
+            Column("storage_data", String),
+            Column("check_interval", Integer),
+            Column("check_timeout", Float),
+            Column("probe", String, server_default="auto"),
+            Column("probe_keyword", String),
+        ],
+    )
+    _add_columns(
+        conn,
+        "response_history",
+        [
+            Column("dns_time", Float),
+            Column("connect_time", Float),
+            Column("tls_time", Float),
+            Column("ttfb_time", Float),
+        ],
+    )
+    _add_columns(
+        conn,
+        "plex_stats",
+        [
+            Column("total_users", Integer, server_default=text("0")),
+            Column("total_movies", Integer, server_default=text("0")),
+            Column("total_tv_shows", Integer, server_default=text("0")),
+        ],
+    )
+    _add_columns(
+        conn,
+        "plex_users",
+        [
+            Column("expires_at", DateTime),
+            Column("thumb", String),
+        ],
+    )
+
+
+@migration(2, "Composite (service_id, timestamp) indexes on history tables")
+def _history_indexes(conn: Connection):
+    # Newest-first matches the history loader's and the retention job's
+    # ROW_NUMBER() OVER (PARTITION BY service_id ORDER BY timestamp DESC), so
+    # neither needs a sort. The rowid rides along in every index entry, which
+    # makes it covering for the retention ranking (id, service_id, timestamp).
+    for table in ("response_history", "traffic_history", "storage_history"):
+        conn.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_service_timestamp "
+            f"ON {table} (service_id, timestamp DESC)"
+        )
+
+
+@migration(3, "Split storage snapshot into topology and usage columns")
+def _storage_parts(conn: Connection):
+    _add_columns(
+        conn,
+        "services",
+        [
+            Column("storage_topology", LargeBinary),
+            Column("storage_usage", LargeBinary),
+        ],
+    )
+
+
+@migration(4, "Full-text search index over watch history")
+def _watch_history_search(conn: Connection):
+    from app.services.watch_history_search import (
+        FTS_TABLE,
+        PG_DOCUMENT,
+        SEARCH_COLUMNS,
+    )
+
+    if conn.dialect.name == "postgresql":
+        conn.exec_driver_sql(
+            f"CREATE INDEX IF NOT EXISTS ix_watch_history_search "
+            f"ON watch_history USING GIN (({PG_DOCUMENT}))"
+        )
+        return
+
+    if not conn.exec_driver_sql(
+        "SELECT 1 FROM pragma_compile_options WHERE compile_options = 'ENABLE_FTS5'"
+    ).first():
+        logger.warning("SQLite was built without FTS5, watch history search will scan")
+        return
+
+    columns = ", ".join(SEARCH_COLUMNS)
+    new = ", ".join(f"new.{column}" for column in SEARCH_COLUMNS)
+    old = ", ".join(f"old.{column}" for column in SEARCH_COLUMNS)
+    # External content: the index stores tokens only and reads rows back
+    # from watch_history; prefix indexes make 2-3 character prefixes cheap
+    conn.exec_driver_sql(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        f"{columns}, content='watch_history', content_rowid='id', "
+        f"prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+    )
+    conn.exec_driver_sql(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON watch_history "
+        f"BEGIN INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new}); END"
+    )
+    conn.exec_driver_sql(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON watch_history "
+        f"BEGIN INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old}); END"
+    )
+    # Only searchable columns; view count and progress updates skip the index
+    conn.exec_driver_sql(
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au "
+        f"AFTER UPDATE OF {columns} ON watch_history BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) "
+        f"VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new}); END"
+    )
+    conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+@migration(5, "Unique (service_id, timestamp) on history tables")
+def _unique_history_timestamps(conn: Connection):
+    for table in ("response_history", "traffic_history", "storage_history"):
+        index = f"ix_{table}_service_timestamp"
+        if any(
+            existing["name"] == index and existing["unique"]
+            for existing in inspect(conn).get_indexes(table)
+        ):
+            continue
+        # Keep the first of each duplicated point
+        deleted = conn.exec_driver_sql(
+            f"DELETE FROM {table} WHERE id NOT IN "
+            f"(SELECT MIN(id) FROM {table} GROUP BY service_id, timestamp)"
+        ).rowcount
+        if deleted:
+            logger.info(f"Removed {deleted} duplicate rows from {table}")
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index}")
+        conn.exec_driver_sql(
+            f"CREATE UNIQUE INDEX {index} ON {table} (service_id, timestamp DESC)"
+        )
+
+
+def current_version(conn: Connection) -> int:
+    """Highest applied schema version (0 for an unversioned database)"""
+    return conn.execute(
+        select(schema_migrations.c.version)
+        .order_by(schema_migrations.c.version.desc())
+        .limit(1)
+    ).scalar() or 0
+
+
+def run_migrations(engine: Engine) -> int:
+    """Apply pending migrations in order and return the resulting version"""
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        version = current_version(conn)
+
+    for pending in sorted(MIGRATIONS, key=lambda m: m.version):
+        if pending.version <= version:
+            continue
+        logger.info(
+            f"Applying schema migration {pending.version}: {pending.description}"
+        )
+        with engine.begin() as conn:
+            pending.apply(conn)
+            conn.execute(
+                schema_migrations.insert().values(
+                    version=pending.version,
+                    description=pending.description,
+                    applied_at=datetime.now(timezone.utc).replace(tzinfo=None),
+                )
+            )
+        version = pending.version
+    return version
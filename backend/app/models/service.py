@@ -1,6 +1,17 @@
-from pydantic import BaseModel
-from typing import Literal, List
+from pydantic import BaseModel, Field, field_validator
+from typing import Literal
 from datetime import datetime, timezone, timedelta
+from app.models.timeseries import MAX_BATCH_SAMPLES, TimeSeriesBuffer
+
+# How a service is health checked
+ProbeMode = Literal["auto", "tcp", "head", "get"]
+
+# Persisted history series
+HistorySeries = Literal["response", "traffic", "storage"]
+
+# Shortest per-service check interval in seconds (shorter ones would keep
+# re-checking a service and starve the others)
+MIN_CHECK_INTERVAL = 5
 
 
 class TrafficMetrics(BaseModel):
@@ -31,6 +42,65 @@ class ResponseTimeDataPoint(BaseModel):
 
     timestamp: datetime
     response_time: float  # milliseconds
+    # Phase breakdown in milliseconds (None when the phase didn't happen,
+    # e.g. no connect/TLS time on a reused keep-alive connection)
+    dns_time: float | None = None
+    connect_time: float | None = None
+    tls_time: float | None = None
+    ttfb_time: float | None = None
+
+
+class RollupStats(BaseModel):
+    """Aggregate of one metric over a time bucket"""
+
+    min: float
+    max: float
+    avg: float
+    p95: float
+
+
+class RollupPoint(BaseModel):
+    """One time bucket of a history range"""
+
+    timestamp: datetime  # Bucket start
+    count: int  # Samples in the bucket
+    metrics: dict[str, RollupStats]
+
+
+class HistoryRange(BaseModel):
+    """History of one series over a time range, at the resolution served"""
+
+    service_id: str
+    series: HistorySeries
+    resolution: str  # "raw", "1m", "15m" or "1h"
+    start: datetime
+    end: datetime
+    points: list[RollupPoint]
+
+
+class TrafficHistory(TimeSeriesBuffer):
+    """In-memory ring buffer of traffic data points"""
+
+    point_model = TrafficDataPoint
+    columns = (
+        ("bandwidth_up", "d"),
+        ("bandwidth_down", "d"),
+        ("total_up", "d"),
+        ("total_down", "d"),
+    )
+
+
+class ResponseTimeHistory(TimeSeriesBuffer):
+    """In-memory ring buffer of response time data points"""
+
+    point_model = ResponseTimeDataPoint
+    columns = (
+        ("response_time", "d"),
+        ("dns_time", "d"),
+        ("connect_time", "d"),
+        ("tls_time", "d"),
+        ("ttfb_time", "d"),
+    )
 
 
 class Service(BaseModel):
@@ -46,13 +116,21 @@ class Service(BaseModel):
     description: str | None = None
     icon: str | None = None
     group: str | None = None
+    # Seconds between checks (None = default)
+    check_interval: int | None = Field(default=None, ge=MIN_CHECK_INTERVAL)
+    # Check timeout in seconds (None = default)
+    check_timeout: float | None = Field(default=None, gt=0)
+    probe: ProbeMode = "auto"  # auto = TCP for servers, streaming GET otherwise
+    probe_keyword: str | None = None  # Text the GET response body must contain
     traffic: TrafficMetrics | None = None
-    traffic_history: List[TrafficDataPoint] = []
-    response_history: List[ResponseTimeDataPoint] = []
+    traffic_history: TrafficHistory = Field(default_factory=TrafficHistory)
+    response_history: ResponseTimeHistory = Field(default_factory=ResponseTimeHistory)
 
     # Storage monitoring
     storage: "StorageMetrics | None" = None
-    storage_history: List["StorageDataPoint"] = []
+    storage_history: "StorageHistory" = Field(
+        default_factory=lambda: StorageHistory()
+    )
 
     @property
     def is_traffic_active(self) -> bool:
@@ -82,6 +160,10 @@ class ServiceCreate(BaseModel):
     description: str | None = None
     icon: str | None = None
     group: str | None = None
+    check_interval: int | None = Field(default=None, ge=MIN_CHECK_INTERVAL)
+    check_timeout: float | None = Field(default=None, gt=0)
+    probe: ProbeMode = "auto"
+    probe_keyword: str | None = None
 
 
 class ServiceUpdate(BaseModel):
@@ -93,6 +175,16 @@ class ServiceUpdate(BaseModel):
     description: str | None = None
     icon: str | None = None
     group: str | None = None
+    check_interval: int | None = Field(default=None, ge=MIN_CHECK_INTERVAL)
+    check_timeout: float | None = Field(default=None, gt=0)
+    probe: ProbeMode | None = None
+    probe_keyword: str | None = None
+
+    @field_validator("probe")
+    @classmethod
+    def _probe_defaults_to_auto(cls, probe: ProbeMode | None) -> ProbeMode:
+        """Treat an explicit null as a reset to auto"""
+        return "auto" if probe is None else probe
 
 
 class StatusResponse(BaseModel):
@@ -115,8 +207,30 @@ class TrafficUpdate(BaseModel):
     memory_percent: float | None = None  # Memory usage percentage
 
 
+class TrafficSample(TrafficUpdate):
+    """Traffic update measured at `timestamp` (naive means UTC)"""
+
+    timestamp: datetime
+
+
+class TrafficBatch(BaseModel):
+    """Buffered traffic samples from an agent or relay, for any services"""
+
+    samples: list[TrafficSample] = Field(
+        ..., min_length=1, max_length=MAX_BATCH_SAMPLES
+    )
+
+
+class TrafficSubscription(BaseModel):
+    """Services a traffic WebSocket client receives (none given = all)"""
+
+    type: Literal["subscribe"]
+    services: list[str] | None = None
+    groups: list[str] | None = None
+
+
 # Import storage models for forward references
-from app.models.storage import StorageMetrics, StorageDataPoint
+from app.models.storage import StorageMetrics, StorageHistory
 
 # Update forward references
 Service.model_rebuild()
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Literal
 from datetime import datetime
+from app.models.timeseries import MAX_BATCH_SAMPLES, TimeSeriesBuffer
 
 
 class DiskUsage(BaseModel):
@@ -98,6 +99,22 @@ class StorageDataPoint(BaseModel):
     raid_failed: int  # Number of failed RAID arrays
 
 
+class StorageHistory(TimeSeriesBuffer):
+    """In-memory ring buffer of storage data points"""
+
+    point_model = StorageDataPoint
+    columns = (
+        ("hostname", None),
+        ("total_capacity", "d"),
+        ("total_used", "d"),
+        ("total_free", "d"),
+        ("average_usage_percent", "d"),
+        ("raid_healthy", "q"),
+        ("raid_degraded", "q"),
+        ("raid_failed", "q"),
+    )
+
+
 class StorageUpdate(BaseModel):
     """Model for updating storage data from agent"""
 
@@ -108,3 +125,17 @@ class StorageUpdate(BaseModel):
     raid_arrays: List[RaidArray] = []
     zfs_pools: List[ZfsPool] = []
     disks: List[DiskInfo] = []
+
+
+class StorageSample(StorageUpdate):
+    """Storage update measured at `timestamp` (naive means UTC)"""
+
+    timestamp: datetime  # type: ignore[assignment]
+
+
+class StorageBatch(BaseModel):
+    """Buffered storage samples from an agent or relay, for any services"""
+
+    samples: List[StorageSample] = Field(
+        ..., min_length=1, max_length=MAX_BATCH_SAMPLES
+    )
@@ -0,0 +1,229 @@
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+from pydantic import BaseModel
+from pydantic_core import core_schema
+
+HISTORY_CAPACITY = 1000  # Data points kept in memory per service per series
+MAX_BATCH_SAMPLES = 5000  # Samples accepted by one batch ingest request
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _to_micros(dt: datetime) -> int:
+    """Aware or naive-UTC datetime -> integer microseconds since the epoch"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return (dt - _EPOCH) // _MICROSECOND
+
+
+def _from_micros(micros: int) -> datetime:
+    return datetime.fromtimestamp(micros // 1_000_000, tz=timezone.utc).replace(
+        microsecond=micros % 1_000_000
+    )
+
+
+class TimeSeriesBuffer:
+    """Fixed-capacity ring buffer storing data points column by column.
+
+    Timestamps live in an array of epoch microseconds and every numeric field
+    in its own typed array, so appends are O(1) with no per-point objects.
+    Data point models are only built when points are read back, and the
+    buffer serializes to the usual list-of-points JSON shape.
+
+    Subclasses set `point_model` and `columns` as (field, typecode) pairs;
+    a typecode of None stores the field in a plain list (e.g. strings).
+    """
+
+    point_model: Type[BaseModel]
+    columns: Tuple[Tuple[str, Optional[str]], ...] = ()
+
+    def __init__(self, points: Iterable[Any] = (), capacity: int = HISTORY_CAPACITY):
+        self.capacity = capacity
+        self._start = 0  # Index of the oldest point
+        self._size = 0
+        self._timestamps = array("q", bytes(8 * capacity))
+        self._data: Dict[str, Any] = {
+            name: (
+                array(typecode, bytes(array(typecode).itemsize * capacity))
+                if typecode
+                else [None] * capacity
+            )
+            for name, typecode in self.columns
+        }
+        # (name, storage, value used for None) for the append hot path
+        self._columns = [
+            (
+                name,
+                column,
+                float("nan") if isinstance(column, array) and column.typecode in "fd"
+                else 0 if isinstance(column, array) else None,
+            )
+            for name, column in self._data.items()
+        ]
+        self.extend(points)
+
+    # Writing
+
+    def _next_slot(self) -> int:
+        """Claim the slot for the next point"""
+        if self._size < self.capacity:
+            slot = (self._start + self._size) % self.capacity
+            self._size += 1
+        else:
+            # Full: overwrite the oldest point
+            slot = self._start
+            self._start = (self._start + 1) % self.capacity
+        return slot
+
+    def append_values(self, timestamp: datetime, **values: Any) -> None:
+        """Append one point from its timestamp and field values"""
+        slot = self._next_slot()
+        self._timestamps[slot] = _to_micros(timestamp)
+        for name, column, missing in self._columns:
+            value = values.get(name)
+            column[slot] = missing if value is None else value
+
+    def append(self, point: Any) -> None:
+        """Append a data point model (or dict with the same fields)"""
+        if isinstance(point, dict):
+            self.append_values(**point)
+        else:
+            self.append_values(
+                point.timestamp, **{name: getattr(point, name) for name in self._data}
+            )
+
+    def extend(self, points: Iterable[Any]) -> None:
+        for point in points:
+            self.append(point)
+
+    def extend_rows(self, rows: Iterable[tuple]) -> None:
+        """Append raw (timestamp, *column values) rows, e.g. from the database"""
+        for row in rows:
+            slot = self._next_slot()
+            self._timestamps[slot] = _to_micros(row[0])
+            for (_, column, missing), value in zip(self._columns, row[1:]):
+                column[slot] = missing if value is None else value
+
+    def clear(self) -> None:
+        self._start = 0
+        self._size = 0
+
+    # Reading
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _slot(self, index: int) -> int:
+        return (self._start + index) % self.capacity
+
+    def _point(self, index: int) -> BaseModel:
+        slot = self._slot(index)
+        return self.point_model.model_construct(
+            timestamp=_from_micros(self._timestamps[slot]),
+            **{name: self._value(column, slot) for name, column in self._data.items()},
+        )
+
+    @staticmethod
+    def _value(column: Any, slot: int) -> Any:
+        value = column[slot]
+        # NaN marks a missing optional float
+        if isinstance(value, float) and value != value:
+            return None
+        return value
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._point(i) for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("time series index out of range")
+        return self._point(index)
+
+    def __iter__(self) -> Iterator[BaseModel]:
+        for i in range(self._size):
+            yield self._point(i)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(len={self._size}, capacity={self.capacity})"
+
+    def _first_after(self, micros: int) -> int:
+        """Index of the first point with a timestamp after `micros`"""
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamps[self._slot(mid)] > micros:
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def since(self, cursor: Optional[datetime]) -> List[BaseModel]:
+        """Points newer than `cursor` (all points if cursor is None)"""
+        if cursor is None:
+            return self[:]
+        return self[self._first_after(_to_micros(cursor)) :]
+
+    def _range_start(self, last: Optional[int], since: Optional[datetime]) -> int:
+        """Index of the first of the last `last` points newer than `since`"""
+        start = 0 if last is None else max(self._size - last, 0)
+        if since is not None:
+            start = max(start, self._first_after(_to_micros(since)))
+        return start
+
+    def to_dicts(
+        self, last: Optional[int] = None, since: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """Serialize points (the last `last`, newer than `since`) to
+        JSON-ready dicts with ISO timestamps"""
+        start = self._range_start(last, since)
+        result = []
+        for i in range(start, self._size):
+            slot = self._slot(i)
+            item: Dict[str, Any] = {
+                "timestamp": _from_micros(self._timestamps[slot])
+                .isoformat()
+                .replace("+00:00", "Z")
+            }
+            for name, column in self._data.items():
+                item[name] = self._value(column, slot)
+            result.append(item)
+        return result
+
+    def to_columns(
+        self, last: Optional[int] = None, since: Optional[datetime] = None
+    ) -> Dict[str, List[Any]]:
+        """Like to_dicts(), but one list per field, with timestamps in epoch
+        milliseconds"""
+        start = self._range_start(last, since)
+        slots = [self._slot(i) for i in range(start, self._size)]
+        result: Dict[str, List[Any]] = {
+            "timestamp": [self._timestamps[slot] // 1000 for slot in slots]
+        }
+        for name, column in self._data.items():
+            result[name] = [self._value(column, slot) for slot in slots]
+        return result
+
+    # Pydantic integration: validate from a list of points, serialize to one
+
+    @classmethod
+    def _from_points(cls, points: List[Any]) -> "TimeSeriesBuffer":
+        return cls(points)
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, source: Any, handler: Any):
+        from_list = core_schema.no_info_after_validator_function(
+            cls._from_points,
+            core_schema.list_schema(handler.generate_schema(cls.point_model)),
+        )
+        return core_schema.json_or_python_schema(
+            json_schema=from_list,
+            python_schema=core_schema.union_schema(
+                [core_schema.is_instance_schema(cls), from_list]
+            ),
+            serialization=core_schema.plain_serializer_function_ser_schema(
+                lambda buffer: buffer.to_dicts()
+            ),
+        )
@@ -0,0 +1,103 @@
+"""
+Bounded Check Executor
+
+Runs health checks under a global concurrency cap and a per-host cap so a
+large number of services behind one reverse proxy can't flood it.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict
+from urllib.parse import urlsplit
+
+
+class CheckExecutor:
+    """Concurrency-limited executor with per-host fairness and wait metrics"""
+
+    def __init__(self, max_concurrency: int = 50, max_per_host: int = 6):
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self._global = asyncio.Semaphore(max_concurrency)
+        self._hosts: Dict[str, asyncio.Semaphore] = {}
+        self._host_waiting: Dict[str, int] = {}
+
+        # Metrics
+        self.queue_depth = 0  # Checks waiting for a slot
+        self.in_flight = 0  # Checks currently running
+        self.max_queue_depth = 0
+        self.total_checks = 0
+        self._wait_times: Deque[float] = deque(maxlen=1000)  # Recent waits (ms)
+
+    @staticmethod
+    def host_key(url: str) -> str:
+        """Normalize a URL to the scheme://host:port it is checked against"""
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}".lower()
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(self.max_per_host)
+        return self._hosts[host]
+
+    async def run(
+        self, url: str, func: Callable[..., Awaitable[Any]], *args: Any
+    ) -> Any:
+        """Run `func(*args)` once a host slot and a global slot are free.
+
+        The host slot is taken first so checks queued behind a busy host
+        never hold a global slot that other hosts could use.
+        """
+        host = self.host_key(url)
+        enqueued_at = time.monotonic()
+        self.queue_depth += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        self._host_waiting[host] = self._host_waiting.get(host, 0) + 1
+        queued = True
+
+        def dequeue() -> None:
+            nonlocal queued
+            queued = False
+            self.queue_depth -= 1
+            self._host_waiting[host] -= 1
+            if not self._host_waiting[host]:
+                del self._host_waiting[host]
+
+        try:
+            async with self._host_semaphore(host):
+                async with self._global:
+                    dequeue()
+                    self._wait_times.append((time.monotonic() - enqueued_at) * 1000)
+                    self.in_flight += 1
+                    self.total_checks += 1
+                    try:
+                        return await func(*args)
+                    finally:
+                        self.in_flight -= 1
+        finally:
+            # Cancelled while still waiting for a slot
+            if queued:
+                dequeue()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Snapshot of queue depth and wait-time metrics"""
+        waits = sorted(self._wait_times)
+        busiest = sorted(self._host_waiting.items(), key=lambda kv: -kv[1])[:5]
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_per_host": self.max_per_host,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "in_flight": self.in_flight,
+            "total_checks": self.total_checks,
+            "wait_ms_avg": round(sum(waits) / len(waits), 2) if waits else 0.0,
+            "wait_ms_p95": (
+                round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 2)
+                if waits
+                else 0.0
+            ),
+            "wait_ms_max": round(waits[-1], 2) if waits else 0.0,
+            "busiest_hosts": [
+                {"host": host, "waiting": waiting} for host, waiting in busiest
+            ],
+        }
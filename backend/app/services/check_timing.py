@@ -0,0 +1,53 @@
+"""
+Health Check Phase Timing
+
+Splits a check's response time into DNS, TCP connect, TLS and time to first
+byte using httpcore's trace extension and a monotonic clock.
+"""
+
+import time
+from typing import Any, Dict
+
+# httpcore trace event (without ".started"/".complete") -> timing field
+TRACE_PHASES = {
+    "connection.connect_tcp": "connect_time",
+    "connection.start_tls": "tls_time",
+    "http11.receive_response_headers": "ttfb_time",
+    "http2.receive_response_headers": "ttfb_time",
+}
+
+PHASE_FIELDS = ("dns_time", "connect_time", "tls_time", "ttfb_time")
+
+
+class PhaseTimer:
+    """Collects per-phase durations (ms) for one health check.
+
+    Pass the instance as the `trace` request extension. Phases only show up
+    when they happen: a pooled keep-alive connection has no connect or TLS
+    time, and httpcore resolves DNS inside connect_tcp, so DNS is only
+    measured separately by the TCP probe. Phases of redirect hops add up.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self._open: Dict[str, float] = {}
+
+    async def __call__(self, event_name: str, info: Dict[str, Any]) -> None:
+        prefix, _, stage = event_name.rpartition(".")
+        phase = TRACE_PHASES.get(prefix)
+        if phase is None:
+            return
+        if stage == "started":
+            self._open[phase] = time.perf_counter()
+        elif stage == "complete" and phase in self._open:
+            self.record(phase, self._open.pop(phase))
+
+    def record(self, phase: str, since: float) -> None:
+        """Add the time elapsed since the perf_counter value `since` to a phase"""
+        elapsed = (time.perf_counter() - since) * 1000
+        self.timings[phase] = self.timings.get(phase, 0.0) + elapsed
+
+    def elapsed(self) -> float:
+        """Milliseconds since the check started"""
+        return (time.perf_counter() - self.started) * 1000
@@ -0,0 +1,104 @@
+"""
+Database Maintenance Service
+
+Keeps the SQLite WAL in check with periodic passive checkpoints and runs
+PRAGMA optimize, incremental vacuum and a truncating checkpoint once a day
+in an off-peak hour. PostgreSQL runs its own checkpoints and autovacuum,
+so nothing is scheduled there.
+"""
+
+import asyncio
+import time
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Optional
+from zoneinfo import ZoneInfo
+from app.config import settings
+from app.database import db
+from app.utils.logger import logger
+
+
+class DatabaseMaintenance:
+    """Background job for WAL checkpoints and off-peak SQLite upkeep"""
+
+    def __init__(self):
+        self.checkpoint_interval = settings.DB_CHECKPOINT_INTERVAL
+        self.maintenance_hour = settings.DB_MAINTENANCE_HOUR
+        self.vacuum_pages = settings.DB_VACUUM_PAGES
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+        self.last_run: Dict[str, Any] = {}
+        self._last_maintenance: Optional[date] = None
+
+    @staticmethod
+    def _now() -> datetime:
+        """Current time in the configured timezone"""
+        try:
+            return datetime.now(ZoneInfo(settings.TZ))
+        except Exception:
+            return datetime.now(timezone.utc)
+
+    def maintenance_due(self) -> bool:
+        """True once per day during the configured maintenance hour"""
+        if self.maintenance_hour < 0:
+            return False
+        now = self._now()
+        return now.hour == self.maintenance_hour and now.date() != self._last_maintenance
+
+    def run_maintenance(self) -> Dict[str, Any]:
+        """Optimize, release free pages and truncate the WAL"""
+        started = time.monotonic()
+        db.optimize()
+        released = db.incremental_vacuum(self.vacuum_pages)
+        checkpoint = db.checkpoint("TRUNCATE")
+        elapsed = time.monotonic() - started
+
+        self._last_maintenance = self._now().date()
+        self.last_run = {
+            "pages_released": released,
+            "checkpoint_busy": checkpoint["busy"],
+            "seconds": round(elapsed, 4),
+            "at": datetime.now(timezone.utc).isoformat(),
+        }
+        logger.info(
+            f"Database maintenance released {released} pages "
+            f"in {elapsed * 1000:.1f}ms"
+        )
+        return self.last_run
+
+    async def start_maintenance_loop(self):
+        """Checkpoint every `checkpoint_interval` seconds, maintain once a day"""
+        if not db.is_sqlite:
+            # PostgreSQL checkpoints, vacuums and analyzes on its own
+            logger.info("Database maintenance not needed for PostgreSQL")
+            return
+        self.running = True
+        logger.info(
+            f"Starting database maintenance (checkpoint every "
+            f"{self.checkpoint_interval}s, maintenance hour {self.maintenance_hour})"
+        )
+
+        while self.running:
+            try:
+                await asyncio.sleep(self.checkpoint_interval)
+                if not self.running:
+                    break
+                # Off the event loop: a VACUUM or a busy checkpoint can take a while
+                if self.maintenance_due():
+                    await db.run(self.run_maintenance)
+                else:
+                    await db.run(db.checkpoint, "PASSIVE")
+            except asyncio.CancelledError:
+                logger.info("Database maintenance task cancelled")
+                break
+            except Exception as e:
+                logger.error(f"Error in database maintenance loop: {e}")
+
+    def stop(self):
+        """Stop the maintenance loop"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+
+
+# Global instance
+db_maintenance = DatabaseMaintenance()
@@ -0,0 +1,247 @@
+"""
+Single-Writer Database Queue
+
+All background writes go through one writer task and one writer thread, so
+SQLite never sees two writers at once. Small write jobs are grouped into one
+transaction, each in its own savepoint. The queue is bounded: when it's
+full, callers wait, which slows producers instead of growing memory.
+"""
+
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import db
+from app.utils.logger import logger
+
+
+class WriteJob(NamedTuple):
+    func: Callable[..., Any]
+    args: Tuple[Any, ...]
+    future: asyncio.Future
+    # Grouped jobs get a session and share a commit; exclusive jobs run
+    # alone and manage their own transactions
+    grouped: bool
+    enqueued_at: float
+
+
+def _p95(values: List[float]) -> float:
+    return round(values[min(len(values) - 1, int(len(values) * 0.95))], 2)
+
+
+class DatabaseWriter:
+    """Bounded queue of write jobs drained by a single writer"""
+
+    def __init__(self):
+        self.batch_size = settings.DB_WRITE_BATCH_SIZE
+        self.queue: asyncio.Queue[WriteJob] = asyncio.Queue(
+            maxsize=settings.DB_WRITE_QUEUE_SIZE
+        )
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+        # Exclusive job taken off the queue while filling a batch
+        self._held: Optional[WriteJob] = None
+
+        # Metrics
+        self.max_queue_depth = 0
+        self.total_jobs = 0
+        self.total_batches = 0
+        self.failed_jobs = 0
+        self.backpressure_waits = 0  # Submits that found the queue full
+        self._commit_times: Deque[float] = deque(maxlen=1000)  # ms
+        self._wait_times: Deque[float] = deque(maxlen=1000)  # ms
+        self._batch_sizes: Deque[int] = deque(maxlen=1000)
+
+    async def submit(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run `func(session, *args)` in the writer's next transaction.
+
+        `func` must not commit or roll back: the writer commits the whole
+        batch, and if `func` raises only its own savepoint is rolled back
+        and the exception is re-raised here. Return plain values, not ORM
+        objects.
+        """
+        if not self.running:
+            # No writer task (startup, shutdown, scripts): write directly
+            def direct(session: Session) -> Any:
+                result = func(session, *args)
+                session.commit()
+                return result
+
+            return await db.run_in_session(direct)
+        return await self._enqueue(func, args, grouped=True)
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """Run blocking `func(*args)` on the writer thread between batches.
+
+        For long jobs (retention, rollups) that open their own sessions and
+        commit in steps.
+        """
+        if not self.running:
+            return await db.run(func, *args)
+        return await self._enqueue(func, args, grouped=False)
+
+    async def _enqueue(
+        self, func: Callable[..., Any], args: Tuple[Any, ...], grouped: bool
+    ) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        if self.queue.full():
+            self.backpressure_waits += 1
+        await self.queue.put(WriteJob(func, args, future, grouped, time.monotonic()))
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        if not self.running:
+            # The writer stopped while this caller waited for queue space
+            self._fail_pending([])
+        return await future
+
+    async def _next_batch(self) -> List[WriteJob]:
+        """Wait for work: one exclusive job, or up to batch_size grouped jobs"""
+        if self._held is not None:
+            batch, self._held = [self._held], None
+            return batch
+
+        batch = [await self.queue.get()]
+        if not batch[0].grouped:
+            return batch
+        while len(batch) < self.batch_size and not self.queue.empty():
+            job = self.queue.get_nowait()
+            if not job.grouped:
+                self._held = job
+                break
+            batch.append(job)
+        return batch
+
+    def _commit(self, batch: List[WriteJob]) -> List[Tuple[bool, Any]]:
+        """Run grouped jobs in one transaction (on the writer thread)"""
+        outcomes: List[Tuple[bool, Any]] = []
+        session = db.get_session()
+        try:
+            if db.is_sqlite:
+                # Take the write lock up front; pysqlite wouldn't BEGIN before
+                # a SAVEPOINT, and releasing it would commit each job alone
+                session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            for job in batch:
+                try:
+                    with session.begin_nested():
+                        outcomes.append((True, job.func(session, *job.args)))
+                except Exception as e:
+                    outcomes.append((False, e))
+            started = time.monotonic()
+            session.commit()
+            self._commit_times.append((time.monotonic() - started) * 1000)
+        except Exception as e:
+            # The commit failed, so every job in the batch did
+            session.rollback()
+            logger.error(f"Database writer commit failed: {e}")
+            return [(False, e)] * len(batch)
+        finally:
+            session.close()
+        self._batch_sizes.append(len(batch))
+        return outcomes
+
+    def _run_exclusive(self, job: WriteJob) -> List[Tuple[bool, Any]]:
+        try:
+            return [(True, job.func(*job.args))]
+        except Exception as e:
+            return [(False, e)]
+
+    async def start_writer_loop(self):
+        """Drain the queue until stopped"""
+        self.running = True
+        loop = asyncio.get_running_loop()
+        logger.info(
+            f"Starting database writer (queue {self.queue.maxsize}, "
+            f"batches of {self.batch_size})"
+        )
+
+        batch: List[WriteJob] = []
+        execution: Optional[asyncio.Future] = None
+        while self.running:
+            try:
+                batch = await self._next_batch()
+                started = time.monotonic()
+                for job in batch:
+                    self._wait_times.append((started - job.enqueued_at) * 1000)
+
+                if batch[0].grouped:
+                    execution = loop.run_in_executor(self.executor, self._commit, batch)
+                else:
+                    execution = loop.run_in_executor(
+                        self.executor, self._run_exclusive, batch[0]
+                    )
+                self._deliver(batch, await asyncio.shield(execution))
+                batch, execution = [], None
+            except asyncio.CancelledError:
+                logger.info("Database writer task cancelled")
+                if execution is not None:
+                    # The thread finishes the batch regardless; report what
+                    # actually happened so callers don't retry committed work
+                    self._deliver(batch, await execution)
+                    batch = []
+                break
+            except Exception as e:
+                logger.error(f"Error in database writer loop: {e}")
+
+        self.running = False
+        self._fail_pending(batch)
+
+    def _deliver(self, batch: List[WriteJob], outcomes: List[Tuple[bool, Any]]):
+        """Resolve the callers' futures with their jobs' outcomes"""
+        self.total_batches += 1
+        self.total_jobs += len(batch)
+        for job, (ok, value) in zip(batch, outcomes):
+            if job.future.done():
+                continue
+            if ok:
+                job.future.set_result(value)
+            else:
+                self.failed_jobs += 1
+                job.future.set_exception(value)
+
+    def _fail_pending(self, batch: List[WriteJob]) -> None:
+        """Fail jobs left behind by a stopped writer so no caller hangs"""
+        pending = list(batch)
+        if self._held is not None:
+            pending.append(self._held)
+            self._held = None
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for job in pending:
+            if not job.future.done():
+                job.future.set_exception(RuntimeError("Database writer stopped"))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth, batch sizes and commit latency"""
+        commits = sorted(self._commit_times)
+        waits = sorted(self._wait_times)
+        sizes = list(self._batch_sizes)
+        return {
+            "running": self.running,
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "max_queue_depth": self.max_queue_depth,
+            "backpressure_waits": self.backpressure_waits,
+            "total_jobs": self.total_jobs,
+            "total_batches": self.total_batches,
+            "failed_jobs": self.failed_jobs,
+            "batch_size_avg": round(sum(sizes) / len(sizes), 2) if sizes else 0.0,
+            "commit_ms_avg": (
+                round(sum(commits) / len(commits), 2) if commits else 0.0
+            ),
+            "commit_ms_p95": _p95(commits) if commits else 0.0,
+            "wait_ms_avg": round(sum(waits) / len(waits), 2) if waits else 0.0,
+            "wait_ms_p95": _p95(waits) if waits else 0.0,
+        }
+
+    def stop(self):
+        """Stop the writer loop"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+
+
+# Global instance
+db_writer = DatabaseWriter()
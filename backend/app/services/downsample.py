@@ -0,0 +1,65 @@
+"""
+Time Series Downsampling
+
+Largest-Triangle-Three-Buckets (LTTB) over NumPy arrays: keeps the points
+that preserve a chart's visual shape, including its peaks and dips.
+"""
+
+from typing import Sequence
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the `n_out` points LTTB keeps from (x, y), sorted by x.
+
+    The first and last points are always kept. The points between them are
+    split into n_out - 2 equal buckets and from each bucket the point forming
+    the largest triangle with the previously kept point and the next bucket's
+    average is kept. Each bucket is scored in one vectorized step, so the
+    Python loop runs once per output point, not once per input point.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1][:n_out], dtype=np.int64)
+
+    # Relative x keeps the triangle areas well inside float precision
+    x = x.astype(np.float64) - float(x[0])
+    y = y.astype(np.float64)
+
+    # Bucket i covers [edges[i], edges[i + 1]) of the points 1..n-2
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    counts = np.diff(edges)
+    inner_x, inner_y = x[1 : n - 1], y[1 : n - 1]
+    avg_x = np.append(np.add.reduceat(inner_x, edges[:-1] - 1) / counts, x[-1])
+    avg_y = np.append(np.add.reduceat(inner_y, edges[:-1] - 1) / counts, y[-1])
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        area = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def lttb_multi(x: np.ndarray, ys: Sequence[np.ndarray], n_out: int) -> np.ndarray:
+    """Sorted indices kept when several series share one x axis.
+
+    Each series gets an equal share of the point budget and the kept points
+    are merged, so a peak in any series survives. Never returns more than
+    `n_out` indices.
+    """
+    if n_out >= len(x):
+        return np.arange(len(x))
+    share = max(3, n_out // len(ys))
+    kept = np.unique(np.concatenate([lttb(x, y, share) for y in ys]))
+    if len(kept) > n_out:
+        # Budget too small for three points per series
+        kept = kept[np.linspace(0, len(kept) - 1, n_out).astype(np.int64)]
+    return kept
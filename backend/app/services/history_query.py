@@ -0,0 +1,206 @@
+"""
+History Range Queries
+
+Reads a service's response, traffic or storage history for a time range
+from the database with keyset pagination and downsamples it with LTTB, so
+the payload stays bounded however long the range is.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+import numpy as np
+from pydantic import BaseModel
+from sqlalchemy import String, select, tuple_, type_coerce
+from app.database import db
+from app.models.service import ResponseTimeHistory, TrafficHistory
+from app.models.storage import StorageHistory
+from app.models.timeseries import TimeSeriesBuffer
+from app.services.downsample import lttb_multi
+from app.services.persistence import HISTORY_SERIES, to_naive_utc
+from app.services.rollups import ROLLUP_METRICS
+from app.services.tsdb import last_occurrences, to_micros, tsdb
+
+# Series -> buffer class, whose columns and point model match the table
+SERIES_BUFFERS: Dict[str, Type[TimeSeriesBuffer]] = {
+    "response": ResponseTimeHistory,
+    "traffic": TrafficHistory,
+    "storage": StorageHistory,
+}
+
+# Rows fetched per keyset page
+PAGE_SIZE = 5000
+
+# Buffer typecodes read into float64 arrays (None becomes NaN)
+FLOAT_TYPECODES = ("d", "f")
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Range used when the caller gives no `from`
+DEFAULT_SPAN = timedelta(hours=24)
+
+# Point budget when the caller gives none, and the most a caller may ask for
+DEFAULT_MAX_POINTS = 500
+MAX_POINTS_LIMIT = 5000
+
+
+def resolve_range(
+    start: Optional[datetime], end: Optional[datetime]
+) -> Tuple[datetime, datetime]:
+    """Fill in a default range (the last 24 hours) and make both ends aware.
+
+    Naive timestamps are taken as UTC. Raises ValueError if start >= end.
+    """
+    end = end or datetime.now(timezone.utc)
+    start = start or end - DEFAULT_SPAN
+    start, end = (
+        dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc) for dt in (start, end)
+    )
+    if start >= end:
+        raise ValueError("'from' must be before 'to'")
+    return start, end
+
+
+def _read_columns(
+    service_id: str, series: str, start: datetime, end: datetime
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """All rows of one series in [start, end) as epoch microseconds and
+    column arrays.
+
+    Pages through the (service_id, timestamp) index by (timestamp, id)
+    instead of OFFSET, so every page is a bounded index range scan and
+    memory holds arrays rather than row objects. Series kept in time-series
+    segments are read from their day files instead.
+    """
+    if tsdb.handles(series):
+        return tsdb.read_range(series, service_id, to_micros(start), to_micros(end))
+
+    table = HISTORY_SERIES[series][0]
+    columns = SERIES_BUFFERS[series].columns
+    names = [name for name, _ in columns]
+    # SQLite timestamps come back as stored and are parsed by NumPy in one
+    # call per page, instead of one datetime per row; PostgreSQL drivers
+    # already return datetimes
+    timestamp = (
+        type_coerce(table.timestamp, String) if db.is_sqlite else table.timestamp
+    )
+
+    timestamps: List[np.ndarray] = []
+    values: Dict[str, List[Any]] = {name: [] for name in names}
+    cursor: Optional[Tuple[Any, int]] = None
+
+    with db.engine.connect() as conn:
+        while True:
+            query = select(
+                timestamp, table.id, *(getattr(table, name) for name in names)
+            ).where(table.service_id == service_id, table.timestamp < end)
+            # The cursor replaces the start bound rather than adding to it:
+            # given two lower bounds SQLite seeks to one and filters the other
+            if cursor is None:
+                query = query.where(table.timestamp >= start)
+            else:
+                query = query.where(tuple_(timestamp, table.id) > cursor)
+            rows = conn.execute(
+                query.order_by(table.timestamp, table.id).limit(PAGE_SIZE)
+            ).all()
+            if not rows:
+                break
+
+            page = list(zip(*rows))
+            timestamps.append(
+                np.array(page[0], dtype="datetime64[us]").astype(np.int64)
+            )
+            for (name, typecode), column in zip(columns, page[2:]):
+                values[name].append(
+                    np.array(column, dtype=np.float64)  # None becomes NaN
+                    if typecode in FLOAT_TYPECODES
+                    # Integers and strings stay Python objects
+                    else np.array(column, dtype=object)
+                )
+
+            cursor = (rows[-1][0], rows[-1][1])
+            if len(rows) < PAGE_SIZE:
+                break
+
+    if not timestamps:
+        return np.empty(0, dtype=np.int64), {name: np.empty(0) for name in names}
+    return np.concatenate(timestamps), {
+        name: np.concatenate(chunks) for name, chunks in values.items()
+    }
+
+
+def _merge_points(
+    series: str, x: np.ndarray, columns: Dict[str, Any], points: Sequence[BaseModel]
+) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """Add data points to columns read from storage, in time order; a point
+    replaces a stored row with the same timestamp"""
+    if not points:
+        return x, columns
+    x = np.concatenate(
+        [x, np.array([to_micros(point.timestamp) for point in points], np.int64)]
+    )
+    merged = {}
+    for name, typecode in SERIES_BUFFERS[series].columns:
+        values = [getattr(point, name) for point in points]
+        merged[name] = np.concatenate(
+            [
+                columns[name],
+                np.array(
+                    values,
+                    dtype=np.float64 if typecode in FLOAT_TYPECODES else object,
+                ),
+            ]
+        )
+    keep = last_occurrences(x)
+    return x[keep], {name: column[keep] for name, column in merged.items()}
+
+
+def query_history(
+    service_id: str,
+    series: str,
+    start: datetime,
+    end: datetime,
+    max_points: int,
+    unflushed: Sequence[BaseModel] = (),
+) -> List[BaseModel]:
+    """History points of one series in [start, end), at most `max_points`.
+
+    `unflushed` are the service's in-memory points the write-behind flush
+    hasn't written yet (persistence.unflushed()); those in range are merged
+    in, so a point shows up as soon as it is posted. Longer results are
+    reduced with LTTB over the series' rollup metrics (e.g. bandwidth up
+    and down), so the kept points are real samples that preserve the
+    chart's shape. Blocking; call it through db.run().
+    """
+    buffer = SERIES_BUFFERS[series]
+    x, columns = _read_columns(
+        service_id, series, to_naive_utc(start), to_naive_utc(end)  # type: ignore
+    )
+    x, columns = _merge_points(
+        series,
+        x,
+        columns,
+        [point for point in unflushed if start <= point.timestamp < end],
+    )
+
+    if len(x) > max_points:
+        ys = [np.nan_to_num(columns[metric]) for metric in ROLLUP_METRICS[series]]
+        kept = lttb_multi(x, ys, max_points)
+        x = x[kept]
+        columns = {name: column[kept] for name, column in columns.items()}
+
+    model = buffer.point_model
+    floats = {name for name, typecode in buffer.columns if typecode in FLOAT_TYPECODES}
+    return [
+        model(
+            timestamp=EPOCH + timedelta(microseconds=int(micros)),
+            **{
+                name: (
+                    (None if np.isnan(column[i]) else float(column[i]))
+                    if name in floats
+                    else column[i]
+                )
+                for name, column in columns.items()
+            },
+        )
+        for i, micros in enumerate(x)
+    ]
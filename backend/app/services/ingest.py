@@ -0,0 +1,108 @@
+"""
+Batched Sample Ingest
+
+Stores arrays of timestamped agent samples (an agent's local backlog, or a
+relay's samples for many hosts) with their original timestamps. The newest
+samples past a service's in-memory history are appended to it and written
+by a flush; older ones, and any that wouldn't fit in the ring buffer, go
+straight to the history table. Buckets the rollups already aggregated are
+reopened so late samples are counted, as far back as raw history still
+covers them.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+from sqlalchemy.orm import Session
+from app.models.service import Service
+from app.services.db_writer import db_writer
+from app.services.persistence import persistence, HISTORY_SERIES
+from app.services.rollups import history_rollups
+from app.utils.logger import logger
+
+# How far ahead of the server clock a sample may be
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+
+
+def normalize_timestamps(timestamps: List[datetime]) -> List[datetime]:
+    """Make sample timestamps aware UTC (naive means UTC).
+
+    Timestamps slightly ahead of the server clock are taken as now, so
+    in-memory history stays in order, each a microsecond before the next so
+    they stay distinct points; raises ValueError if any is more than
+    MAX_CLOCK_SKEW ahead.
+    """
+    now = datetime.now(timezone.utc)
+    aware = [dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc) for dt in timestamps]
+    future = sum(1 for dt in aware if dt > now + MAX_CLOCK_SKEW)
+    if future:
+        raise ValueError(
+            f"{future} sample(s) are more than "
+            f"{int(MAX_CLOCK_SKEW.total_seconds() // 60)} minutes in the future"
+        )
+    ahead = sorted((dt, index) for index, dt in enumerate(aware) if dt > now)
+    for rank, (_, index) in enumerate(ahead):
+        aware[index] = now - timedelta(microseconds=len(ahead) - 1 - rank)
+    return aware
+
+
+async def ingest_history(
+    series: str, points: Dict[str, List[Any]], services: Dict[str, Service]
+) -> Dict[str, int]:
+    """Store history points per service id (data point models, aware UTC).
+
+    Returns how many points were appended to memory and how many were
+    written directly.
+    """
+    attr = HISTORY_SERIES[series][1]
+    direct: Dict[str, List[Any]] = {}
+    appended = 0
+    for service_id, service_points in points.items():
+        history = getattr(services[service_id], attr)
+        newest = history[-1].timestamp if history else None
+        # The history table keeps one point per timestamp, so memory does too
+        # (the batch's last)
+        latest = {point.timestamp: point for point in service_points}
+        ordered = sorted(latest.values(), key=lambda point: point.timestamp)
+        # Appending more than this could push unsaved points out of the
+        # ring buffer before the flush reaches them
+        room = history.capacity // 2
+        fresh = [p for p in ordered if newest is None or p.timestamp > newest]
+        keep = fresh[-room:]
+        for point in keep:
+            history.append(point)
+        appended += len(keep)
+        older = ordered[: len(ordered) - len(keep)]
+        if older:
+            direct[service_id] = older
+        persistence.mark_dirty(services[service_id])
+
+    # Persist now rather than with the next flush, so every point is in the
+    # database before the rollup buckets are reopened
+    await persistence.flush(list(points))
+    oldest = min(point.timestamp for group in points.values() for point in group)
+    await db_writer.submit(_store_direct, series, direct, list(points), oldest)
+
+    direct_count = sum(len(group) for group in direct.values())
+    if direct_count:
+        logger.debug(f"Stored {direct_count} late {series} samples directly")
+    return {"appended": appended, "direct": direct_count}
+
+
+def _store_direct(
+    session: Session,
+    series: str,
+    direct: Dict[str, List[Any]],
+    service_ids: List[str],
+    oldest: datetime,
+) -> None:
+    """Insert points kept out of memory and reopen rollup buckets (a
+    database writer job)"""
+    # Before the insert, so the late points don't count as raw history
+    # still covering older buckets
+    history_rollups.rewind(session, series, service_ids, oldest)
+    for service_id, service_points in direct.items():
+        # No cursors: these points are not in the ring buffer, so the flush
+        # never sees them
+        persistence.insert_history(
+            series, service_id, service_points, session=session
+        )
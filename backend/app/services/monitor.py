@@ -1,28 +1,54 @@
 import httpx
 import asyncio
+import json
+import random
+import socket
+import time
 from datetime import datetime, timezone
-from typing import List, Dict, TYPE_CHECKING
-from sqlalchemy import desc
-from app.models.service import (
-    Service,
-    ResponseTimeDataPoint,
-    TrafficMetrics,
-    TrafficDataPoint,
-)
-from app.models.storage import StorageMetrics, StorageDataPoint
-from app.database import (
-    db,
-    ServiceDB,
-    ResponseHistoryDB,
-    TrafficHistoryDB,
-    StorageHistoryDB,
-)
+from typing import Any, List, Dict, Optional, Set, TYPE_CHECKING
+from urllib.parse import urlsplit
+from sqlalchemy import desc, func, select
+from app.models.service import MIN_CHECK_INTERVAL, Service, TrafficMetrics
+from app.models.storage import StorageMetrics
+from app.models.timeseries import HISTORY_CAPACITY
+from app.database import db, HistoryRollupDB, ServiceDB
 from app.utils.logger import logger
 from app.services.notifications import notification_service
+from app.services.scheduler import CheckScheduler
+from app.services.check_executor import CheckExecutor
+from app.services.check_timing import PhaseTimer, PHASE_FIELDS
+from app.services.db_writer import db_writer
+from app.services.persistence import persistence, HISTORY_SERIES
+from app.services.storage_snapshot import decode, join_storage
+from app.services.tsdb import tsdb
+
+# HTTP/2 is only negotiated when the optional h2 package is installed
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
 if TYPE_CHECKING:
     from sqlalchemy.orm import Session
 
+# Series -> history table columns loaded besides the timestamp
+HISTORY_POINTS = {
+    "response": ("response_time",) + PHASE_FIELDS,
+    "traffic": ("bandwidth_up", "bandwidth_down", "total_up", "total_down"),
+    "storage": (
+        "hostname",
+        "total_capacity",
+        "total_used",
+        "total_free",
+        "average_usage_percent",
+        "raid_healthy",
+        "raid_degraded",
+        "raid_failed",
+    ),
+}
+
 
 class ServiceMonitor:
     """Service monitoring system to check online/offline status"""
@@ -31,80 +57,240 @@ class ServiceMonitor:
         self.services: Dict[str, Service] = {}
         self._monitoring_task = None
         self._running = False
+
+        # Shared HTTP client pool for health checks (created lazily)
+        self._client: Optional[httpx.AsyncClient] = None
+        self.check_timeout = 10.0  # seconds
+        self.max_connections = 100  # Total pooled connections
+        self.keepalive_expiry = 30.0  # Longer than the check interval
+        self.http2 = HTTP2_AVAILABLE
+        self.max_body_bytes = 64 * 1024  # Body read limit for keyword checks
+        self.keepalive_body_bytes = 16 * 1024  # Drain bodies up to this size
+
+        # Bounded check concurrency (global cap + per-host cap)
+        self._executor = CheckExecutor(max_concurrency=50, max_per_host=6)
+        self.last_sweep_duration: Optional[float] = None  # seconds
+
+        # Per-service check scheduling
+        self._scheduler = CheckScheduler()
+        self._check_tasks: Set[asyncio.Task] = set()
+        self._offline_streaks: Dict[str, int] = {}
+        self.default_interval = 60.0  # Used when a service has no check_interval
+        self.recheck_interval = 5.0  # Re-check soon after a status change
+        self.max_backoff = 600.0  # Cap for offline exponential backoff
+        self.jitter = 0.1  # +/- fraction applied to every delay
+
+        # History points kept in memory per series; loaded rows waiting to be
+        # copied into the history buffers on first access
+        self.history_limit = HISTORY_CAPACITY
+        self._unhydrated: Dict[str, Dict[str, List[tuple]]] = {}
+
         self._load_services()
 
-    def add_service(self, service: Service) -> None:
+    async def add_service(self, service: Service) -> None:
         """Add a service to monitor"""
         self.services[service.id] = service
         logger.info(f"Added service: {service.name} ({service.url})")
-        self._save_service(service)
+        await self._save_service(service)
+        if self._running:
+            self._scheduler.schedule(service.id, self._next_delay(service, None))
 
-    def remove_service(self, service_id: str) -> None:
+    async def remove_service(self, service_id: str) -> None:
         """Remove a service from monitoring"""
         if service_id in self.services:
             service = self.services.pop(service_id)
+            self._scheduler.unschedule(service_id)
+            self._offline_streaks.pop(service_id, None)
+            self._unhydrated.pop(service_id, None)
+            persistence.forget(service_id)
             logger.info(f"Removed service: {service.name}")
 
             # Delete from database
-            session = db.get_session()
             try:
-                db_service = (
-                    session.query(ServiceDB).filter(ServiceDB.id == service_id).first()
-                )
-                if db_service:
-                    session.delete(db_service)
-                    session.commit()
+                await db.run_in_session(self._delete_service, service_id)
             except Exception as e:
-                session.rollback()
                 logger.error(f"Failed to delete service from database: {e}")
-            finally:
-                session.close()
+            if tsdb.enabled:
+                # On the writer thread, after any append still queued
+                await db_writer.run(tsdb.drop_service, service_id)
+
+    @staticmethod
+    def _delete_service(session: "Session", service_id: str) -> None:
+        db_service = session.query(ServiceDB).filter(ServiceDB.id == service_id).first()
+        if db_service:
+            session.delete(db_service)
+            session.query(HistoryRollupDB).filter(
+                HistoryRollupDB.service_id == service_id
+            ).delete(synchronize_session=False)
+            session.commit()
 
     def get_service(self, service_id: str) -> Service | None:
         """Get a service by ID"""
-        return self.services.get(service_id)
+        service = self.services.get(service_id)
+        return self._hydrate(service) if service else None
 
     def get_all_services(self) -> List[Service]:
         """Get all monitored services"""
-        return list(self.services.values())
+        return [self._hydrate(service) for service in self.services.values()]
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Get the shared health check client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.check_timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                http2=self.http2,
+            )
+            logger.debug(
+                f"Created health check client pool "
+                f"(max {self.max_connections} connections, http2={self.http2})"
+            )
+        return self._client
+
+    async def close(self) -> None:
+        """Close the shared health check client and its pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            logger.debug("Closed health check client pool")
+
+    def _probe_mode(self, service: Service) -> str:
+        """Resolve the probe used for a service ("auto" depends on its type)"""
+        if service.probe != "auto":
+            return service.probe
+        return "tcp" if service.type == "server" else "get"
+
+    async def _probe(
+        self, service: Service, timeout: float, timer: PhaseTimer
+    ) -> str | None:
+        """Probe a service, returning None if healthy or a problem description.
+
+        Connection failures raise so the caller can mark the service offline.
+        Phase timings are collected into `timer`.
+        """
+        mode = self._probe_mode(service)
+        if mode == "tcp":
+            await self._probe_tcp(service.url, timeout, timer)
+            return None
+
+        client = self._get_client()
+        extensions = {"trace": timer}
+        if mode == "head" and not service.probe_keyword:
+            response = await client.head(
+                service.url,
+                follow_redirects=True,
+                timeout=timeout,
+                extensions=extensions,
+            )
+            # Some servers don't implement HEAD; fall back to a streaming GET
+            if response.status_code not in (405, 501):
+                return self._status_problem(response.status_code)
+
+        async with client.stream(
+            "GET",
+            service.url,
+            follow_redirects=True,
+            timeout=timeout,
+            extensions=extensions,
+        ) as response:
+            problem = self._status_problem(response.status_code)
+            if problem is None and service.probe_keyword:
+                return await self._find_keyword(response, service.probe_keyword)
+
+            # Small bodies are drained so the connection can be reused;
+            # anything larger is closed as soon as the headers are in
+            length = response.headers.get("content-length", "")
+            if length.isdigit() and int(length) <= self.keepalive_body_bytes:
+                await response.aread()
+        return problem
+
+    @staticmethod
+    def _status_problem(status_code: int) -> str | None:
+        return None if status_code < 400 else f"returned status {status_code}"
+
+    async def _find_keyword(self, response: httpx.Response, keyword: str) -> str | None:
+        """Read at most max_body_bytes of the body looking for `keyword`"""
+        needle = keyword.encode()
+        body = b""
+        async for chunk in response.aiter_bytes():
+            body += chunk
+            if needle in body:
+                return None
+            if len(body) >= self.max_body_bytes:
+                break
+        return f"response is missing keyword '{keyword}'"
+
+    @staticmethod
+    async def _probe_tcp(url: str, timeout: float, timer: PhaseTimer) -> None:
+        """Open (and immediately close) a TCP connection to the service"""
+        parts = urlsplit(url if "://" in url else f"tcp://{url}")
+        port = parts.port or {"http": 80, "https": 443}.get(parts.scheme)
+        if not parts.hostname or not port:
+            raise ValueError(f"No host and port to connect to in {url}")
+
+        # Resolve separately so DNS and connect time can be told apart
+        since = time.perf_counter()
+        addresses = await asyncio.wait_for(
+            asyncio.get_running_loop().getaddrinfo(
+                parts.hostname, port, type=socket.SOCK_STREAM
+            ),
+            timeout=timeout,
+        )
+        timer.record("dns_time", since)
+
+        since = time.perf_counter()
+        address = addresses[0][4]
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(address[0], address[1]), timeout=timeout
+        )
+        timer.record("connect_time", since)
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except Exception:
+            pass
 
     async def check_service(self, service: Service) -> None:
-        """Check a single service status"""
+        """Check a single service status (bounded by the check executor)"""
+        await self._executor.run(service.url, self._check_service, service)
+
+    async def _check_service(self, service: Service) -> None:
+        """Run the actual health check for a single service"""
         # Store old status for notification
         old_status = service.status
         new_status = old_status
         response_time = None
+        timer = PhaseTimer()
 
         try:
-            start_time = datetime.now(timezone.utc)
-
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.get(service.url, follow_redirects=True)
-
-                end_time = datetime.now(timezone.utc)
-                response_time = (end_time - start_time).total_seconds() * 1000
-
-                if response.status_code < 400:
-                    new_status = "online"
-                    service.status = new_status
-                    service.response_time = response_time
-                    logger.debug(
-                        f"Service {service.name} is online ({response_time:.2f}ms)"
-                    )
-                else:
-                    new_status = "problem"
-                    service.status = new_status
-                    service.response_time = response_time
-                    logger.warning(
-                        f"Service {service.name} returned status {response.status_code}"
-                    )
+            problem = await self._probe(
+                service, service.check_timeout or self.check_timeout, timer
+            )
+            response_time = timer.elapsed()
+
+            if problem is None:
+                new_status = "online"
+                service.status = new_status
+                service.response_time = response_time
+                logger.debug(
+                    f"Service {service.name} is online ({response_time:.2f}ms)"
+                )
+            else:
+                new_status = "problem"
+                service.status = new_status
+                service.response_time = response_time
+                logger.warning(f"Service {service.name} {problem}")
 
-                service.last_check = datetime.now(timezone.utc)
+            service.last_check = datetime.now(timezone.utc)
 
-                # Add response time to history
-                self._add_response_time(service, response_time)
+            # Add response time to history
+            self._add_response_time(service, response_time, timer.timings)
 
-        except httpx.TimeoutException:
+        except (httpx.TimeoutException, asyncio.TimeoutError):
             new_status = "problem"
             service.status = new_status
             service.last_check = datetime.now(timezone.utc)
@@ -138,125 +324,148 @@ class ServiceMonitor:
         if not self.services:
             return
 
-        tasks = [self.check_service(service) for service in self.services.values()]
+        started = time.monotonic()
+        tasks = [self.check_service(service) for service in self.get_all_services()]
         await asyncio.gather(*tasks)
+        self.last_sweep_duration = time.monotonic() - started
 
         # Save after all services are checked
-        self._save_all_services()
-        logger.debug(f"Checked {len(tasks)} services")
+        await self._save_all_services()
+        logger.debug(
+            f"Checked {len(tasks)} services in {self.last_sweep_duration:.2f}s"
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get scheduler and check executor metrics"""
+        return {
+            "services": len(self.services),
+            "scheduled": len(self._scheduler),
+            "running": self._running,
+            "last_sweep_seconds": (
+                round(self.last_sweep_duration, 3)
+                if self.last_sweep_duration is not None
+                else None
+            ),
+            "executor": self._executor.get_stats(),
+        }
 
     async def start_monitoring(self, interval: int = 60) -> None:
-        """Start monitoring all services at specified interval (seconds)"""
+        """Start monitoring services, each on its own schedule.
+
+        `interval` is the default for services without a check_interval.
+        """
+        self.default_interval = float(interval)
         self._running = True
-        logger.info(f"Starting service monitoring (interval: {interval}s)")
+        logger.info(f"Starting service monitoring (default interval: {interval}s)")
 
-        while self._running:
-            await self.check_all_services()
-            await asyncio.sleep(interval)
+        # Spread the first round of checks over one interval
+        for service in self.services.values():
+            base = service.check_interval or self.default_interval
+            self._scheduler.schedule(service.id, random.uniform(0, base))
+
+        try:
+            while self._running:
+                for service_id in self._scheduler.pop_due():
+                    service = self.get_service(service_id)
+                    if service is None:
+                        continue
+                    task = asyncio.create_task(self._run_scheduled_check(service))
+                    self._check_tasks.add(task)
+                    task.add_done_callback(self._check_tasks.discard)
+                await self._scheduler.wait()
+        finally:
+            for task in list(self._check_tasks):
+                task.cancel()
+            self._scheduler.clear()
+            await self.close()
+
+    def reschedule(self, service: Service) -> None:
+        """Reschedule a service after its check settings changed"""
+        if self._running and service.id in self.services:
+            self._scheduler.schedule(service.id, self._next_delay(service, None))
 
     def stop_monitoring(self) -> None:
         """Stop monitoring services"""
         self._running = False
         logger.info("Stopping service monitoring")
 
-    def _add_response_time(self, service: Service, response_time: float) -> None:
-        """Add a response time data point to service history"""
-        data_point = ResponseTimeDataPoint(
-            timestamp=datetime.now(timezone.utc), response_time=response_time
-        )
-
-        service.response_history.append(data_point)
+    async def _run_scheduled_check(self, service: Service) -> None:
+        """Run one scheduled check, persist it and schedule the next one"""
+        previous_status = service.status
+        try:
+            await self.check_service(service)
+            persistence.mark_dirty(service)
+        except Exception as e:
+            logger.error(f"Scheduled check failed for {service.name}: {e}")
+        finally:
+            if self._running and service.id in self.services:
+                self._scheduler.schedule(
+                    service.id, self._next_delay(service, previous_status)
+                )
 
-        # Keep last 100 points in memory
-        if len(service.response_history) > 100:
-            service.response_history = service.response_history[-100:]
+    def _next_delay(self, service: Service, previous_status: str | None) -> float:
+        """Compute the delay until a service's next check.
+
+        Status changes are confirmed quickly, services that stay offline back
+        off exponentially, and every delay is jittered to avoid bursts.
+        """
+        base = float(service.check_interval or self.default_interval)
+
+        if service.status == "offline":
+            streak = self._offline_streaks.get(service.id, 0) + 1
+            self._offline_streaks[service.id] = streak
+        else:
+            streak = 0
+            self._offline_streaks.pop(service.id, None)
+
+        if previous_status is not None and service.status != previous_status:
+            delay = min(base, self.recheck_interval)
+        elif streak > 1:
+            delay = min(base * 2 ** (streak - 1), max(self.max_backoff, base))
+        else:
+            delay = base
+
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _add_response_time(
+        self,
+        service: Service,
+        response_time: float,
+        timings: Dict[str, float] | None = None,
+    ) -> None:
+        """Add a response time data point (with phase timings) to service history"""
+        service.response_history.append_values(
+            datetime.now(timezone.utc), response_time=response_time, **(timings or {})
+        )
 
     def _load_services(self) -> None:
-        """Load services from database"""
+        """Load services from database.
+
+        Service rows are loaded in one query and the recent history of every
+        service in one windowed query per table. History points are kept as
+        raw rows and only turned into models when a service is first accessed.
+        """
         session = db.get_session()
         try:
             db_services = session.query(ServiceDB).all()
+            self._import_segments(session)
 
-            for db_service in db_services:
-                # Load response history (last 100 points)
-                response_history = (
-                    session.query(ResponseHistoryDB)
-                    .filter(ResponseHistoryDB.service_id == db_service.id)
-                    .order_by(desc(ResponseHistoryDB.timestamp))
-                    .limit(100)
-                    .all()
-                )
-
-                # Load traffic history (last 100 points)
-                traffic_history = (
-                    session.query(TrafficHistoryDB)
-                    .filter(TrafficHistoryDB.service_id == db_service.id)
-                    .order_by(desc(TrafficHistoryDB.timestamp))
-                    .limit(100)
-                    .all()
-                )
-
-                # Load storage history (last 100 points)
-                storage_history = (
-                    session.query(StorageHistoryDB)
-                    .filter(StorageHistoryDB.service_id == db_service.id)
-                    .order_by(desc(StorageHistoryDB.timestamp))
-                    .limit(100)
-                    .all()
+            recent_history = {
+                series: (
+                    self._load_recent_segments(series, db_services)
+                    if tsdb.handles(series)
+                    else self._load_recent_history(session, series)
                 )
+                for series in HISTORY_POINTS
+            }
 
-                # Convert to Pydantic models
-                response_data = [
-                    ResponseTimeDataPoint(
-                        timestamp=(
-                            r.timestamp.replace(tzinfo=timezone.utc)  # type: ignore
-                            if r.timestamp
-                            else datetime.now(timezone.utc)
-                        ),
-                        response_time=float(r.response_time),  # type: ignore
-                    )
-                    for r in reversed(
-                        response_history
-                    )  # Reverse to get chronological order
-                ]
-
-                traffic_data = [
-                    TrafficDataPoint(
-                        timestamp=(
-                            t.timestamp.replace(tzinfo=timezone.utc)  # type: ignore
-                            if t.timestamp
-                            else datetime.now(timezone.utc)
-                        ),
-                        bandwidth_up=float(t.bandwidth_up),  # type: ignore
-                        bandwidth_down=float(t.bandwidth_down),  # type: ignore
-                        total_up=float(t.total_up),  # type: ignore
-                        total_down=float(t.total_down),  # type: ignore
-                    )
-                    for t in reversed(
-                        traffic_history
-                    )  # Reverse to get chronological order
-                ]
-
-                storage_data = [
-                    StorageDataPoint(
-                        timestamp=(
-                            s.timestamp.replace(tzinfo=timezone.utc)  # type: ignore
-                            if s.timestamp
-                            else datetime.now(timezone.utc)
-                        ),
-                        hostname=str(s.hostname),  # type: ignore
-                        total_capacity=float(s.total_capacity),  # type: ignore
-                        total_used=float(s.total_used),  # type: ignore
-                        total_free=float(s.total_free),  # type: ignore
-                        average_usage_percent=float(s.average_usage_percent),  # type: ignore
-                        raid_healthy=int(s.raid_healthy),  # type: ignore
-                        raid_degraded=int(s.raid_degraded),  # type: ignore
-                        raid_failed=int(s.raid_failed),  # type: ignore
-                    )
-                    for s in reversed(
-                        storage_history
-                    )  # Reverse to get chronological order
-                ]
+            for db_service in db_services:
+                service_id = str(db_service.id)
+                pending = {
+                    series: rows[service_id]
+                    for series, rows in recent_history.items()
+                    if service_id in rows
+                }
 
                 # Build traffic metrics
                 traffic_metrics = None
@@ -274,75 +483,9 @@ class ServiceMonitor:
                         ),
                     )
 
-                # Build storage metrics from saved JSON data
-                storage_metrics = None
-                if hasattr(db_service, "storage_data") and db_service.storage_data:
-                    # Load full storage data from JSON
-                    import json
-
-                    try:
-                        storage_dict = json.loads(db_service.storage_data)  # type: ignore
-                        # Convert datetime strings back to datetime objects
-                        if storage_dict.get("last_updated"):
-                            # Parse ISO format datetime string
-                            last_updated_str = storage_dict["last_updated"]
-                            # Handle both formats: with and without milliseconds
-                            if "." in last_updated_str:
-                                # Has microseconds
-                                last_updated = datetime.fromisoformat(
-                                    last_updated_str.replace("Z", "+00:00")
-                                )
-                            else:
-                                # No microseconds
-                                last_updated = datetime.fromisoformat(
-                                    last_updated_str.replace("Z", "+00:00")
-                                )
-                            storage_dict["last_updated"] = last_updated.replace(
-                                tzinfo=timezone.utc
-                            )
-                        storage_metrics = StorageMetrics(**storage_dict)
-                    except Exception as e:
-                        logger.warning(
-                            f"Failed to load storage data for {db_service.name}: {e}"
-                        )
-                        # Fallback to empty storage metrics
-                        if (
-                            hasattr(db_service, "storage_last_updated")
-                            and db_service.storage_last_updated
-                        ):
-                            storage_metrics = StorageMetrics(
-                                hostname=str(db_service.storage_hostname) if hasattr(db_service, "storage_hostname") and db_service.storage_hostname else "unknown",  # type: ignore
-                                storage_paths=[],
-                                raid_arrays=[],
-                                zfs_pools=[],
-                                disks=[],
-                                last_updated=(
-                                    db_service.storage_last_updated.replace(tzinfo=timezone.utc)  # type: ignore
-                                    if db_service.storage_last_updated
-                                    else None
-                                ),
-                            )
-                elif (
-                    hasattr(db_service, "storage_last_updated")
-                    and db_service.storage_last_updated
-                ):
-                    # Fallback if no storage_data but last_updated exists
-                    storage_metrics = StorageMetrics(
-                        hostname=str(db_service.storage_hostname) if hasattr(db_service, "storage_hostname") and db_service.storage_hostname else "unknown",  # type: ignore
-                        storage_paths=[],
-                        raid_arrays=[],
-                        zfs_pools=[],
-                        disks=[],
-                        last_updated=(
-                            db_service.storage_last_updated.replace(tzinfo=timezone.utc)  # type: ignore
-                            if db_service.storage_last_updated
-                            else None
-                        ),
-                    )
-
-                # Create Service model
+                # Create Service model (history is hydrated on first access)
                 service = Service(
-                    id=str(db_service.id),  # type: ignore
+                    id=service_id,
                     name=str(db_service.name),  # type: ignore
                     url=str(db_service.url),  # type: ignore
                     type=str(db_service.type),  # type: ignore
@@ -356,14 +499,34 @@ class ServiceMonitor:
                     description=str(db_service.description) if db_service.description else None,  # type: ignore
                     icon=str(db_service.icon) if db_service.icon else None,  # type: ignore
                     group=str(db_service.group) if db_service.group else None,  # type: ignore
+                    # Values the API no longer accepts fall back to defaults
+                    check_interval=(
+                        int(db_service.check_interval)  # type: ignore
+                        if (db_service.check_interval or 0) >= MIN_CHECK_INTERVAL
+                        else None
+                    ),
+                    check_timeout=(
+                        float(db_service.check_timeout)  # type: ignore
+                        if (db_service.check_timeout or 0) > 0
+                        else None
+                    ),
+                    probe=str(db_service.probe) if db_service.probe else "auto",  # type: ignore
+                    probe_keyword=str(db_service.probe_keyword) if db_service.probe_keyword else None,  # type: ignore
                     traffic=traffic_metrics,
-                    traffic_history=traffic_data,
-                    response_history=response_data,
-                    storage=storage_metrics,
-                    storage_history=storage_data,
+                    storage=self._load_storage_metrics(db_service),
                 )
 
                 self.services[service.id] = service
+                if pending:
+                    self._unhydrated[service.id] = pending
+                persistence.track(
+                    service,
+                    cursors={
+                        series: rows[-1][0].replace(tzinfo=timezone.utc)
+                        for series, rows in pending.items()
+                    },
+                    storage_split=db_service.storage_topology is not None,
+                )
 
             logger.info(f"Loaded {len(self.services)} services from database")
         except Exception as e:
@@ -371,227 +534,130 @@ class ServiceMonitor:
         finally:
             session.close()
 
-    def _save_service(self, service: Service) -> None:
-        """Save or update a single service in the database"""
-        session = db.get_session()
-        try:
-            # Helper to convert aware datetime to naive UTC
-            def to_naive_utc(dt):
-                if dt is None:
-                    return None
-                if dt.tzinfo is not None:
-                    return dt.astimezone(timezone.utc).replace(tzinfo=None)
-                return dt
-
-            # Check if service exists
-            db_service = (
-                session.query(ServiceDB).filter(ServiceDB.id == service.id).first()
+    def _load_recent_history(
+        self, session: "Session", series: str
+    ) -> Dict[str, List[tuple]]:
+        """Fetch the newest points of one series for all services at once"""
+        table = HISTORY_SERIES[series][0]
+        columns = HISTORY_POINTS[series]
+        ranked = select(
+            table.service_id,
+            table.timestamp,
+            *[getattr(table, column) for column in columns],
+            func.row_number()
+            .over(partition_by=table.service_id, order_by=desc(table.timestamp))
+            .label("rn"),
+        ).subquery()
+        # No ORDER BY: SQLite would sort the whole result in a temp B-tree
+        # rather than keep the window's index order, so each service's rows
+        # are put in order here
+        rows = session.execute(select(ranked).where(ranked.c.rn <= self.history_limit))
+
+        # service_id -> [(timestamp, *values)] in chronological order
+        grouped: Dict[str, List[tuple]] = {}
+        for row in rows:
+            grouped.setdefault(row[0], []).append(tuple(row[1:-1]))
+        for points in grouped.values():
+            points.sort(key=lambda point: point[0])
+        return grouped
+
+    def _load_recent_segments(
+        self, series: str, db_services: List[ServiceDB]
+    ) -> Dict[str, List[tuple]]:
+        """Fetch the newest points of one series from time-series segments"""
+        grouped: Dict[str, List[tuple]] = {}
+        for db_service in db_services:
+            service_id = str(db_service.id)
+            rows = tsdb.recent_rows(series, service_id, self.history_limit)
+            if rows:
+                grouped[service_id] = rows
+        return grouped
+
+    @staticmethod
+    def _import_segments(session: "Session") -> None:
+        """Move history left in database tables into time-series segments"""
+        for series, (table, _, _) in HISTORY_SERIES.items():
+            if tsdb.handles(series) and session.query(table.id).first() is not None:
+                moved = tsdb.import_table(session, series, table)
+                logger.info(f"Moved {moved} {series} history rows into segments")
+
+    def _hydrate(self, service: Service) -> Service:
+        """Copy a service's loaded history rows into its buffers on first access"""
+        pending = self._unhydrated.pop(service.id, None)
+        if not pending:
+            return service
+
+        for series, rows in pending.items():
+            attr = HISTORY_SERIES[series][1]
+            appended = getattr(service, attr)
+            history = type(appended)()
+            history.extend_rows(rows)
+            # Keep anything appended before hydration after the loaded points
+            history.extend(appended)
+            setattr(service, attr, history)
+        return service
+
+    @staticmethod
+    def _load_storage_metrics(db_service: ServiceDB) -> StorageMetrics | None:
+        """Build storage metrics from the saved topology and usage parts,
+        or the legacy storage_data JSON of older databases"""
+        fallback = None
+        if db_service.storage_last_updated:
+            # Used when no storage snapshot is saved or it can't be parsed
+            fallback = StorageMetrics(
+                hostname=str(db_service.storage_hostname) if db_service.storage_hostname else "unknown",  # type: ignore
+                storage_paths=[],
+                raid_arrays=[],
+                zfs_pools=[],
+                disks=[],
+                last_updated=db_service.storage_last_updated.replace(tzinfo=timezone.utc),  # type: ignore
             )
 
-            if db_service:
-                # Update existing service
-                db_service.name = service.name  # type: ignore
-                db_service.url = service.url  # type: ignore
-                db_service.type = service.type  # type: ignore
-                db_service.status = service.status  # type: ignore
-                db_service.last_check = to_naive_utc(service.last_check)  # type: ignore
-                db_service.response_time = service.response_time  # type: ignore
-                db_service.description = service.description  # type: ignore
-                db_service.icon = service.icon  # type: ignore
-                db_service.group = service.group  # type: ignore
-
-                # Update traffic metrics
-                if service.traffic:
-                    db_service.bandwidth_up = service.traffic.bandwidth_up  # type: ignore
-                    db_service.bandwidth_down = service.traffic.bandwidth_down  # type: ignore
-                    db_service.total_up = service.traffic.total_up  # type: ignore
-                    db_service.total_down = service.traffic.total_down  # type: ignore
-                    db_service.max_bandwidth = service.traffic.max_bandwidth  # type: ignore
-                    db_service.traffic_last_updated = to_naive_utc(  # type: ignore
-                        service.traffic.last_updated
-                    )
-
-                # Update storage metrics
-                if service.storage:
-                    import json
-
-                    db_service.storage_hostname = service.storage.hostname  # type: ignore
-                    db_service.storage_data = json.dumps(service.storage.model_dump(mode="json"))  # type: ignore
-                    db_service.storage_last_updated = to_naive_utc(  # type: ignore
-                        service.storage.last_updated
-                    )
-            else:
-                # Create new service
-                db_service = ServiceDB(
-                    id=service.id,
-                    name=service.name,
-                    url=service.url,
-                    type=service.type,
-                    status=service.status,
-                    last_check=to_naive_utc(service.last_check),
-                    response_time=service.response_time,
-                    description=service.description,
-                    icon=service.icon,
-                    group=service.group,
-                    bandwidth_up=(
-                        service.traffic.bandwidth_up if service.traffic else 0.0
-                    ),
-                    bandwidth_down=(
-                        service.traffic.bandwidth_down if service.traffic else 0.0
-                    ),
-                    total_up=service.traffic.total_up if service.traffic else 0.0,
-                    total_down=service.traffic.total_down if service.traffic else 0.0,
-                    max_bandwidth=(
-                        service.traffic.max_bandwidth if service.traffic else None
-                    ),
-                    traffic_last_updated=(
-                        to_naive_utc(service.traffic.last_updated)
-                        if service.traffic
+        if db_service.storage_topology is not None:
+            try:
+                return join_storage(
+                    decode(db_service.storage_topology),  # type: ignore
+                    (
+                        decode(db_service.storage_usage)  # type: ignore
+                        if db_service.storage_usage is not None
                         else None
                     ),
+                    fallback.last_updated if fallback else None,
                 )
-                session.add(db_service)
-
-            # Save new response history points
-            if service.response_history:
-                # Get the last stored timestamp
-                last_stored = (
-                    session.query(ResponseHistoryDB)
-                    .filter(ResponseHistoryDB.service_id == service.id)
-                    .order_by(desc(ResponseHistoryDB.timestamp))
-                    .first()
-                )
-
-                # Get timestamp value, ensure it has timezone info for comparison
-                last_timestamp = None
-                if last_stored and last_stored.timestamp:  # type: ignore
-                    last_timestamp = last_stored.timestamp.replace(tzinfo=timezone.utc)  # type: ignore
-
-                # Add only new points
-                for point in service.response_history:
-                    if not last_timestamp or point.timestamp > last_timestamp:
-                        history_entry = ResponseHistoryDB(
-                            service_id=service.id,
-                            timestamp=to_naive_utc(point.timestamp),
-                            response_time=point.response_time,
-                        )
-                        session.add(history_entry)
-
-                # Clean up old history (keep last 1000 points in DB)
-                old_entries = (
-                    session.query(ResponseHistoryDB)
-                    .filter(ResponseHistoryDB.service_id == service.id)
-                    .order_by(desc(ResponseHistoryDB.timestamp))
-                    .offset(1000)
-                    .all()
-                )
-                for entry in old_entries:
-                    session.delete(entry)
-
-            # Save new traffic history points
-            if service.traffic_history:
-                # Get the last stored timestamp
-                last_stored_traffic = (
-                    session.query(TrafficHistoryDB)
-                    .filter(TrafficHistoryDB.service_id == service.id)
-                    .order_by(desc(TrafficHistoryDB.timestamp))
-                    .first()
+            except Exception as e:
+                logger.warning(
+                    f"Failed to load storage data for {db_service.name}: {e}"
                 )
+                return fallback
 
-                # Get timestamp value, ensure it has timezone info for comparison
-                last_traffic_timestamp = None
-                if last_stored_traffic and last_stored_traffic.timestamp:  # type: ignore
-                    last_traffic_timestamp = last_stored_traffic.timestamp.replace(  # type: ignore
-                        tzinfo=timezone.utc
-                    )
+        if not db_service.storage_data:
+            return fallback
 
-                # Add only new points
-                for point in service.traffic_history:
-                    if (
-                        not last_traffic_timestamp
-                        or point.timestamp > last_traffic_timestamp
-                    ):
-                        traffic_entry = TrafficHistoryDB(
-                            service_id=service.id,
-                            timestamp=to_naive_utc(point.timestamp),
-                            bandwidth_up=point.bandwidth_up,
-                            bandwidth_down=point.bandwidth_down,
-                            total_up=point.total_up,
-                            total_down=point.total_down,
-                        )
-                        session.add(traffic_entry)
-
-                # Clean up old traffic history (keep last 1000 points in DB)
-                old_traffic = (
-                    session.query(TrafficHistoryDB)
-                    .filter(TrafficHistoryDB.service_id == service.id)
-                    .order_by(desc(TrafficHistoryDB.timestamp))
-                    .offset(1000)
-                    .all()
-                )
-                for entry in old_traffic:
-                    session.delete(entry)
-
-            # Save new storage history points
-            if service.storage_history:
-                # Get the last stored timestamp
-                last_stored_storage = (
-                    session.query(StorageHistoryDB)
-                    .filter(StorageHistoryDB.service_id == service.id)
-                    .order_by(desc(StorageHistoryDB.timestamp))
-                    .first()
+        try:
+            storage_dict = json.loads(db_service.storage_data)  # type: ignore
+            # Convert datetime strings back to datetime objects
+            if storage_dict.get("last_updated"):
+                last_updated = datetime.fromisoformat(
+                    storage_dict["last_updated"].replace("Z", "+00:00")
                 )
-
-                # Get timestamp value, ensure it has timezone info for comparison
-                last_storage_timestamp = None
-                if last_stored_storage and last_stored_storage.timestamp:  # type: ignore
-                    last_storage_timestamp = last_stored_storage.timestamp.replace(  # type: ignore
-                        tzinfo=timezone.utc
-                    )
-
-                # Add only new points
-                for point in service.storage_history:
-                    if (
-                        not last_storage_timestamp
-                        or point.timestamp > last_storage_timestamp
-                    ):
-                        storage_entry = StorageHistoryDB(
-                            service_id=service.id,
-                            timestamp=to_naive_utc(point.timestamp),
-                            hostname=point.hostname,
-                            total_capacity=point.total_capacity,
-                            total_used=point.total_used,
-                            total_free=point.total_free,
-                            average_usage_percent=point.average_usage_percent,
-                            raid_healthy=point.raid_healthy,
-                            raid_degraded=point.raid_degraded,
-                            raid_failed=point.raid_failed,
-                        )
-                        session.add(storage_entry)
-
-                # Clean up old storage history (keep last 1000 points in DB)
-                old_storage = (
-                    session.query(StorageHistoryDB)
-                    .filter(StorageHistoryDB.service_id == service.id)
-                    .order_by(desc(StorageHistoryDB.timestamp))
-                    .offset(1000)
-                    .all()
+                storage_dict["last_updated"] = last_updated.replace(
+                    tzinfo=timezone.utc
                 )
-                for entry in old_storage:
-                    session.delete(entry)
-
-            session.commit()
-            logger.debug(f"Saved service {service.name} to database")
+            return StorageMetrics(**storage_dict)
         except Exception as e:
-            session.rollback()
-            logger.error(f"Failed to save service to database: {e}")
-        finally:
-            session.close()
+            logger.warning(f"Failed to load storage data for {db_service.name}: {e}")
+            return fallback
+
+    async def _save_service(self, service: Service) -> None:
+        """Save a single service to the database right away"""
+        persistence.mark_dirty(service)
+        await persistence.flush([service.id])
 
-    def _save_all_services(self) -> None:
-        """Save all services to database"""
+    async def _save_all_services(self) -> None:
+        """Save all services to database in one transaction"""
         for service in self.services.values():
-            self._save_service(service)
+            persistence.mark_dirty(service)
+        await persistence.flush()
 
 
 # Global monitor instance
@@ -0,0 +1,425 @@
+"""
+Write-Behind Persistence for Monitor State
+
+Buffers service state changes in memory and flushes only the columns and
+history points that changed, in one transaction per flush interval.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+)
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from app.database import (
+    db,
+    Base,
+    ServiceDB,
+    ResponseHistoryDB,
+    TrafficHistoryDB,
+    StorageHistoryDB,
+)
+from app.models.service import Service
+from app.services.db_writer import db_writer
+from app.services.storage_snapshot import (
+    compress,
+    serialize,
+    split_storage,
+    storage_hashes,
+)
+from app.services.tsdb import tsdb
+from app.utils.logger import logger
+
+
+def to_naive_utc(dt: Optional[datetime]) -> Optional[datetime]:
+    """Convert an aware datetime to naive UTC for storage"""
+    if dt is None:
+        return None
+    if dt.tzinfo is not None:
+        return dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+# Series name -> (table, Service attribute, point -> row converter)
+HISTORY_SERIES: Dict[str, Tuple[Type[Base], str, Callable[[str, Any], Dict]]] = {
+    "response": (
+        ResponseHistoryDB,
+        "response_history",
+        lambda service_id, p: {
+            "service_id": service_id,
+            "timestamp": to_naive_utc(p.timestamp),
+            "response_time": p.response_time,
+            "dns_time": p.dns_time,
+            "connect_time": p.connect_time,
+            "tls_time": p.tls_time,
+            "ttfb_time": p.ttfb_time,
+        },
+    ),
+    "traffic": (
+        TrafficHistoryDB,
+        "traffic_history",
+        lambda service_id, p: {
+            "service_id": service_id,
+            "timestamp": to_naive_utc(p.timestamp),
+            "bandwidth_up": p.bandwidth_up,
+            "bandwidth_down": p.bandwidth_down,
+            "total_up": p.total_up,
+            "total_down": p.total_down,
+        },
+    ),
+    "storage": (
+        StorageHistoryDB,
+        "storage_history",
+        lambda service_id, p: {
+            "service_id": service_id,
+            "timestamp": to_naive_utc(p.timestamp),
+            "hostname": p.hostname,
+            "total_capacity": p.total_capacity,
+            "total_used": p.total_used,
+            "total_free": p.total_free,
+            "average_usage_percent": p.average_usage_percent,
+            "raid_healthy": p.raid_healthy,
+            "raid_degraded": p.raid_degraded,
+            "raid_failed": p.raid_failed,
+        },
+    ),
+}
+
+
+class FlushPlan(NamedTuple):
+    """Statements for one flush, built on the event loop"""
+
+    inserts: List[Dict[str, Any]]
+    # Sorted column names -> rows, for bulk UPDATE by primary key
+    updates: Dict[Tuple[str, ...], List[Dict[str, Any]]]
+    snapshots: Dict[str, Dict[str, Any]]
+    # (series, service_id, points past the persisted cursor)
+    history: List[Tuple[str, str, List[Any]]]
+    # Service id -> (topology, usage) content hashes being written
+    storage_hashes: Dict[str, Tuple[bytes, bytes]]
+
+
+class MonitorPersistence:
+    """Write-behind buffer with per-column dirty tracking for ServiceDB rows"""
+
+    def __init__(self, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+
+        self._dirty: Dict[str, Service] = {}
+        # Last persisted column values per service (None = not in database)
+        self._snapshots: Dict[str, Dict[str, Any]] = {}
+        # "Persisted up to" timestamp per (service, series)
+        self._cursors: Dict[Tuple[str, str], datetime] = {}
+        # Content hashes of the persisted storage (topology, usage) parts
+        self._storage_hashes: Dict[str, Tuple[bytes, bytes]] = {}
+        # One flush at a time, so two flushes never write the same history tail
+        self._lock = asyncio.Lock()
+
+        # Metrics
+        self.last_flush: Dict[str, Any] = {}
+
+    @staticmethod
+    def _service_row(service: Service) -> Dict[str, Any]:
+        """Map a Service to ServiceDB column values (without storage parts)"""
+        row: Dict[str, Any] = {
+            "id": service.id,
+            "name": service.name,
+            "url": service.url,
+            "type": service.type,
+            "status": service.status,
+            "last_check": to_naive_utc(service.last_check),
+            "response_time": service.response_time,
+            "description": service.description,
+            "icon": service.icon,
+            "group": service.group,
+            "check_interval": service.check_interval,
+            "check_timeout": service.check_timeout,
+            "probe": service.probe,
+            "probe_keyword": service.probe_keyword,
+        }
+        if service.traffic:
+            row.update(
+                bandwidth_up=service.traffic.bandwidth_up,
+                bandwidth_down=service.traffic.bandwidth_down,
+                total_up=service.traffic.total_up,
+                total_down=service.traffic.total_down,
+                max_bandwidth=service.traffic.max_bandwidth,
+                traffic_last_updated=to_naive_utc(service.traffic.last_updated),
+            )
+        if service.storage:
+            row.update(
+                storage_hostname=service.storage.hostname,
+                storage_last_updated=to_naive_utc(service.storage.last_updated),
+            )
+        return row
+
+    def track(
+        self,
+        service: Service,
+        cursors: Optional[Dict[str, datetime]] = None,
+        storage_split: bool = True,
+    ) -> None:
+        """Record a service loaded from the database as already persisted.
+
+        `cursors` maps each series to the newest stored timestamp; by default
+        the newest in-memory point is used, since the loader always fetches
+        the most recent rows. Pass `storage_split=False` when the storage
+        snapshot came from the legacy storage_data column, so the next
+        storage change writes both parts.
+        """
+        self._snapshots[service.id] = self._service_row(service)
+        if service.storage and storage_split:
+            self._storage_hashes[service.id] = storage_hashes(service.storage)
+        if cursors is None:
+            cursors = {
+                series: getattr(service, attr)[-1].timestamp
+                for series, (_, attr, _) in HISTORY_SERIES.items()
+                if getattr(service, attr)
+            }
+        for series, timestamp in cursors.items():
+            self._cursors[(service.id, series)] = timestamp
+
+    def mark_dirty(self, service: Service) -> None:
+        """Queue a service for the next flush"""
+        self._dirty[service.id] = service
+
+    def forget(self, service_id: str) -> None:
+        """Drop buffered state for a removed service"""
+        self._dirty.pop(service_id, None)
+        self._snapshots.pop(service_id, None)
+        self._storage_hashes.pop(service_id, None)
+        for series in HISTORY_SERIES:
+            self._cursors.pop((service_id, series), None)
+
+    def unflushed(self, service: Service, series: str) -> List[Any]:
+        """A service's in-memory points of one series not yet written"""
+        history = getattr(service, HISTORY_SERIES[series][1])
+        return history.since(self._cursors.get((service.id, series)))
+
+    @property
+    def pending(self) -> int:
+        """Number of services waiting to be flushed"""
+        return len(self._dirty)
+
+    async def flush(self, service_ids: Optional[Iterable[str]] = None) -> int:
+        """Persist dirty services (all, or only `service_ids`) in one transaction.
+
+        Rows are built on the event loop, written by the database writer,
+        and snapshots/cursors only move forward once the commit succeeded.
+        Returns the number of services written.
+        """
+        async with self._lock:
+            if service_ids is None:
+                batch = list(self._dirty.values())
+            else:
+                batch = [self._dirty[sid] for sid in service_ids if sid in self._dirty]
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            for service in batch:
+                self._dirty.pop(service.id, None)
+
+            plan = self._plan(batch)
+            try:
+                cursors = await db_writer.submit(self._write, plan)
+            except Exception as e:
+                logger.error(f"Failed to flush monitor state to database: {e}")
+                # Keep the batch for the next attempt unless newer state arrived
+                for service in batch:
+                    self._dirty.setdefault(service.id, service)
+                return 0
+
+            self._snapshots.update(plan.snapshots)
+            self._storage_hashes.update(plan.storage_hashes)
+            for key, timestamp in cursors.items():
+                self._advance_cursor(key, timestamp)
+
+        elapsed = time.monotonic() - started
+        history_rows = sum(len(points) for _, _, points in plan.history)
+        self.last_flush = {
+            "services": len(batch),
+            "inserted": len(plan.inserts),
+            "updated": sum(len(rows) for rows in plan.updates.values()),
+            "history_rows": history_rows,
+            "seconds": round(elapsed, 4),
+            "at": datetime.now(timezone.utc).isoformat(),
+        }
+        logger.debug(
+            f"Flushed {len(batch)} services "
+            f"({len(plan.inserts)} new, {self.last_flush['updated']} changed, "
+            f"{history_rows} history rows) in {elapsed * 1000:.1f}ms"
+        )
+        return len(batch)
+
+    def _plan(self, batch: List[Service]) -> FlushPlan:
+        """Diff services against their snapshots and collect unsaved history"""
+        plan = FlushPlan([], {}, {}, [], {})
+        for service in batch:
+            row = self._service_row(service)
+            snapshot = self._snapshots.get(service.id)
+            storage_changed = service.storage is not None and (
+                snapshot is None
+                or snapshot.get("storage_last_updated")
+                != row.get("storage_last_updated")
+            )
+
+            if snapshot is None:
+                changes = dict(row)
+            else:
+                changes = {
+                    key: value
+                    for key, value in row.items()
+                    if key == "id" or snapshot.get(key) != value
+                }
+            if storage_changed:
+                self._plan_storage(service, changes, plan)
+
+            if snapshot is None:
+                plan.inserts.append(changes)
+            elif len(changes) > 1:
+                # Bulk UPDATE by primary key needs uniform key sets
+                plan.updates.setdefault(tuple(sorted(changes)), []).append(changes)
+            plan.snapshots[service.id] = row
+
+            for series in HISTORY_SERIES:
+                tail = self.unflushed(service, series)
+                if tail:
+                    plan.history.append((series, service.id, tail))
+        return plan
+
+    def _plan_storage(
+        self, service: Service, changes: Dict[str, Any], plan: FlushPlan
+    ) -> None:
+        """Add the storage parts whose content hash changed to `changes`.
+
+        Agents report the same RAID/ZFS/disk layout every time, so usually
+        only the usage part is rewritten.
+        """
+        topology, usage = split_storage(service.storage)  # type: ignore
+        topology_raw, topology_hash = serialize(topology)
+        usage_raw, usage_hash = serialize(usage)
+        known_topology, known_usage = self._storage_hashes.get(
+            service.id, (None, None)
+        )
+        if topology_hash != known_topology:
+            changes["storage_topology"] = compress(topology_raw)
+            # Superseded by the split columns
+            changes["storage_data"] = None
+        if usage_hash != known_usage:
+            changes["storage_usage"] = compress(usage_raw)
+        plan.storage_hashes[service.id] = (topology_hash, usage_hash)
+
+    def _write(
+        self, session: Session, plan: FlushPlan
+    ) -> Dict[Tuple[str, str], datetime]:
+        """Execute a flush plan (a database writer job).
+
+        Returns the new history cursors, to be applied by the caller.
+        """
+        cursors: Dict[Tuple[str, str], datetime] = {}
+        if plan.inserts:
+            session.execute(insert(ServiceDB), plan.inserts)
+        for rows in plan.updates.values():
+            session.execute(update(ServiceDB), rows)
+        for series, service_id, points in plan.history:
+            self.insert_history(
+                series, service_id, points, session=session, cursors=cursors
+            )
+        return cursors
+
+    def insert_history(
+        self,
+        series: str,
+        service_id: str,
+        points: List[Any],
+        session=None,
+        cursors: Optional[Dict[Tuple[str, str], datetime]] = None,
+    ) -> int:
+        """Bulk insert history points for one series, without reading first.
+
+        Blocking; call it through db_writer.run() from async code. When
+        `session` is given the caller owns the transaction and must apply
+        `cursors` after committing; otherwise a session is opened, committed
+        and the cursor is advanced here. Series kept in time-series segments
+        are appended there instead; if the transaction then fails, the retry
+        appends the points again and compaction drops the duplicates.
+        """
+        if not points:
+            return 0
+        table, _, to_row = HISTORY_SERIES[series]
+        newest = max(point.timestamp for point in points)
+        key = (service_id, series)
+
+        if tsdb.handles(series):
+            tsdb.append_points(series, service_id, points)
+            if session is not None and cursors is not None:
+                cursors[key] = max(newest, cursors.get(key, newest))
+            elif session is None:
+                self._advance_cursor(key, newest)
+            return len(points)
+
+        rows = [to_row(service_id, point) for point in points]
+        # Points already stored (e.g. a retried ingest batch) are skipped
+        statement = db.insert(table).on_conflict_do_nothing(
+            index_elements=["service_id", "timestamp"]
+        )
+        if session is not None:
+            session.execute(statement, rows)
+            if cursors is not None:
+                cursors[key] = max(newest, cursors.get(key, newest))
+            return len(rows)
+
+        own_session = db.get_session()
+        try:
+            own_session.execute(statement, rows)
+            own_session.commit()
+        except Exception:
+            own_session.rollback()
+            raise
+        finally:
+            own_session.close()
+        self._advance_cursor(key, newest)
+        return len(rows)
+
+    def _advance_cursor(self, key: Tuple[str, str], timestamp: datetime) -> None:
+        current = self._cursors.get(key)
+        if current is None or timestamp > current:
+            self._cursors[key] = timestamp
+
+    async def start_flush_loop(self):
+        """Flush buffered state every `flush_interval` seconds"""
+        self.running = True
+        logger.info(f"Starting monitor write-behind flush (every {self.flush_interval}s)")
+
+        while self.running:
+            try:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+            except asyncio.CancelledError:
+                logger.info("Monitor flush task cancelled")
+                break
+            except Exception as e:
+                logger.error(f"Error flushing monitor state: {e}")
+
+    def stop(self):
+        """Stop the flush loop (await flush() afterwards to drain the buffer)"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+
+
+# Global instance
+persistence = MonitorPersistence()
@@ -0,0 +1,175 @@
+"""
+History Retention Service
+
+Periodically prunes response, traffic and storage history and the rollup
+tiers built from it with set-based DELETE statements, keeping pruning out of
+the write path. Series kept in time-series segments drop whole day files
+and are compacted in the same run.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from pydantic import BaseModel
+from sqlalchemy import delete, desc, func, select
+from app.config import settings
+from app.database import db, HistoryRollupDB
+from app.services.db_writer import db_writer
+from app.services.persistence import HISTORY_SERIES
+from app.services.rollups import load_tiers
+from app.services.tsdb import tsdb
+from app.utils.logger import logger
+
+
+class RetentionPolicy(BaseModel):
+    """How much history to keep for one series (0 disables a limit)"""
+
+    max_rows: int = 0  # Newest rows kept per service
+    max_age_days: int = 0  # Rows older than this are dropped
+
+
+def load_policies() -> Dict[str, RetentionPolicy]:
+    """Build the per-series retention policies from settings"""
+    return {
+        series: RetentionPolicy(
+            max_rows=getattr(settings, f"RETENTION_{series.upper()}_MAX_ROWS"),
+            max_age_days=getattr(settings, f"RETENTION_{series.upper()}_MAX_AGE_DAYS"),
+        )
+        for series in HISTORY_SERIES
+    }
+
+
+class HistoryRetention:
+    """Background job that applies retention policies to history tables"""
+
+    def __init__(self):
+        self.policies: Dict[str, RetentionPolicy] = load_policies()
+        self.rollup_tiers = load_tiers()
+        self.interval = settings.RETENTION_INTERVAL
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+        self.last_run: Dict[str, Any] = {}
+
+    def prune(self) -> Dict[str, Any]:
+        """Apply every policy once and return rows pruned per series.
+
+        Blocking; the loop runs it on the database writer.
+        """
+        started = time.monotonic()
+        pruned: Dict[str, int] = {}
+
+        session = db.get_session()
+        try:
+            for series, policy in self.policies.items():
+                if tsdb.handles(series):
+                    pruned[series] = tsdb.prune(
+                        series, policy.max_age_days, policy.max_rows
+                    )
+                    continue
+
+                table = HISTORY_SERIES[series][0]
+                count = 0
+
+                if policy.max_age_days > 0:
+                    cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(
+                        days=policy.max_age_days
+                    )
+                    result = session.execute(
+                        delete(table)
+                        .where(table.timestamp < cutoff)
+                        .execution_options(synchronize_session=False)
+                    )
+                    count += result.rowcount or 0
+
+                if policy.max_rows > 0:
+                    # Rank rows newest-first within each service, drop the rest
+                    ranked = select(
+                        table.id,
+                        func.row_number()
+                        .over(
+                            partition_by=table.service_id,
+                            order_by=desc(table.timestamp),
+                        )
+                        .label("rn"),
+                    ).subquery()
+                    result = session.execute(
+                        delete(table)
+                        .where(
+                            table.id.in_(
+                                select(ranked.c.id).where(ranked.c.rn > policy.max_rows)
+                            )
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                    count += result.rowcount or 0
+
+                pruned[series] = count
+
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            for tier in self.rollup_tiers:
+                if tier.max_age_days <= 0:
+                    continue
+                result = session.execute(
+                    delete(HistoryRollupDB)
+                    .where(
+                        HistoryRollupDB.resolution == tier.seconds,
+                        HistoryRollupDB.bucket < now - timedelta(days=tier.max_age_days),
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+                pruned[f"rollup_{tier.name}"] = result.rowcount or 0
+
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"History retention failed: {e}")
+            raise
+        finally:
+            session.close()
+
+        if tsdb.enabled:
+            # Merge the small blocks written by each flush
+            tsdb.compact()
+
+        elapsed = time.monotonic() - started
+        self.last_run = {
+            "pruned": pruned,
+            "total": sum(pruned.values()),
+            "seconds": round(elapsed, 4),
+            "at": datetime.now(timezone.utc).isoformat(),
+        }
+        if self.last_run["total"]:
+            logger.info(
+                f"Pruned {self.last_run['total']} history rows "
+                f"({', '.join(f'{k}: {v}' for k, v in pruned.items())}) "
+                f"in {elapsed * 1000:.1f}ms"
+            )
+        return self.last_run
+
+    async def start_retention_loop(self):
+        """Prune history every `interval` seconds"""
+        self.running = True
+        logger.info(f"Starting history retention (every {self.interval}s)")
+
+        while self.running:
+            try:
+                await asyncio.sleep(self.interval)
+                if not self.running:
+                    break
+                await db_writer.run(self.prune)
+            except asyncio.CancelledError:
+                logger.info("History retention task cancelled")
+                break
+            except Exception as e:
+                logger.error(f"Error in history retention loop: {e}")
+
+    def stop(self):
+        """Stop the retention loop"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+
+
+# Global instance
+history_retention = HistoryRetention()
@@ -0,0 +1,673 @@
+"""
+History Rollup Service
+
+Incrementally aggregates raw response, traffic and storage history into
+1-minute, 15-minute and 1-hour buckets (min, max, avg, p95, sample count)
+and serves time ranges from the cheapest tier that covers them.
+"""
+
+import asyncio
+import math
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import db, HistoryRollupDB, RollupStateDB, ServiceDB
+from app.models.service import HistoryRange, RollupPoint, RollupStats
+from app.services.db_writer import db_writer
+from app.services.downsample import lttb_multi
+from app.services.persistence import HISTORY_SERIES, to_naive_utc
+from app.services.tsdb import from_micros, to_micros, tsdb
+from app.utils.logger import logger
+
+# Series -> history columns that are rolled up
+ROLLUP_METRICS: Dict[str, Tuple[str, ...]] = {
+    "response": ("response_time",),
+    "traffic": ("bandwidth_up", "bandwidth_down"),
+    "storage": ("average_usage_percent", "total_used"),
+}
+
+# Buckets this recent stay open, so points still waiting in the
+# write-behind buffer land before their bucket is aggregated
+SETTLE_SECONDS = 30
+
+# Caps the work of one run while catching up on a backlog
+MAX_BUCKETS_PER_RUN = 360
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class RollupTier(NamedTuple):
+    name: str
+    seconds: int  # Bucket width
+    max_age_days: int  # 0 keeps the tier forever
+
+
+def load_tiers() -> List[RollupTier]:
+    """Rollup tiers from finest to coarsest; each is built from the one before"""
+    return [
+        RollupTier(
+            name, seconds, getattr(settings, f"ROLLUP_{name.upper()}_MAX_AGE_DAYS")
+        )
+        for name, seconds in (("1m", 60), ("15m", 900), ("1h", 3600))
+    ]
+
+
+def segment_rows(
+    series: str, service_ids: List[str], start: datetime, end: datetime
+) -> List[tuple]:
+    """(service_id, naive UTC timestamp, *rollup metrics) rows in [start, end)
+    read from time-series segments, shaped like a history table query"""
+    rows: List[tuple] = []
+    for service_id in service_ids:
+        x, columns = tsdb.read_range(
+            series, service_id, to_micros(start), to_micros(end)
+        )
+        values = [columns[metric].tolist() for metric in ROLLUP_METRICS[series]]
+        rows.extend(
+            (
+                service_id,
+                from_micros(micros).replace(tzinfo=None),
+                *(None if value != value else value for value in row),  # NaN
+            )
+            for micros, row in zip(x.tolist(), zip(*values))
+        )
+    return rows
+
+
+def floor_time(dt: datetime, seconds: int) -> datetime:
+    """Start of the `seconds`-wide bucket containing a naive UTC datetime"""
+    elapsed = int((dt - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=elapsed - elapsed % seconds)
+
+
+def ceil_time(dt: datetime, seconds: int) -> datetime:
+    """Start of the first `seconds`-wide bucket at or after a naive UTC datetime"""
+    bucket = floor_time(dt, seconds)
+    return bucket if bucket == dt else bucket + timedelta(seconds=seconds)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def weighted_percentile(pairs: List[Tuple[float, int]], q: float) -> float:
+    """Nearest-rank percentile of (value, sample count) pairs"""
+    ordered = sorted(pairs)
+    rank = q * sum(weight for _, weight in ordered)
+    seen = 0
+    for value, weight in ordered:
+        seen += weight
+        if seen >= rank:
+            return value
+    return ordered[-1][0]
+
+
+def summarize_samples(values: List[float]) -> Dict[str, Any]:
+    """Aggregate raw samples into one bucket"""
+    return {
+        "count": len(values),
+        "min": min(values),
+        "max": max(values),
+        "avg": sum(values) / len(values),
+        "p95": percentile(values, 0.95),
+    }
+
+
+def summarize_buckets(rows: List[HistoryRollupDB]) -> Dict[str, Any]:
+    """Aggregate finer buckets into one coarser bucket.
+
+    Min, max, count and the count-weighted average are exact. The p95 is the
+    weighted 95th percentile of the finer buckets' p95 values, which is an
+    approximation; exact percentiles can't be merged.
+    """
+    count = sum(row.count for row in rows)
+    return {
+        "count": count,
+        "min": min(row.min for row in rows),
+        "max": max(row.max for row in rows),
+        "avg": sum(row.avg * row.count for row in rows) / count,
+        "p95": weighted_percentile([(row.p95, row.count) for row in rows], 0.95),
+    }
+
+
+class HistoryRollups:
+    """Background job that maintains the rollup tiers, plus range queries"""
+
+    def __init__(self):
+        self.tiers: List[RollupTier] = load_tiers()
+        self.interval = settings.ROLLUP_INTERVAL
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+        self.last_run: Dict[str, Any] = {}
+
+    def get_tier(self, name: str) -> RollupTier:
+        return next(tier for tier in self.tiers if tier.name == name)
+
+    # Aggregation
+
+    def roll_up(self) -> Dict[str, Any]:
+        """Aggregate every settled bucket past each tier's watermark.
+
+        Blocking; the loop runs it on the database writer. Each tier of
+        each series commits its buckets together with its new watermark, so an
+        interrupted run never double-counts or skips a bucket.
+        """
+        started = time.monotonic()
+        now = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(
+            seconds=SETTLE_SECONDS
+        )
+        written: Dict[str, int] = {tier.name: 0 for tier in self.tiers}
+
+        session = db.get_session()
+        try:
+            for series in ROLLUP_METRICS:
+                source: Optional[RollupTier] = None
+                for tier in self.tiers:
+                    written[tier.name] += self._roll_up_tier(
+                        session, series, tier, source, now
+                    )
+                    source = tier
+        except Exception as e:
+            session.rollback()
+            logger.error(f"History rollup failed: {e}")
+            raise
+        finally:
+            session.close()
+
+        elapsed = time.monotonic() - started
+        self.last_run = {
+            "buckets": written,
+            "total": sum(written.values()),
+            "seconds": round(elapsed, 4),
+            "at": datetime.now(timezone.utc).isoformat(),
+        }
+        if self.last_run["total"]:
+            logger.debug(
+                f"Rolled up {self.last_run['total']} history buckets "
+                f"in {elapsed * 1000:.1f}ms"
+            )
+        return self.last_run
+
+    def rewind(
+        self, session: Session, series: str, service_ids: List[str], since: datetime
+    ) -> None:
+        """Reopen buckets from `since` on for late raw points.
+
+        Late points (e.g. an agent's backlog after an outage) can land in
+        buckets that were already aggregated. Those services' buckets are
+        dropped and each tier's watermark is moved back, so the next runs
+        rebuild them; other services' buckets are left as they are and the
+        rebuild skips them as duplicates. Only buckets the source they are
+        rebuilt from still fully covers are dropped: retention has already
+        pruned the raw points under older buckets, which keep their
+        aggregates and miss the late points. Call it before storing the late
+        points. Does not commit; meant for a database writer job.
+        """
+        since = to_naive_utc(since)  # type: ignore
+        covered = self._oldest_raw(session, series, service_ids)
+        for tier in self.tiers:
+            floors = {
+                service_id: floor_time(since, tier.seconds)
+                for service_id in service_ids
+            }
+            for service_id, first in covered.items():
+                floors[service_id] = max(
+                    floors[service_id], ceil_time(first, tier.seconds)
+                )
+            state = session.get(RollupStateDB, (series, tier.seconds))
+            if state is not None:
+                for service_id, bucket in floors.items():
+                    if bucket >= state.watermark:
+                        continue
+                    session.query(HistoryRollupDB).filter(
+                        HistoryRollupDB.service_id == service_id,
+                        HistoryRollupDB.series == series,
+                        HistoryRollupDB.resolution == tier.seconds,
+                        HistoryRollupDB.bucket >= bucket,
+                    ).delete(synchronize_session=False)
+                state.watermark = min(  # type: ignore
+                    state.watermark, *floors.values()
+                )
+            # The next tier is rebuilt from this one's buckets
+            oldest = dict(
+                session.query(
+                    HistoryRollupDB.service_id, func.min(HistoryRollupDB.bucket)
+                )
+                .filter(
+                    HistoryRollupDB.service_id.in_(service_ids),
+                    HistoryRollupDB.series == series,
+                    HistoryRollupDB.resolution == tier.seconds,
+                )
+                .group_by(HistoryRollupDB.service_id)
+                .all()
+            )
+            covered = {
+                service_id: min(oldest.get(service_id, bucket), bucket)
+                for service_id, bucket in floors.items()
+            }
+
+    @staticmethod
+    def _oldest_raw(
+        session: Session, series: str, service_ids: List[str]
+    ) -> Dict[str, datetime]:
+        """Oldest raw point kept per service (services without any left out)"""
+        if tsdb.handles(series):
+            oldest = {
+                service_id: tsdb.oldest(series, service_id)
+                for service_id in service_ids
+            }
+            return {
+                service_id: from_micros(micros).replace(tzinfo=None)
+                for service_id, micros in oldest.items()
+                if micros is not None
+            }
+        table = HISTORY_SERIES[series][0]
+        return dict(
+            session.query(table.service_id, func.min(table.timestamp))
+            .filter(table.service_id.in_(service_ids))
+            .group_by(table.service_id)
+            .all()
+        )
+
+    def _roll_up_tier(
+        self,
+        session: Session,
+        series: str,
+        tier: RollupTier,
+        source: Optional[RollupTier],
+        now: datetime,
+    ) -> int:
+        """Aggregate one tier of one series from raw history or the finer tier"""
+        state = session.get(RollupStateDB, (series, tier.seconds))
+        if state:
+            start = state.watermark
+        else:
+            first = self._first_timestamp(session, series, source)
+            if first is None:
+                return 0
+            start = floor_time(first, tier.seconds)
+
+        end = floor_time(now, tier.seconds)
+        if source is not None:
+            # Only buckets the finer tier has completely aggregated
+            source_state = session.get(RollupStateDB, (series, source.seconds))
+            if source_state is None:
+                return 0
+            end = min(end, floor_time(source_state.watermark, tier.seconds))
+        end = min(end, start + timedelta(seconds=tier.seconds * MAX_BUCKETS_PER_RUN))
+        if end <= start:
+            return 0
+
+        if source is None:
+            rows = self._aggregate_raw(session, series, tier, start, end)
+        else:
+            rows = self._aggregate_tier(session, series, tier, source, start, end)
+
+        # Idempotent, so replicas sharing a database can race on a tier
+        if rows:
+            session.execute(
+                db.insert(HistoryRollupDB).on_conflict_do_nothing(
+                    index_elements=[
+                        "service_id",
+                        "series",
+                        "resolution",
+                        "bucket",
+                        "metric",
+                    ]
+                ),
+                rows,
+            )
+        upsert = db.insert(RollupStateDB).values(
+            series=series, resolution=tier.seconds, watermark=end
+        )
+        session.execute(
+            upsert.on_conflict_do_update(
+                index_elements=["series", "resolution"],
+                set_={"watermark": upsert.excluded.watermark},
+            )
+        )
+        session.commit()
+        return len(rows)
+
+    @staticmethod
+    def _first_timestamp(
+        session: Session, series: str, source: Optional[RollupTier]
+    ) -> Optional[datetime]:
+        """Oldest point a tier would be built from, None if there is none"""
+        if source is None:
+            if tsdb.handles(series):
+                first = tsdb.first_timestamp(series)
+                if first is None:
+                    return None
+                return from_micros(first).replace(tzinfo=None)
+            table = HISTORY_SERIES[series][0]
+            return session.query(func.min(table.timestamp)).scalar()
+        return (
+            session.query(func.min(HistoryRollupDB.bucket))
+            .filter(
+                HistoryRollupDB.series == series,
+                HistoryRollupDB.resolution == source.seconds,
+            )
+            .scalar()
+        )
+
+    @staticmethod
+    def _aggregate_raw(
+        session: Session,
+        series: str,
+        tier: RollupTier,
+        start: datetime,
+        end: datetime,
+    ) -> List[Dict[str, Any]]:
+        """Buckets in [start, end) built from raw history rows"""
+        table = HISTORY_SERIES[series][0]
+        metrics = ROLLUP_METRICS[series]
+        if tsdb.handles(series):
+            service_ids = list(session.execute(select(ServiceDB.id)).scalars())
+            result: Any = segment_rows(series, service_ids, start, end)
+        else:
+            result = session.execute(
+                select(
+                    table.service_id,
+                    table.timestamp,
+                    *(getattr(table, metric) for metric in metrics),
+                ).where(
+                    # Lets SQLite walk the (service_id, timestamp) index per service
+                    table.service_id.in_(select(ServiceDB.id)),
+                    table.timestamp >= start,
+                    table.timestamp < end,
+                )
+            )
+
+        samples: Dict[Tuple[str, datetime, str], List[float]] = defaultdict(list)
+        for service_id, timestamp, *values in result:
+            bucket = floor_time(timestamp, tier.seconds)
+            for metric, value in zip(metrics, values):
+                if value is not None:
+                    samples[(service_id, bucket, metric)].append(value)
+
+        return [
+            {
+                "service_id": service_id,
+                "series": series,
+                "metric": metric,
+                "resolution": tier.seconds,
+                "bucket": bucket,
+                **summarize_samples(values),
+            }
+            for (service_id, bucket, metric), values in samples.items()
+        ]
+
+    @staticmethod
+    def _aggregate_tier(
+        session: Session,
+        series: str,
+        tier: RollupTier,
+        source: RollupTier,
+        start: datetime,
+        end: datetime,
+    ) -> List[Dict[str, Any]]:
+        """Buckets in [start, end) built from the finer tier's buckets"""
+        result = (
+            session.query(HistoryRollupDB)
+            .filter(
+                HistoryRollupDB.service_id.in_(select(ServiceDB.id)),
+                HistoryRollupDB.series == series,
+                HistoryRollupDB.resolution == source.seconds,
+                HistoryRollupDB.bucket >= start,
+                HistoryRollupDB.bucket < end,
+            )
+            .all()
+        )
+
+        children: Dict[Tuple[str, datetime, str], List[HistoryRollupDB]] = (
+            defaultdict(list)
+        )
+        for row in result:
+            bucket = floor_time(row.bucket, tier.seconds)  # type: ignore
+            children[(row.service_id, bucket, row.metric)].append(row)  # type: ignore
+
+        return [
+            {
+                "service_id": service_id,
+                "series": series,
+                "metric": metric,
+                "resolution": tier.seconds,
+                "bucket": bucket,
+                **summarize_buckets(rows),
+            }
+            for (service_id, bucket, metric), rows in children.items()
+        ]
+
+    # Range queries
+
+    def pick_tier(
+        self, start: datetime, end: datetime, max_points: int
+    ) -> RollupTier:
+        """Finest tier that still holds `start` and spans the range in at most
+        `max_points` buckets (the coarsest tier if none does)"""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        span = (end - start).total_seconds()
+        covering = [
+            tier
+            for tier in self.tiers
+            if tier.max_age_days <= 0
+            or start >= now - timedelta(days=tier.max_age_days)
+        ]
+        for tier in covering:
+            if span / tier.seconds <= max_points:
+                return tier
+        return (covering or self.tiers)[-1]
+
+    def query(
+        self,
+        service_id: str,
+        series: str,
+        start: datetime,
+        end: datetime,
+        max_points: int,
+        resolution: Optional[str] = None,
+    ) -> HistoryRange:
+        """History of one series in [start, end).
+
+        Raw history is served when it reaches back to `start` with no more
+        than `max_points` rows, otherwise the tier picked by pick_tier().
+        Pass `resolution` ("raw", "1m", "15m", "1h") to force a tier. Results
+        still longer than `max_points` are reduced with LTTB on the averages.
+        Blocking; call it through db.run().
+        """
+        start = to_naive_utc(start)  # type: ignore
+        end = to_naive_utc(end)  # type: ignore
+
+        session = db.get_session()
+        try:
+            if resolution == "raw" or (
+                resolution is None
+                and self._raw_fits(session, service_id, series, start, end, max_points)
+            ):
+                name = "raw"
+                points = self._raw_points(session, service_id, series, start, end)
+            else:
+                tier = (
+                    self.get_tier(resolution)
+                    if resolution
+                    else self.pick_tier(start, end, max_points)
+                )
+                name = tier.name
+                points = self._rollup_points(
+                    session, service_id, series, tier, start, end
+                )
+        finally:
+            session.close()
+
+        if len(points) > max_points:
+            # Forced resolution, or a range beyond what the coarsest tier
+            # spans in max_points buckets
+            x = np.array([point.timestamp.timestamp() for point in points])
+            ys = [
+                np.array(
+                    [
+                        point.metrics[metric].avg if metric in point.metrics else 0.0
+                        for point in points
+                    ]
+                )
+                for metric in ROLLUP_METRICS[series]
+            ]
+            points = [points[i] for i in lttb_multi(x, ys, max_points)]
+
+        return HistoryRange(
+            service_id=service_id,
+            series=series,  # type: ignore
+            resolution=name,
+            start=start.replace(tzinfo=timezone.utc),
+            end=end.replace(tzinfo=timezone.utc),
+            points=points,
+        )
+
+    @staticmethod
+    def _raw_fits(
+        session: Session,
+        service_id: str,
+        series: str,
+        start: datetime,
+        end: datetime,
+        max_points: int,
+    ) -> bool:
+        """True if raw history covers the range within max_points rows"""
+        if tsdb.handles(series):
+            oldest = tsdb.oldest(series, service_id)
+            if oldest is None or oldest > to_micros(start):
+                return False
+            x, _ = tsdb.read_range(
+                series, service_id, to_micros(start), to_micros(end)
+            )
+            return len(x) <= max_points
+        table = HISTORY_SERIES[series][0]
+        oldest = (
+            session.query(func.min(table.timestamp))
+            .filter(table.service_id == service_id)
+            .scalar()
+        )
+        if oldest is None or oldest > start:
+            return False
+        rows = (
+            session.query(func.count())
+            .select_from(table)
+            .filter(
+                table.service_id == service_id,
+                table.timestamp >= start,
+                table.timestamp < end,
+            )
+            .scalar()
+        )
+        return rows <= max_points
+
+    @staticmethod
+    def _raw_points(
+        session: Session, service_id: str, series: str, start: datetime, end: datetime
+    ) -> List[RollupPoint]:
+        """Raw rows as single-sample buckets"""
+        table = HISTORY_SERIES[series][0]
+        metrics = ROLLUP_METRICS[series]
+        if tsdb.handles(series):
+            result: Any = [
+                row[1:] for row in segment_rows(series, [service_id], start, end)
+            ]
+        else:
+            result = session.execute(
+                select(
+                    table.timestamp, *(getattr(table, metric) for metric in metrics)
+                )
+                .where(
+                    table.service_id == service_id,
+                    table.timestamp >= start,
+                    table.timestamp < end,
+                )
+                .order_by(table.timestamp)
+            )
+        return [
+            RollupPoint(
+                timestamp=timestamp.replace(tzinfo=timezone.utc),
+                count=1,
+                metrics={
+                    metric: RollupStats(min=value, max=value, avg=value, p95=value)
+                    for metric, value in zip(metrics, values)
+                    if value is not None
+                },
+            )
+            for timestamp, *values in result
+        ]
+
+    @staticmethod
+    def _rollup_points(
+        session: Session,
+        service_id: str,
+        series: str,
+        tier: RollupTier,
+        start: datetime,
+        end: datetime,
+    ) -> List[RollupPoint]:
+        """Buckets of one tier overlapping [start, end)"""
+        result = (
+            session.query(HistoryRollupDB)
+            .filter(
+                HistoryRollupDB.service_id == service_id,
+                HistoryRollupDB.series == series,
+                HistoryRollupDB.resolution == tier.seconds,
+                HistoryRollupDB.bucket >= floor_time(start, tier.seconds),
+                HistoryRollupDB.bucket < end,
+            )
+            .order_by(HistoryRollupDB.bucket)
+            .all()
+        )
+
+        points: Dict[datetime, RollupPoint] = {}
+        for row in result:
+            point = points.get(row.bucket)  # type: ignore
+            if point is None:
+                point = points[row.bucket] = RollupPoint(  # type: ignore
+                    timestamp=row.bucket.replace(tzinfo=timezone.utc),
+                    count=0,
+                    metrics={},
+                )
+            point.count = max(point.count, row.count)  # type: ignore
+            point.metrics[row.metric] = RollupStats(  # type: ignore
+                min=row.min, max=row.max, avg=row.avg, p95=row.p95  # type: ignore
+            )
+        return list(points.values())
+
+    # Loop
+
+    async def start_rollup_loop(self):
+        """Roll up history every `interval` seconds"""
+        self.running = True
+        logger.info(f"Starting history rollups (every {self.interval}s)")
+
+        while self.running:
+            try:
+                await asyncio.sleep(self.interval)
+                if not self.running:
+                    break
+                await db_writer.run(self.roll_up)
+            except asyncio.CancelledError:
+                logger.info("History rollup task cancelled")
+                break
+            except Exception as e:
+                logger.error(f"Error in history rollup loop: {e}")
+
+    def stop(self):
+        """Stop the rollup loop"""
+        self.running = False
+        if self.task:
+            self.task.cancel()
+
+
+# Global instance
+history_rollups = HistoryRollups()
@@ -0,0 +1,77 @@
+"""
+Service Check Scheduler
+
+Keeps a min-heap of upcoming health checks so every service runs on its own
+cadence instead of one global sweep.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class CheckScheduler:
+    """Priority queue of service checks keyed by monotonic due time"""
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, str]] = []
+        self._due: Dict[str, float] = {}
+        self._counter = itertools.count()  # Tie-breaker for equal due times
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def __contains__(self, service_id: str) -> bool:
+        return service_id in self._due
+
+    def schedule(self, service_id: str, delay: float) -> None:
+        """Schedule (or reschedule) a service check `delay` seconds from now"""
+        due = time.monotonic() + max(delay, 0.0)
+        self._due[service_id] = due
+        heapq.heappush(self._heap, (due, next(self._counter), service_id))
+        self._wakeup.set()
+
+    def unschedule(self, service_id: str) -> None:
+        """Drop a service from the schedule (its heap entry is skipped lazily)"""
+        self._due.pop(service_id, None)
+
+    def clear(self) -> None:
+        """Remove all scheduled checks"""
+        self._heap.clear()
+        self._due.clear()
+
+    def pop_due(self) -> List[str]:
+        """Pop every service whose check is due now"""
+        now = time.monotonic()
+        due_ids = []
+        while self._heap and self._heap[0][0] <= now:
+            due, _, service_id = heapq.heappop(self._heap)
+            # Skip stale entries left behind by reschedule/unschedule
+            if self._due.get(service_id) != due:
+                continue
+            del self._due[service_id]
+            due_ids.append(service_id)
+        return due_ids
+
+    def time_until_next(self) -> Optional[float]:
+        """Seconds until the next live entry is due, or None if empty"""
+        while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - time.monotonic(), 0.0)
+
+    async def wait(self, max_wait: float = 60.0) -> None:
+        """Sleep until the next check is due or the schedule changes"""
+        delay = self.time_until_next()
+        if delay is not None and delay <= 0:
+            return
+        timeout = max_wait if delay is None else min(delay, max_wait)
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -108,12 +108,14 @@ class StatsCache:
             if config and config.get("url") and config.get("token"):
                 plex_stats["configured"] = True
 
-                # Get peak concurrent from database
-                session = db.get_session()
                 try:
-                    stats_db = session.query(PlexStatsDB).first()
-                    if stats_db:
-                        plex_stats["peak_concurrent"] = stats_db.peak_concurrent or 0
+                    # Get peak concurrent from database
+                    peak = await db.run_in_session(
+                        lambda session: session.query(PlexStatsDB.peak_concurrent)
+                        .limit(1)
+                        .scalar()
+                    )
+                    plex_stats["peak_concurrent"] = peak or 0
 
                     # Fetch live statistics
                     total_users, total_movies, total_tv_shows = (
@@ -125,8 +127,6 @@ class StatsCache:
 
                 except Exception as e:
                     logger.debug(f"Error fetching Plex stats: {e}")
-                finally:
-                    session.close()
 
             return plex_stats
 
@@ -144,14 +144,21 @@ class StatsCache:
         """Get traffic statistics summary"""
         try:
             from app.database import db, TrafficHistoryDB
+            from app.services.tsdb import to_micros, tsdb
             from datetime import datetime, timedelta
             from sqlalchemy import func
 
-            session = db.get_session()
-            try:
-                # Get last 24 hours of traffic
-                yesterday = datetime.now() - timedelta(hours=24)
+            # Get last 24 hours of traffic
+            yesterday = datetime.now() - timedelta(hours=24)
 
+            def load_totals(session):
+                if tsdb.handles("traffic"):
+                    sums = tsdb.column_sums(
+                        "traffic",
+                        ("total_down", "total_up"),
+                        to_micros(datetime.now(timezone.utc) - timedelta(hours=24)),
+                    )
+                    return sums["total_down"], sums["total_up"]
                 result = (
                     session.query(
                         func.sum(TrafficHistoryDB.total_down).label("total_download"),
@@ -160,18 +167,19 @@ class StatsCache:
                     .filter(TrafficHistoryDB.timestamp >= yesterday)
                     .first()
                 )
+                if not result:
+                    return 0, 0
+                return result.total_download, result.total_upload
 
-                total_download = int(result.total_download or 0) if result else 0
-                total_upload = int(result.total_upload or 0) if result else 0
-
-                return {
-                    "last_24h_download_bytes": total_download,
-                    "last_24h_upload_bytes": total_upload,
-                    "last_24h_total_bytes": total_download + total_upload,
-                }
+            total_download, total_upload = (
+                int(total or 0) for total in await db.run_in_session(load_totals)
+            )
 
-            finally:
-                session.close()
+            return {
+                "last_24h_download_bytes": total_download,
+                "last_24h_upload_bytes": total_upload,
+                "last_24h_total_bytes": total_download + total_upload,
+            }
 
         except Exception as e:
             logger.error(f"Error getting traffic stats: {e}")
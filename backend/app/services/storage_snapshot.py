@@ -0,0 +1,87 @@
+"""
+Storage Snapshot Encoding
+
+Splits a service's StorageMetrics into a topology part (host, RAID arrays,
+ZFS pools, disks) that rarely changes and a usage part (path usage, ZFS
+allocation, disk I/O counters) that changes with every agent report. Each
+part is stored as zlib-compressed compact JSON and only rewritten when its
+content hash changes.
+"""
+
+import hashlib
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from app.models.storage import StorageMetrics
+
+# ZFS pool fields that move with every write
+ZFS_USAGE_FIELDS = ("allocated", "free", "capacity")
+
+# Disk fields that are I/O counters
+DISK_COUNTER_FIELDS = ("read_bytes", "write_bytes", "read_count", "write_count")
+
+
+def split_storage(storage: StorageMetrics) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Split storage metrics into (topology, usage) dicts.
+
+    last_updated belongs to neither; it has its own column.
+    """
+    data = storage.model_dump(mode="json", exclude={"last_updated"})
+    zfs_usage: Dict[str, list] = {}
+    for pool in data["zfs_pools"]:
+        zfs_usage[pool["pool"]] = [pool.pop(field) for field in ZFS_USAGE_FIELDS]
+    disk_usage: Dict[str, list] = {}
+    for disk in data["disks"]:
+        disk_usage[disk["device"]] = [disk.pop(field) for field in DISK_COUNTER_FIELDS]
+
+    usage = {
+        "storage_paths": data.pop("storage_paths"),
+        "zfs_pools": zfs_usage,
+        "disks": disk_usage,
+    }
+    return data, usage
+
+
+def join_storage(
+    topology: Dict[str, Any],
+    usage: Optional[Dict[str, Any]],
+    last_updated: Optional[datetime],
+) -> StorageMetrics:
+    """Rebuild storage metrics from their parts (usage may be missing)"""
+    usage = usage or {}
+    zfs_usage = usage.get("zfs_pools", {})
+    disk_usage = usage.get("disks", {})
+    for pool in topology.get("zfs_pools", []):
+        values = zfs_usage.get(pool["pool"], [None] * len(ZFS_USAGE_FIELDS))
+        pool.update(zip(ZFS_USAGE_FIELDS, values))
+    for disk in topology.get("disks", []):
+        values = disk_usage.get(disk["device"], [None] * len(DISK_COUNTER_FIELDS))
+        disk.update(zip(DISK_COUNTER_FIELDS, values))
+    return StorageMetrics(
+        **topology,
+        storage_paths=usage.get("storage_paths", []),
+        last_updated=last_updated,
+    )
+
+
+def serialize(part: Dict[str, Any]) -> Tuple[bytes, bytes]:
+    """Compact JSON of a part and its content hash"""
+    raw = json.dumps(part, separators=(",", ":"), sort_keys=True).encode()
+    return raw, hashlib.blake2b(raw, digest_size=16).digest()
+
+
+def compress(raw: bytes) -> bytes:
+    """Encode serialized JSON for a storage_topology/storage_usage column"""
+    return zlib.compress(raw)
+
+
+def decode(blob: bytes) -> Dict[str, Any]:
+    """Decode a storage_topology/storage_usage column value"""
+    return json.loads(zlib.decompress(blob))
+
+
+def storage_hashes(storage: StorageMetrics) -> Tuple[bytes, bytes]:
+    """Content hashes of the (topology, usage) parts"""
+    topology, usage = split_storage(storage)
+    return serialize(topology)[1], serialize(usage)[1]
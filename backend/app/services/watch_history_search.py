@@ -0,0 +1,150 @@
+"""
+Watch History Search
+
+Full-text search over watch history titles, series names, users, studios
+and genres. SQLite uses an FTS5 index kept in sync by triggers, PostgreSQL a
+GIN index over a tsvector expression. Every query term is matched as a
+prefix and results are ranked by relevance, then by most recent view.
+"""
+
+import re
+from typing import Any, Dict, List, Tuple
+from sqlalchemy import and_, func, or_, select, text
+from sqlalchemy.orm import Session
+from app.database import WatchHistoryDB
+
+FTS_TABLE = "watch_history_fts"
+
+# Indexed columns, most important first; SQLite bm25() weights match the order
+SEARCH_COLUMNS = (
+    "title",
+    "grandparent_title",
+    "username",
+    "email",
+    "studio",
+    "genres",
+)
+BM25_WEIGHTS = (10.0, 8.0, 3.0, 2.0, 1.0, 1.0)
+
+# PostgreSQL document expression; queries must repeat it exactly to use the
+# GIN index created by the migration
+PG_DOCUMENT = "to_tsvector('simple', {})".format(
+    " || ' ' || ".join(f"coalesce({column}, '')" for column in SEARCH_COLUMNS)
+)
+
+# Terms beyond this are ignored
+MAX_TERMS = 8
+
+_fts5_available: bool | None = None
+
+
+def query_terms(query: str) -> List[str]:
+    """Lowercased word tokens of a search query"""
+    return re.findall(r"\w+", query.lower())[:MAX_TERMS]
+
+
+def fts5_available(session: Session) -> bool:
+    """Whether the SQLite FTS5 index exists (checked once)"""
+    global _fts5_available
+    if _fts5_available is None:
+        _fts5_available = (
+            session.execute(
+                text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"
+                ),
+                {"name": FTS_TABLE},
+            ).first()
+            is not None
+        )
+    return _fts5_available
+
+
+def search_ids(
+    session: Session, query: str, limit: int, offset: int
+) -> Tuple[List[int], int]:
+    """Ids of one page of matching rows, best match first, and the total.
+
+    Blocking; call it through db.run_in_session().
+    """
+    terms = query_terms(query)
+    if not terms:
+        return [], 0
+    if session.get_bind().dialect.name == "postgresql":
+        return _search_postgresql(session, terms, limit, offset)
+    if fts5_available(session):
+        return _search_fts5(session, terms, limit, offset)
+    return _search_like(session, terms, limit, offset)
+
+
+def _search_fts5(
+    session: Session, terms: List[str], limit: int, offset: int
+) -> Tuple[List[int], int]:
+    # Quoted terms can't be read as FTS5 operators; "term"* is a prefix match
+    match = " ".join(f'"{term}"*' for term in terms)
+    weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+    total = session.execute(
+        text(f"SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :match"),
+        {"match": match},
+    ).scalar()
+    ids = session.execute(
+        text(
+            f"SELECT w.id FROM {FTS_TABLE} f "
+            f"JOIN watch_history w ON w.id = f.rowid "
+            f"WHERE {FTS_TABLE} MATCH :match "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}), w.viewed_at DESC "
+            f"LIMIT :limit OFFSET :offset"
+        ),
+        {"match": match, "limit": limit, "offset": offset},
+    ).scalars()
+    return list(ids), total or 0
+
+
+def _search_postgresql(
+    session: Session, terms: List[str], limit: int, offset: int
+) -> Tuple[List[int], int]:
+    # Terms are \w+ tokens, so they are safe inside to_tsquery()
+    tsquery = " & ".join(f"{term}:*" for term in terms)
+    params = {"tsquery": tsquery, "limit": limit, "offset": offset}
+    where = f"{PG_DOCUMENT} @@ to_tsquery('simple', :tsquery)"
+    total = session.execute(
+        text(f"SELECT count(*) FROM watch_history WHERE {where}"), params
+    ).scalar()
+    ids = session.execute(
+        text(
+            f"SELECT id FROM watch_history WHERE {where} "
+            f"ORDER BY ts_rank({PG_DOCUMENT}, to_tsquery('simple', :tsquery)) DESC, "
+            f"viewed_at DESC LIMIT :limit OFFSET :offset"
+        ),
+        params,
+    ).scalars()
+    return list(ids), total or 0
+
+
+def _search_like(
+    session: Session, terms: List[str], limit: int, offset: int
+) -> Tuple[List[int], int]:
+    """Unranked fallback for SQLite builds without FTS5"""
+    columns = [getattr(WatchHistoryDB, column) for column in SEARCH_COLUMNS]
+    condition = and_(
+        *(or_(*(column.ilike(f"%{term}%") for column in columns)) for term in terms)
+    )
+    total = session.execute(
+        select(func.count()).select_from(WatchHistoryDB).where(condition)
+    ).scalar()
+    ids = session.execute(
+        select(WatchHistoryDB.id)
+        .where(condition)
+        .order_by(WatchHistoryDB.viewed_at.desc())
+        .limit(limit)
+        .offset(offset)
+    ).scalars()
+    return list(ids), total or 0
+
+
+def load_ordered(session: Session, ids: List[int]) -> List[Any]:
+    """WatchHistoryDB rows for `ids`, in the same order"""
+    if not ids:
+        return []
+    rows = session.query(WatchHistoryDB).filter(WatchHistoryDB.id.in_(ids)).all()
+    by_id: Dict[int, Any] = {row.id: row for row in rows}
+    return [by_id[row_id] for row_id in ids if row_id in by_id]
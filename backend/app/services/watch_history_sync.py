@@ -2,10 +2,13 @@
 
 import asyncio
 from datetime import datetime, timezone
+from sqlalchemy import update
+from sqlalchemy.orm import Session
 from app.utils.logger import logger
 from app.database import db, WatchHistoryDB
 from app.api.plex import load_plex_config
-from typing import Optional
+from app.services.db_writer import db_writer
+from typing import Any, Dict, List, Optional, Tuple
 
 
 class WatchHistorySync:
@@ -23,180 +26,208 @@ class WatchHistorySync:
                 logger.debug("Plex not configured, skipping watch history sync")
                 return
 
-            plex_url = config["url"].rstrip("/")
-            token = config["token"]
+            # plexapi and the session are both blocking. The Plex round trips
+            # can take seconds, so this uses the default executor rather than
+            # tying up a database worker.
+            collected = await asyncio.to_thread(self._sync, config)
+            if collected is None:
+                return
 
-            from plexapi.server import PlexServer
+            new_rows, view_counts = collected
+            await db_writer.submit(self._store, new_rows, view_counts)
+            logger.info(
+                f"Watch history sync complete: {len(new_rows)} new, "
+                f"{len(view_counts)} updated"
+            )
 
-            # Set shorter timeout to avoid blocking
-            try:
-                plex = PlexServer(plex_url, token, timeout=15)
-            except Exception as conn_error:
-                logger.warning(f"Could not connect to Plex server: {conn_error}")
-                return
+        except Exception as e:
+            logger.error(f"Error syncing watch history: {e}")
 
-            # Fetch history (limit to last 200 items to keep it manageable)
-            logger.info("Syncing Plex watch history to database...")
-            history_entries = plex.history(maxresults=200)
+    def _sync(
+        self, config: Dict[str, Any]
+    ) -> Optional[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """Blocking body of sync_watch_history(): read Plex history and
+        return (new rows, view count updates) for the database writer"""
+        plex_url = config["url"].rstrip("/")
+        token = config["token"]
 
-            # Build account lookup
-            account_lookup = {}
-            try:
-                for account in plex.systemAccounts():
-                    name = (
-                        getattr(account, "name", None)
-                        or getattr(account, "username", None)
-                        or getattr(account, "title", None)
-                        or "Unknown User"
-                    )
-                    account_id = str(getattr(account, "id", ""))
-                    if account_id:
-                        account_lookup[account_id] = name
-            except Exception as exc:
-                logger.warning(f"Failed to build account lookup: {exc}")
+        from plexapi.server import PlexServer
 
-            session = db.get_session()
-            new_count = 0
-            updated_count = 0
+        # Set shorter timeout to avoid blocking
+        try:
+            plex = PlexServer(plex_url, token, timeout=15)
+        except Exception as conn_error:
+            logger.warning(f"Could not connect to Plex server: {conn_error}")
+            return None
 
-            try:
-                for entry in history_entries:
-                    try:
-                        # Extract user info
-                        user_name = "Unknown"
-                        user_id = None
-                        email = None
-
-                        account = getattr(entry, "account", None)
-                        if account:
-                            user_name = (
-                                getattr(account, "title", None)
-                                or getattr(account, "name", None)
-                                or getattr(account, "username", None)
-                                or "Unknown"
-                            )
-                            user_id = getattr(account, "id", None)
+        # Fetch history (limit to last 200 items to keep it manageable)
+        logger.info("Syncing Plex watch history to database...")
+        history_entries = plex.history(maxresults=200)
 
-                        if not user_id:
-                            user_id = getattr(entry, "accountID", None)
+        # Build account lookup
+        account_lookup = {}
+        try:
+            for account in plex.systemAccounts():
+                name = (
+                    getattr(account, "name", None)
+                    or getattr(account, "username", None)
+                    or getattr(account, "title", None)
+                    or "Unknown User"
+                )
+                account_id = str(getattr(account, "id", ""))
+                if account_id:
+                    account_lookup[account_id] = name
+        except Exception as exc:
+            logger.warning(f"Failed to build account lookup: {exc}")
 
-                        if user_id and str(user_id) in account_lookup:
-                            user_name = account_lookup[str(user_id)]
+        # Read-only here; the writes go through the database writer
+        session = db.get_session()
+        new_rows: List[Dict[str, Any]] = []
+        view_counts: List[Dict[str, Any]] = []
 
-                        # Extract media info
-                        media_type = getattr(entry, "type", "unknown")
-                        title = getattr(entry, "title", None)
+        try:
+            for entry in history_entries:
+                try:
+                    # Extract user info
+                    user_name = "Unknown"
+                    user_id = None
+                    email = None
+
+                    account = getattr(entry, "account", None)
+                    if account:
+                        user_name = (
+                            getattr(account, "title", None)
+                            or getattr(account, "name", None)
+                            or getattr(account, "username", None)
+                            or "Unknown"
+                        )
+                        user_id = getattr(account, "id", None)
 
-                        # Skip entries without a title
-                        if not title:
-                            logger.debug(
-                                f"Skipping entry without title (rating_key: {getattr(entry, 'ratingKey', 'unknown')})"
-                            )
-                            continue
-
-                        grandparent_title = getattr(entry, "grandparentTitle", None)
-                        parent_index = getattr(entry, "parentIndex", None)
-                        index = getattr(entry, "index", None)
-                        rating_key = getattr(entry, "ratingKey", None)
-
-                        # Viewing info
-                        viewed_at = getattr(entry, "viewedAt", None)
-                        if not viewed_at:
-                            continue  # Skip if no timestamp
-
-                        # Check if this entry already exists
-                        query = session.query(WatchHistoryDB).filter(
-                            WatchHistoryDB.rating_key == rating_key,
-                            WatchHistoryDB.viewed_at == viewed_at.replace(tzinfo=None),
+                    if not user_id:
+                        user_id = getattr(entry, "accountID", None)
+
+                    if user_id and str(user_id) in account_lookup:
+                        user_name = account_lookup[str(user_id)]
+
+                    # Extract media info
+                    media_type = getattr(entry, "type", "unknown")
+                    title = getattr(entry, "title", None)
+
+                    # Skip entries without a title
+                    if not title:
+                        logger.debug(
+                            f"Skipping entry without title (rating_key: {getattr(entry, 'ratingKey', 'unknown')})"
                         )
+                        continue
 
-                        # Add user_id filter only if user_id exists
-                        if user_id:
-                            query = query.filter(WatchHistoryDB.user_id == str(user_id))
+                    grandparent_title = getattr(entry, "grandparentTitle", None)
+                    parent_index = getattr(entry, "parentIndex", None)
+                    index = getattr(entry, "index", None)
+                    rating_key = getattr(entry, "ratingKey", None)
 
-                        existing = query.first()
+                    # Viewing info
+                    viewed_at = getattr(entry, "viewedAt", None)
+                    if not viewed_at:
+                        continue  # Skip if no timestamp
 
-                        if existing:
-                            # Update view count if re-watched
-                            existing.view_count = int(getattr(entry, "viewCount", 1))  # type: ignore
-                            updated_count += 1
-                            continue
+                    # Check if this entry already exists
+                    query = session.query(WatchHistoryDB).filter(
+                        WatchHistoryDB.rating_key == rating_key,
+                        WatchHistoryDB.viewed_at == viewed_at.replace(tzinfo=None),
+                    )
 
-                        # Get duration and metadata
-                        duration = getattr(entry, "duration", None)
-                        view_count = int(getattr(entry, "viewCount", 1))
-                        view_offset = getattr(entry, "viewOffset", 0)
+                    # Add user_id filter only if user_id exists
+                    if user_id:
+                        query = query.filter(WatchHistoryDB.user_id == str(user_id))
 
-                        content_rating = getattr(entry, "contentRating", None)
-                        studio = getattr(entry, "studio", None)
-                        summary = getattr(entry, "summary", None)
-                        year = getattr(entry, "year", None)
-                        rating = getattr(entry, "rating", None)
+                    existing = query.first()
 
-                        genres = []
+                    if existing:
+                        # Update view count if re-watched
+                        view_counts.append(
+                            {
+                                "id": existing.id,
+                                "view_count": int(getattr(entry, "viewCount", 1)),
+                            }
+                        )
+                        continue
+
+                    # Get duration and metadata
+                    duration = getattr(entry, "duration", None)
+                    view_count = int(getattr(entry, "viewCount", 1))
+                    view_offset = getattr(entry, "viewOffset", 0)
+
+                    content_rating = getattr(entry, "contentRating", None)
+                    studio = getattr(entry, "studio", None)
+                    summary = getattr(entry, "summary", None)
+                    year = getattr(entry, "year", None)
+                    rating = getattr(entry, "rating", None)
+
+                    genres = []
+                    try:
+                        genre_objs = getattr(entry, "genres", [])
+                        genres = [g.tag for g in genre_objs] if genre_objs else []
+                    except:
+                        pass
+
+                    # Fetch metadata if missing
+                    if rating_key and (
+                        not duration or not content_rating or not genres
+                    ):
                         try:
-                            genre_objs = getattr(entry, "genres", [])
-                            genres = [g.tag for g in genre_objs] if genre_objs else []
-                        except:
-                            pass
-
-                        # Fetch metadata if missing
-                        if rating_key and (
-                            not duration or not content_rating or not genres
-                        ):
-                            try:
-                                media_item = plex.fetchItem(rating_key)
-                                if not duration:
-                                    duration = getattr(media_item, "duration", 0)
-                                if not content_rating:
-                                    content_rating = getattr(
-                                        media_item, "contentRating", None
-                                    )
-                                if not studio:
-                                    studio = getattr(media_item, "studio", None)
-                                if not summary:
-                                    summary = getattr(media_item, "summary", None)
-                                if not year:
-                                    year = getattr(media_item, "year", None)
-                                if not rating:
-                                    rating = getattr(media_item, "rating", None)
-                                if not genres:
-                                    try:
-                                        genre_objs = getattr(media_item, "genres", [])
-                                        genres = (
-                                            [g.tag for g in genre_objs]
-                                            if genre_objs
-                                            else []
-                                        )
-                                    except Exception:
-                                        pass
-                            except Exception as fetch_error:
-                                logger.debug(
-                                    f"Could not fetch metadata for {rating_key}: {fetch_error}"
+                            media_item = plex.fetchItem(rating_key)
+                            if not duration:
+                                duration = getattr(media_item, "duration", 0)
+                            if not content_rating:
+                                content_rating = getattr(
+                                    media_item, "contentRating", None
                                 )
+                            if not studio:
+                                studio = getattr(media_item, "studio", None)
+                            if not summary:
+                                summary = getattr(media_item, "summary", None)
+                            if not year:
+                                year = getattr(media_item, "year", None)
+                            if not rating:
+                                rating = getattr(media_item, "rating", None)
+                            if not genres:
+                                try:
+                                    genre_objs = getattr(media_item, "genres", [])
+                                    genres = (
+                                        [g.tag for g in genre_objs]
+                                        if genre_objs
+                                        else []
+                                    )
+                                except Exception:
+                                    pass
+                        except Exception as fetch_error:
+                            logger.debug(
+                                f"Could not fetch metadata for {rating_key}: {fetch_error}"
+                            )
 
-                        # Get thumbnail
-                        thumb = None
-                        if media_type == "episode":
-                            thumb = getattr(entry, "grandparentThumb", None)
-                        if not thumb:
-                            thumb = getattr(entry, "thumb", None)
-                        if thumb and not thumb.startswith("http"):
-                            thumb = f"{plex_url}{thumb}?X-Plex-Token={token}"
-
-                        # Convert to seconds
-                        duration_seconds = int(duration / 1000) if duration else 0
-                        view_offset_seconds = (
-                            int(view_offset / 1000) if view_offset else 0
-                        )
+                    # Get thumbnail
+                    thumb = None
+                    if media_type == "episode":
+                        thumb = getattr(entry, "grandparentThumb", None)
+                    if not thumb:
+                        thumb = getattr(entry, "thumb", None)
+                    if thumb and not thumb.startswith("http"):
+                        thumb = f"{plex_url}{thumb}?X-Plex-Token={token}"
+
+                    # Convert to seconds
+                    duration_seconds = int(duration / 1000) if duration else 0
+                    view_offset_seconds = (
+                        int(view_offset / 1000) if view_offset else 0
+                    )
 
-                        # Calculate progress
-                        progress = 0
-                        if duration_seconds > 0 and view_offset_seconds > 0:
-                            progress = (view_offset_seconds / duration_seconds) * 100
+                    # Calculate progress
+                    progress = 0
+                    if duration_seconds > 0 and view_offset_seconds > 0:
+                        progress = (view_offset_seconds / duration_seconds) * 100
 
-                        # Create new entry
-                        new_entry = WatchHistoryDB(
+                    # Create new entry
+                    new_rows.append(
+                        dict(
                             user_id=str(user_id) if user_id else None,
                             email=email,
                             username=user_name,
@@ -219,27 +250,37 @@ class WatchHistorySync:
                             summary=summary,
                             genres=",".join(genres) if genres else None,
                         )
+                    )
 
-                        session.add(new_entry)
-                        new_count += 1
-
-                    except Exception as item_error:
-                        logger.error(f"Error processing history item: {item_error}")
-                        continue
-
-                session.commit()
-                logger.info(
-                    f"Watch history sync complete: {new_count} new, {updated_count} updated"
-                )
-
-            except Exception as db_error:
-                logger.error(f"Database error during sync: {db_error}")
-                session.rollback()
-            finally:
-                session.close()
-
-        except Exception as e:
-            logger.error(f"Error syncing watch history: {e}")
+                except Exception as item_error:
+                    logger.error(f"Error processing history item: {item_error}")
+                    continue
+
+        except Exception as db_error:
+            logger.error(f"Database error during sync: {db_error}")
+            return None
+        finally:
+            session.close()
+
+        return new_rows, view_counts
+
+    @staticmethod
+    def _store(
+        session: Session,
+        new_rows: List[Dict[str, Any]],
+        view_counts: List[Dict[str, Any]],
+    ) -> None:
+        """Write a sync's rows (a database writer job)"""
+        if view_counts:
+            session.execute(update(WatchHistoryDB), view_counts)
+        if new_rows:
+            # An entry listed twice by Plex is stored once
+            session.execute(
+                db.insert(WatchHistoryDB).on_conflict_do_nothing(
+                    index_elements=["user_id", "rating_key", "viewed_at"]
+                ),
+                new_rows,
+            )
 
     async def start_sync_loop(self, interval: int = 900):
         """Start the background sync loop (default: every 15 minutes)"""
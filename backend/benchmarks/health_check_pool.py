@@ -0,0 +1,106 @@
+"""
+Health Check Client Pool Benchmark
+
+Sweeps many HTTP services on a local server and compares the monitor's
+shared, keep-alive client pool with opening a new client per check. Runs
+on its own, against a throwaway database:
+
+    python benchmarks/health_check_pool.py --services 200 --sweeps 5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import httpx
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("LOG_ENABLE_FILE", "false")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.models.service import Service  # noqa: E402
+from app.services.monitor import monitor  # noqa: E402
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+
+    def setup(self):
+        super().setup()
+        Handler.connections += 1
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+async def per_check_client(service: Service) -> None:
+    """What each check did before the shared pool"""
+    async with httpx.AsyncClient(timeout=monitor.check_timeout) as client:
+        response = await client.get(service.url)
+        response.raise_for_status()
+
+
+async def sweep(check, services) -> float:
+    started = time.perf_counter()
+    await asyncio.gather(*(check(service) for service in services))
+    return time.perf_counter() - started
+
+
+async def main(args: argparse.Namespace):
+    server = Server(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    services = [
+        Service(
+            id=f"bench-{i}",
+            name=f"bench-{i}",
+            url=f"{url}/{i}",
+            type="website",
+            probe="get",
+        )
+        for i in range(args.services)
+    ]
+
+    for label, check in (
+        ("new client per check", per_check_client),
+        ("shared pool", monitor.check_service),
+    ):
+        Handler.connections = 0
+        times = [await sweep(check, services) for _ in range(args.sweeps)]
+        print(
+            f"{label:22s} first sweep {times[0] * 1000:7.1f}ms, "
+            f"later sweeps {sum(times[1:]) / max(1, len(times) - 1) * 1000:7.1f}ms, "
+            f"{Handler.connections} connections opened"
+        )
+
+    offline = [service.name for service in services if service.status != "online"]
+    if offline:
+        print(f"{len(offline)} checks failed")
+    await monitor.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Health check client benchmark")
+    parser.add_argument("--services", type=int, default=200)
+    parser.add_argument("--sweeps", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
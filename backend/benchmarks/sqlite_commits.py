@@ -0,0 +1,61 @@
+"""
+SQLite Commit Benchmark
+
+Times single-row insert + commit cycles on a throwaway database, with
+SQLite's defaults and with the connection profile the app applies (WAL,
+synchronous=NORMAL, mmap, cache size, busy timeout). Uses the sqlite3
+module directly, so the numbers are the database's rather than
+SQLAlchemy's:
+
+    python benchmarks/sqlite_commits.py --commits 2000
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "app.db"))
+os.environ.setdefault("LOG_ENABLE_FILE", "false")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database import Database  # noqa: E402
+
+
+def commits_per_second(tuned: bool, commits: int) -> float:
+    conn = sqlite3.connect(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    if tuned:
+        Database._configure_connection(conn, None)
+    conn.execute(
+        "CREATE TABLE response_history (id INTEGER PRIMARY KEY, "
+        "service_id TEXT NOT NULL, timestamp DATETIME NOT NULL, response_time FLOAT)"
+    )
+    conn.execute(
+        "CREATE INDEX ix_response_history_service_timestamp "
+        "ON response_history (service_id, timestamp DESC)"
+    )
+    conn.commit()
+
+    started = time.perf_counter()
+    for i in range(commits):
+        conn.execute(
+            "INSERT INTO response_history (service_id, timestamp, response_time) "
+            "VALUES (?, ?, ?)",
+            ("bench", f"2026-01-01 00:00:{i:08d}", 1.0),
+        )
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return commits / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite commit benchmark")
+    parser.add_argument("--commits", type=int, default=2000)
+    args = parser.parse_args()
+    for label, tuned in (("SQLite defaults", False), ("app profile", True)):
+        rate = commits_per_second(tuned, args.commits)
+        print(f"{label:16s} {rate:8.0f} commits/s")
@@ -0,0 +1,101 @@
+"""
+Startup Load Benchmark
+
+Seeds a throwaway database with services and their response and traffic
+history, then times how long a fresh process takes to import the monitor
+(which loads every service and its recent history) and to build every
+service's data points on first access:
+
+    python benchmarks/startup_load.py --services 300 --rows 600
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+def seed(services: int, rows: int) -> None:
+    from sqlalchemy import insert
+    from app.database import db, ResponseHistoryDB, ServiceDB, TrafficHistoryDB
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    session = db.get_session()
+    try:
+        for i in range(services):
+            service_id = f"bench-{i}"
+            session.add(
+                ServiceDB(
+                    id=service_id,
+                    name=service_id,
+                    url=f"http://127.0.0.1:9/{i}",
+                    type="app",
+                    status="online",
+                )
+            )
+            timestamps = [now - timedelta(seconds=2 * j) for j in range(rows)]
+            session.execute(
+                insert(ResponseHistoryDB),
+                [
+                    {"service_id": service_id, "timestamp": ts, "response_time": 1.0}
+                    for ts in timestamps
+                ],
+            )
+            session.execute(
+                insert(TrafficHistoryDB),
+                [
+                    {
+                        "service_id": service_id,
+                        "timestamp": ts,
+                        "bandwidth_up": 1.0,
+                        "bandwidth_down": 2.0,
+                        "total_up": 3.0,
+                        "total_down": 4.0,
+                    }
+                    for ts in timestamps
+                ],
+            )
+        session.commit()
+    finally:
+        session.close()
+
+
+def measure() -> None:
+    started = time.perf_counter()
+    from app.services.monitor import monitor
+
+    loaded = time.perf_counter()
+    services = monitor.get_all_services()
+    hydrated = time.perf_counter()
+    print(
+        f"{len(services)} services: import and load {loaded - started:.2f}s, "
+        f"first access {hydrated - loaded:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(BACKEND))
+    if os.environ.get("BENCH_MEASURE"):
+        measure()
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Startup load benchmark")
+    parser.add_argument("--services", type=int, default=300)
+    parser.add_argument("--rows", type=int, default=600, help="per series")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["LOG_ENABLE_FILE"] = "false"
+    seed(args.services, args.rows)
+    # A fresh interpreter, so the import is timed from cold
+    subprocess.run(
+        [sys.executable, __file__],
+        env={**os.environ, "BENCH_MEASURE": "1"},
+        check=True,
+    )
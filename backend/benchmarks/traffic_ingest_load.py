@@ -0,0 +1,111 @@
+"""
+Traffic Ingest Load Test
+
+Many agents post POST /api/traffic/update concurrently, optionally while a
+dashboard WebSocket is connected, and the request latencies are reported.
+Runs against a server started separately, e.g. from backend/:
+
+    python -m uvicorn app.main:app --port 8765 --log-level warning
+    python benchmarks/traffic_ingest_load.py --url http://127.0.0.1:8765
+
+Use a throwaway data directory: the agents' services are created for the
+run and deleted afterwards, but their history stays.
+"""
+
+import argparse
+import asyncio
+import time
+from typing import List
+
+import httpx
+import websockets
+
+
+async def create_services(client: httpx.AsyncClient, count: int) -> List[str]:
+    ids = []
+    for i in range(count):
+        response = await client.post(
+            "/api/services/",
+            json={
+                "name": f"load-agent-{i}",
+                "url": f"http://127.0.0.1:9/{i}",
+                "type": "server",
+                "check_interval": 3600,
+            },
+        )
+        response.raise_for_status()
+        ids.append(response.json()["id"])
+    return ids
+
+
+async def watch(url: str, received: List[int]):
+    """Read dashboard frames until cancelled"""
+    async with websockets.connect(f"{url}/api/traffic/ws", max_size=None) as ws:
+        while True:
+            await ws.recv()
+            received[0] += 1
+
+
+async def agent(
+    client: httpx.AsyncClient, service_id: str, samples: int, latencies: List[float]
+):
+    for k in range(samples):
+        started = time.perf_counter()
+        response = await client.post(
+            "/api/traffic/update",
+            json={
+                "service_id": service_id,
+                "bandwidth_up": float(k),
+                "bandwidth_down": 1.0,
+                "total_up": float(k),
+                "total_down": float(k),
+            },
+        )
+        latencies.append(time.perf_counter() - started)
+        response.raise_for_status()
+
+
+async def main(args: argparse.Namespace):
+    limits = httpx.Limits(max_connections=args.agents)
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=30, limits=limits
+    ) as client:
+        ids = await create_services(client, args.agents)
+        received = [0]
+        watcher = None
+        if not args.no_websocket:
+            ws_url = args.url.replace("http", "ws", 1)
+            watcher = asyncio.create_task(watch(ws_url, received))
+            await asyncio.sleep(0.5)
+
+        latencies: List[float] = []
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(
+                *(agent(client, sid, args.samples, latencies) for sid in ids)
+            )
+            elapsed = time.perf_counter() - started
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            for service_id in ids:
+                await client.delete(f"/api/services/{service_id}")
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(
+        f"{len(latencies)} samples in {elapsed:.2f}s = "
+        f"{len(latencies) / elapsed:.0f} samples/s, "
+        f"p50 {p50:.1f}ms, p99 {p99:.1f}ms, "
+        f"{received[0]} WebSocket frames"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Traffic ingest load test")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--agents", type=int, default=50)
+    parser.add_argument("--samples", type=int, default=100, help="per agent")
+    parser.add_argument("--no-websocket", action="store_true")
+    asyncio.run(main(parser.parse_args()))
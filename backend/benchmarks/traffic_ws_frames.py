@@ -0,0 +1,114 @@
+"""
+Traffic WebSocket Frame Benchmark
+
+Builds traffic WebSocket snapshot and delta frames for N synthetic
+services in each encoding (plain JSON, komandorr.columnar and, when
+msgpack is installed, komandorr.msgpack) and reports the frame size, the
+encode time, and the size after permessage-deflate with uvicorn's default
+settings (12-bit window, memLevel 5). Snapshots carry 60 points per
+service; deltas have every service changed with one new point.
+
+    python benchmarks/traffic_ws_frames.py --services 10 100 1000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+os.environ.setdefault("DATABASE_PATH", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("LOG_ENABLE_FILE", "false")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.api import traffic  # noqa: E402
+from app.models.service import Service, TrafficMetrics  # noqa: E402
+
+ENCODINGS = [("json", None), ("columnar", traffic.COLUMNAR_PROTOCOL)]
+if traffic.MSGPACK_AVAILABLE:
+    ENCODINGS.append(("msgpack", traffic.MSGPACK_PROTOCOL))
+
+
+def deflate(frame: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -12, 5)
+    return compressor.compress(frame) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def timed(build, runs: int):
+    started = time.perf_counter()
+    for _ in range(runs):
+        result = build()
+    return (time.perf_counter() - started) / runs * 1000, result
+
+
+def make_services(count: int):
+    now = datetime.now(timezone.utc)
+    services = []
+    for i in range(count):
+        service = Service(
+            id=f"{i:08x}-0000-0000-0000-{i:012x}",
+            name=f"server-{i}",
+            url="http://127.0.0.1:9/",
+            type="server",
+        )
+        service.traffic = TrafficMetrics(
+            bandwidth_up=random.random() * 100,
+            bandwidth_down=random.random() * 100,
+            total_up=random.random() * 1e4,
+            total_down=random.random() * 1e4,
+            last_updated=now,
+        )
+        for k in range(traffic.SNAPSHOT_POINTS + 1):
+            service.traffic_history.append_values(
+                now
+                - timedelta(
+                    seconds=2 * (traffic.SNAPSHOT_POINTS - k),
+                    microseconds=random.randrange(10**6),
+                ),
+                bandwidth_up=random.random() * 100,
+                bandwidth_down=random.random() * 100,
+                total_up=1000 + k * 0.01,
+                total_down=2000 + k * 0.02,
+            )
+        services.append(service)
+    return services
+
+
+def main(args: argparse.Namespace):
+    for count in args.services:
+        services = make_services(count)
+        updates = [(service, {"last": 1}) for service in services]
+        runs = max(1, 200 // count)
+        for kind in ("snapshot", "delta"):
+            for label, encoding in ENCODINGS:
+                if kind == "snapshot":
+
+                    def build():
+                        summary = traffic._build_traffic_summary(
+                            services, encoding is not None
+                        )
+                        return traffic._encode({"type": kind, **summary}, encoding)
+
+                else:
+
+                    def build():
+                        return traffic._encode_delta(services, updates, [], encoding)
+
+                encode_ms, frame = timed(build, runs)
+                raw = frame.encode() if isinstance(frame, str) else frame
+                deflated = deflate(raw)
+                print(
+                    f"{count:5d} services {kind:8s} {label:8s} "
+                    f"{len(raw) / 1024:9.1f} KiB, encode {encode_ms:7.2f}ms, "
+                    f"deflated {len(deflated) / 1024:8.1f} KiB"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Traffic WebSocket frame benchmark")
+    parser.add_argument("--services", type=int, nargs="+", default=[10, 100, 1000])
+    main(parser.parse_args())
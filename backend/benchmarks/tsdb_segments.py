@@ -0,0 +1,168 @@
+"""
+Time-Series Segment Benchmark
+
+Compares the SQLite traffic_history table with the append-only segment
+files (app/services/tsdb.py) on a throwaway database and data directory:
+
+- flush-shaped ingest: one point per service per flush;
+- bulk ingest of one service's week of 2-second samples;
+- 1h / 24h / 7d range scans of that week, before and after compaction;
+- on-disk size.
+
+    python benchmarks/tsdb_segments.py --services 100 --flushes 500
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy import insert
+
+_workdir = tempfile.mkdtemp(prefix="komandorr-bench-")
+os.environ["DATABASE_PATH"] = os.path.join(_workdir, "bench.db")
+os.environ["LOG_ENABLE_FILE"] = "false"
+# The table side is read through the regular history code path
+os.environ["TSDB_ENABLED"] = "false"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.database import db, ServiceDB, TrafficHistoryDB  # noqa: E402
+from app.models.service import TrafficDataPoint  # noqa: E402
+from app.services.history_query import _read_columns  # noqa: E402
+from app.services.tsdb import SegmentStore, to_micros  # noqa: E402
+
+WEEK_POINTS = 7 * 24 * 3600 // 2
+
+
+def size_mb(path: Path) -> float:
+    files = [path] if path.is_file() else path.rglob("*")
+    return sum(f.stat().st_size for f in files if f.is_file()) / 1e6
+
+
+def main(args: argparse.Namespace):
+    store = SegmentStore(os.path.join(_workdir, "segments"), True)
+    session = db.get_session()
+    service_ids = [f"bench-{i}" for i in range(args.services)] + ["week"]
+    for service_id in service_ids:
+        session.add(
+            ServiceDB(id=service_id, name=service_id, url="http://x/", type="app")
+        )
+    session.commit()
+
+    # Flush-shaped ingest
+    start = datetime.now(timezone.utc) - timedelta(seconds=5 * args.flushes)
+    started = time.perf_counter()
+    for flush in range(args.flushes):
+        timestamp = (start + timedelta(seconds=5 * flush)).replace(tzinfo=None)
+        session.execute(
+            insert(TrafficHistoryDB),
+            [
+                {
+                    "service_id": service_id,
+                    "timestamp": timestamp,
+                    "bandwidth_up": 1.0,
+                    "bandwidth_down": 2.0,
+                    "total_up": 3.0,
+                    "total_down": 4.0,
+                }
+                for service_id in service_ids[:-1]
+            ],
+        )
+        session.commit()
+    table_time = time.perf_counter() - started
+    started = time.perf_counter()
+    for flush in range(args.flushes):
+        timestamp = start + timedelta(seconds=5 * flush)
+        for service_id in service_ids[:-1]:
+            store.append_points(
+                "traffic",
+                service_id,
+                [
+                    TrafficDataPoint(
+                        timestamp=timestamp,
+                        bandwidth_up=1.0,
+                        bandwidth_down=2.0,
+                        total_up=3.0,
+                        total_down=4.0,
+                    )
+                ],
+            )
+    segment_time = time.perf_counter() - started
+    print(
+        f"flush ingest, {args.services} services x {args.flushes} flushes: "
+        f"table {table_time:.2f}s, segments {segment_time:.2f}s"
+    )
+
+    # Bulk ingest of a week
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    timestamps = [now - timedelta(seconds=2 * i) for i in range(WEEK_POINTS)][::-1]
+    started = time.perf_counter()
+    session.execute(
+        insert(TrafficHistoryDB),
+        [
+            {
+                "service_id": "week",
+                "timestamp": timestamp,
+                "bandwidth_up": math.sin(i),
+                "bandwidth_down": 1.0,
+                "total_up": float(i),
+                "total_down": float(i),
+            }
+            for i, timestamp in enumerate(timestamps)
+        ],
+    )
+    session.commit()
+    table_time = time.perf_counter() - started
+    micros = np.array([to_micros(timestamp) for timestamp in timestamps])
+    started = time.perf_counter()
+    store.append("traffic", "week", micros, np.random.rand(4, len(micros)))
+    segment_time = time.perf_counter() - started
+    session.close()
+    print(
+        f"bulk ingest, {WEEK_POINTS} points: "
+        f"table {table_time:.2f}s, segments {segment_time:.2f}s"
+    )
+
+    def scan(label: str):
+        for name, span in (
+            ("1h", timedelta(hours=1)),
+            ("24h", timedelta(days=1)),
+            ("7d", timedelta(days=7)),
+        ):
+            begin, end = now - span, now + timedelta(seconds=1)
+            started = time.perf_counter()
+            x, _ = _read_columns("week", "traffic", begin, end)
+            table_time = time.perf_counter() - started
+            started = time.perf_counter()
+            y, _ = store.read_range(
+                "traffic", "week", to_micros(begin), to_micros(end)
+            )
+            segment_time = time.perf_counter() - started
+            print(
+                f"{label} scan {name} ({len(x)} / {len(y)} points): "
+                f"table {table_time * 1000:.1f}ms, "
+                f"segments {segment_time * 1000:.1f}ms"
+            )
+
+    scan("range")
+    started = time.perf_counter()
+    store.compact()
+    print(f"compaction {time.perf_counter() - started:.2f}s")
+    scan("compacted")
+
+    print(
+        f"on disk: table {size_mb(Path(os.environ['DATABASE_PATH'])):.0f}MB, "
+        f"segments {size_mb(Path(_workdir) / 'segments'):.0f}MB"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time-series segment benchmark")
+    parser.add_argument("--services", type=int, default=100)
+    parser.add_argument("--flushes", type=int, default=500)
+    main(parser.parse_args())
@@ -0,0 +1,40 @@
+"""Test setup: the app runs against a throwaway database and data directory"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+_workdir = tempfile.mkdtemp(prefix="komandorr-test-")
+os.chdir(_workdir)
+os.environ["DATABASE_PATH"] = os.path.join(_workdir, "komandorr.db")
+os.environ["LOG_ENABLE_FILE"] = "false"
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+# The app's background loops are process-wide singletons, so every test
+# shares one running app
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def service_id(client):
+    response = client.post(
+        "/api/services/",
+        json={
+            "name": "test",
+            "url": "http://127.0.0.1:9/",
+            "type": "server",
+            "check_interval": 3600,
+        },
+    )
+    assert response.status_code == 201
+    return response.json()["id"]
@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta, timezone
+
+
+def test_unflushed_traffic_point_is_in_range_history(client, service_id):
+    # Kept in memory until the next write-behind flush
+    response = client.post(
+        "/api/traffic/update",
+        json={
+            "service_id": service_id,
+            "bandwidth_up": 1.5,
+            "bandwidth_down": 2.5,
+            "total_up": 3.0,
+            "total_down": 4.0,
+        },
+    )
+    assert response.status_code == 200
+
+    start = datetime.now(timezone.utc) - timedelta(minutes=1)
+    response = client.get(
+        f"/api/traffic/{service_id}/history", params={"from": start.isoformat()}
+    )
+    assert response.status_code == 200
+    points = response.json()
+    assert [point["bandwidth_up"] for point in points] == [1.5]
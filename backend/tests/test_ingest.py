@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta, timezone
+from app.database import db, HistoryRollupDB, RollupStateDB, TrafficHistoryDB
+from app.services.monitor import monitor
+from app.services.rollups import floor_time, history_rollups
+
+
+def _traffic_rows(service_id: str) -> int:
+    session = db.get_session()
+    try:
+        return session.query(TrafficHistoryDB).filter_by(service_id=service_id).count()
+    finally:
+        session.close()
+
+
+def _sample(service_id: str, timestamp: datetime) -> dict:
+    return {
+        "service_id": service_id,
+        "timestamp": timestamp.isoformat(),
+        "bandwidth_up": 1.0,
+        "bandwidth_down": 2.0,
+        "total_up": 3.0,
+        "total_down": 4.0,
+    }
+
+
+def test_retried_traffic_batch_is_stored_once(client, service_id):
+    start = datetime.now(timezone.utc) - timedelta(minutes=10)
+    batch = {
+        "samples": [
+            _sample(service_id, start + timedelta(seconds=i)) for i in range(5)
+        ]
+    }
+
+    # The retry's samples are no newer than memory, so they go straight to
+    # the history table
+    for _ in range(2):
+        response = client.post("/api/traffic/batch", json=batch)
+        assert response.status_code == 200
+        assert response.json()["accepted"] == 5
+
+    assert _traffic_rows(service_id) == 5
+
+
+def test_late_sample_keeps_rollups_older_than_raw_history(client, service_id):
+    now = datetime.now(timezone.utc)
+    response = client.post(
+        "/api/traffic/batch",
+        json={"samples": [_sample(service_id, now - timedelta(minutes=1))]},
+    )
+    assert response.status_code == 200
+
+    # Buckets whose raw points retention has already pruned, each ending
+    # past the finer one (a coarse bucket its finer buckets fully cover is
+    # rightly rebuilt from them)
+    naive = now.replace(tzinfo=None)
+    last_minute = floor_time(naive - timedelta(days=2), 3600) + timedelta(minutes=59)
+    seeded = {
+        tier.seconds: floor_time(last_minute, tier.seconds)
+        for tier in history_rollups.tiers
+    }
+    session = db.get_session()
+    try:
+        for resolution, bucket in seeded.items():
+            session.add(
+                HistoryRollupDB(
+                    service_id=service_id,
+                    series="traffic",
+                    metric="bandwidth_up",
+                    resolution=resolution,
+                    bucket=bucket,
+                    count=60,
+                    min=1.0,
+                    max=1.0,
+                    avg=1.0,
+                    p95=1.0,
+                )
+            )
+            if session.get(RollupStateDB, ("traffic", resolution)) is None:
+                session.add(
+                    RollupStateDB(
+                        series="traffic",
+                        resolution=resolution,
+                        watermark=floor_time(naive, resolution),
+                    )
+                )
+        session.commit()
+    finally:
+        session.close()
+
+    response = client.post(
+        "/api/traffic/batch",
+        json={"samples": [_sample(service_id, now - timedelta(days=3))]},
+    )
+    assert response.status_code == 200
+
+    session = db.get_session()
+    try:
+        kept = {
+            row.resolution: row.bucket
+            for row in session.query(HistoryRollupDB).filter_by(
+                service_id=service_id, series="traffic"
+            )
+        }
+    finally:
+        session.close()
+    assert kept == seeded
+
+
+def test_samples_ahead_of_the_clock_stay_distinct(client, service_id):
+    ahead = datetime.now(timezone.utc) + timedelta(minutes=1)
+    batch = {
+        "samples": [
+            _sample(service_id, ahead + timedelta(seconds=i)) for i in range(3)
+        ]
+    }
+    response = client.post("/api/traffic/batch", json=batch)
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 3
+
+    history = monitor.get_service(service_id).traffic_history
+    assert len({point.timestamp for point in history}) == 3
+    assert _traffic_rows(service_id) == 3
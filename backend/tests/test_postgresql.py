@@ -0,0 +1,155 @@
+"""PostgreSQL code paths, compiled for the postgresql dialect so they run
+without a server. Set TEST_DATABASE_URL to a PostgreSQL database to also run
+them against one."""
+
+import os
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+from app.database import (
+    SCHEMA_LOCK_ID,
+    Database,
+    RollupStateDB,
+    ServiceDB,
+    TrafficHistoryDB,
+    database_url,
+)
+from app.migrations import _watch_history_search
+
+TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL", "")
+
+
+class RecordingConnection:
+    """Stands in for a PostgreSQL connection, keeping the SQL it is given"""
+
+    def __init__(self):
+        self.dialect = postgresql.psycopg.dialect()
+        self.statements = []
+
+    def exec_driver_sql(self, statement):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+def _postgresql_database(conn=None) -> Database:
+    """A Database set up as on PostgreSQL, without connecting"""
+    pg = Database.__new__(Database)
+    pg.url = database_url("postgresql://komandorr@localhost/komandorr")
+    pg.is_sqlite = False
+    pg.engine = SimpleNamespace(connect=lambda: conn)
+    return pg
+
+
+def _compile(statement) -> str:
+    return str(statement.compile(dialect=postgresql.psycopg.dialect()))
+
+
+@pytest.mark.parametrize(
+    "url",
+    ["postgresql://komandorr@db/komandorr", "postgres://komandorr@db/komandorr"],
+)
+def test_postgresql_urls_use_psycopg(url):
+    assert database_url(url).drivername == "postgresql+psycopg"
+
+
+def test_schema_lock_is_released_after_a_failure():
+    conn = RecordingConnection()
+    with pytest.raises(RuntimeError):
+        with _postgresql_database(conn)._schema_lock():
+            conn.statements.append("migrate")
+            raise RuntimeError("migration failed")
+
+    assert conn.statements == [
+        f"SELECT pg_advisory_lock({SCHEMA_LOCK_ID})",
+        "migrate",
+        f"SELECT pg_advisory_unlock({SCHEMA_LOCK_ID})",
+    ]
+
+
+def test_history_insert_skips_stored_points():
+    statement = (
+        _postgresql_database()
+        .insert(TrafficHistoryDB)
+        .on_conflict_do_nothing(index_elements=["service_id", "timestamp"])
+    )
+    assert "ON CONFLICT (service_id, timestamp) DO NOTHING" in _compile(statement)
+
+
+def test_rollup_watermark_upsert():
+    upsert = (
+        _postgresql_database()
+        .insert(RollupStateDB)
+        .values(series="traffic", resolution=60, watermark=datetime(2026, 1, 1))
+    )
+    statement = upsert.on_conflict_do_update(
+        index_elements=["series", "resolution"],
+        set_={"watermark": upsert.excluded.watermark},
+    )
+    assert (
+        "ON CONFLICT (series, resolution) DO UPDATE SET watermark = excluded.watermark"
+        in _compile(statement)
+    )
+
+
+def test_watch_history_search_uses_a_gin_index():
+    conn = RecordingConnection()
+    _watch_history_search(conn)
+
+    assert len(conn.statements) == 1
+    assert conn.statements[0].startswith(
+        "CREATE INDEX IF NOT EXISTS ix_watch_history_search "
+        "ON watch_history USING GIN ((to_tsvector("
+    )
+
+
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL not set")
+def test_postgresql_database():
+    # A second instance takes the schema lock and finds nothing to migrate
+    Database(TEST_DATABASE_URL)
+    pg = Database(TEST_DATABASE_URL)
+
+    with pg.engine.connect() as conn:
+        indexes = set(
+            conn.exec_driver_sql(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'watch_history'"
+            ).scalars()
+        )
+    assert "ix_watch_history_search" in indexes
+
+    row = {
+        "service_id": "postgresql-test",
+        "timestamp": datetime(2026, 1, 1),
+        "bandwidth_up": 1.0,
+        "bandwidth_down": 2.0,
+        "total_up": 3.0,
+        "total_down": 4.0,
+    }
+    statement = pg.insert(TrafficHistoryDB).on_conflict_do_nothing(
+        index_elements=["service_id", "timestamp"]
+    )
+    session = pg.get_session()
+    try:
+        session.add(
+            ServiceDB(
+                id=row["service_id"], name="test", url="http://db/", type="server"
+            )
+        )
+        session.flush()
+        session.execute(statement, [row, row])
+        stored = session.execute(
+            select(TrafficHistoryDB.id).where(
+                TrafficHistoryDB.service_id == row["service_id"]
+            )
+        ).all()
+        assert len(stored) == 1
+    finally:
+        session.rollback()
+        session.close()
@@ -0,0 +1,53 @@
+from typing import List, Tuple
+
+import pytest
+from sqlalchemy import event
+from app.database import db
+from app.services.monitor import monitor
+from app.services.retention import history_retention
+
+HISTORY_TABLES = ("response_history", "traffic_history", "storage_history")
+
+
+def _ranking_statements(run) -> List[Tuple[str, tuple]]:
+    """ROW_NUMBER() statements executed by `run`, with their parameters"""
+    statements: List[Tuple[str, tuple]] = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if "row_number()" in statement.lower():
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        run()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+    return statements
+
+
+def _load_history():
+    session = db.get_session()
+    try:
+        for series in ("response", "traffic", "storage"):
+            monitor._load_recent_history(session, series)
+    finally:
+        session.close()
+
+
+@pytest.mark.parametrize(
+    "run", [_load_history, history_retention.prune], ids=["loader", "retention"]
+)
+def test_history_ranking_walks_the_service_timestamp_index(client, run):
+    statements = _ranking_statements(run)
+    assert len(statements) == len(HISTORY_TABLES)
+
+    with db.engine.connect() as conn:
+        for (statement, parameters), table in zip(statements, HISTORY_TABLES):
+            plan = [
+                row[-1]
+                for row in conn.exec_driver_sql(
+                    f"EXPLAIN QUERY PLAN {statement}", parameters
+                )
+            ]
+            assert any(f"ix_{table}_service_timestamp" in step for step in plan), plan
+            assert not any("USE TEMP B-TREE" in step for step in plan), plan
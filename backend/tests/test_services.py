@@ -0,0 +1,24 @@
+import pytest
+
+SERVICE = {"name": "test", "url": "http://127.0.0.1:9/", "type": "server"}
+
+
+@pytest.mark.parametrize(
+    "field, value",
+    [("check_interval", 0), ("check_interval", -30), ("check_timeout", 0)],
+)
+def test_invalid_check_settings_are_rejected(client, service_id, field, value):
+    response = client.post("/api/services/", json={**SERVICE, field: value})
+    assert response.status_code == 422
+
+    response = client.put(f"/api/services/{service_id}", json={field: value})
+    assert response.status_code == 422
+
+
+def test_null_probe_resets_to_auto(client, service_id):
+    response = client.put(f"/api/services/{service_id}", json={"probe": "tcp"})
+    assert response.json()["probe"] == "tcp"
+
+    response = client.put(f"/api/services/{service_id}", json={"probe": None})
+    assert response.status_code == 200
+    assert response.json()["probe"] == "auto"
@@ -0,0 +1,53 @@
+import asyncio
+import threading
+
+from app.api.traffic import CLIENT_QUEUE_SIZE, ws_manager
+
+UPDATE = {
+    "bandwidth_up": 1.0,
+    "bandwidth_down": 2.0,
+    "total_up": 3.0,
+    "total_down": 4.0,
+}
+
+
+def test_slow_client_is_resynced_without_stalling_others(client, service_id):
+    released = threading.Event()
+
+    with client.websocket_connect("/api/traffic/ws") as fast, client.websocket_connect(
+        "/api/traffic/ws"
+    ) as slow:
+        assert fast.receive_json()["type"] == "snapshot"
+        assert slow.receive_json()["type"] == "snapshot"
+
+        # The slow client's writer blocks on its next frame until released
+        stalled = ws_manager.clients[-1]
+        send_text = stalled.websocket.send_text
+
+        async def blocked_send_text(data):
+            while not released.is_set():
+                await asyncio.sleep(0.01)
+            await send_text(data)
+
+        stalled.websocket.send_text = blocked_send_text
+
+        # One frame is held by the blocked send, the rest overflow the queue
+        deltas = CLIENT_QUEUE_SIZE + 2
+        for _ in range(deltas):
+            response = client.post(
+                "/api/traffic/update", json={"service_id": service_id, **UPDATE}
+            )
+            assert response.status_code == 200
+            client.portal.call(ws_manager._send_delta)
+
+        for _ in range(deltas):
+            assert fast.receive_json()["type"] == "delta"
+        assert stalled.dropped > 0
+        assert None in stalled.queue
+
+        # The held frame (if any) is followed by a snapshot instead of the
+        # dropped deltas
+        released.set()
+        frames = [slow.receive_json() for _ in range(2)]
+        snapshot = next(frame for frame in frames if frame["type"] == "snapshot")
+        assert service_id in {service["id"] for service in snapshot["services"]}
@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from app.models.service import TrafficDataPoint
+from app.services.tsdb import SegmentStore, to_micros
+
+
+def test_concurrent_appends_keep_every_point(tmp_path):
+    store = SegmentStore(str(tmp_path), enabled=True)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    threads, flushes, points_per_flush = 8, 50, 3
+
+    def flush(index: int):
+        store.append_points(
+            "traffic",
+            "service",
+            [
+                TrafficDataPoint(
+                    timestamp=start
+                    + timedelta(milliseconds=index * points_per_flush + offset),
+                    bandwidth_up=1.0,
+                    bandwidth_down=2.0,
+                    total_up=3.0,
+                    total_down=4.0,
+                )
+                for offset in range(points_per_flush)
+            ],
+        )
+
+    # Like flushes on the database thread pool when the writer isn't running
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(flush, range(threads * flushes)))
+
+    timestamps, _ = store.read_range(
+        "traffic", "service", to_micros(start), to_micros(start + timedelta(days=1))
+    )
+    assert len(timestamps) == threads * flushes * points_per_flush
+    assert len(set(timestamps.tolist())) == len(timestamps)
+
+    store.compact()
+    timestamps, _ = store.read_range(
+        "traffic", "service", to_micros(start), to_micros(start + timedelta(days=1))
+    )
+    assert len(timestamps) == threads * flushes * points_per_flush
+
+
+def test_retried_flush_is_read_once_with_its_last_values(tmp_path):
+    store = SegmentStore(str(tmp_path), enabled=True)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    end = to_micros(start + timedelta(days=1))
+
+    def flush(bandwidth_up: float):
+        store.append_points(
+            "traffic",
+            "service",
+            [
+                TrafficDataPoint(
+                    timestamp=start + timedelta(seconds=offset),
+                    bandwidth_up=bandwidth_up,
+                    bandwidth_down=2.0,
+                    total_up=3.0,
+                    total_down=4.0,
+                )
+                for offset in range(3)
+            ],
+        )
+
+    flush(1.0)
+    flush(5.0)
+
+    before = store.read_range("traffic", "service", to_micros(start), end)
+    assert len(before[0]) == 3
+    assert before[1]["bandwidth_up"].tolist() == [5.0, 5.0, 5.0]
+    assert store.latest("traffic", "service", 10)[0].tolist() == before[0].tolist()
+
+    # Reads see what compaction keeps
+    store.compact()
+    after = store.read_range("traffic", "service", to_micros(start), end)
+    assert after[0].tolist() == before[0].tolist()
+    assert after[1]["bandwidth_up"].tolist() == [5.0, 5.0, 5.0]
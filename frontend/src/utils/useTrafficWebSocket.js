@@ -2,6 +2,65 @@ import { useEffect, useRef, useCallback } from "react";
 import { useQueryClient } from "@tanstack/react-query";
 
 const RECONNECT_INTERVAL = 3000;
+// History points kept per service, matching the server's snapshot
+const HISTORY_POINTS = 60;
+// Columnar frames (one array per field, epoch-ms timestamps) are smaller and
+// cheaper to encode; servers without support fall back to plain JSON
+const COLUMNAR_PROTOCOL = "komandorr.columnar";
+
+// Expand columnar history into the point objects the REST API returns
+function toPoints(columns) {
+  const { timestamp, ...fields } = columns;
+  return timestamp.map((ms, i) => {
+    const point = { timestamp: new Date(ms).toISOString() };
+    for (const [name, values] of Object.entries(fields)) {
+      point[name] = values[i];
+    }
+    return point;
+  });
+}
+
+function fromColumnar(service) {
+  const { traffic_history, points, last_updated, ...metrics } = service;
+  return {
+    ...metrics,
+    last_updated:
+      last_updated == null ? null : new Date(last_updated).toISOString(),
+    ...(traffic_history && { traffic_history: toPoints(traffic_history) }),
+    ...(points && { points: toPoints(points) }),
+  };
+}
+
+// Apply a delta (changed services with their new points) to the summary
+function mergeDelta(summary, delta) {
+  const { services: changed, removed, ...totals } = delta;
+  const removedIds = new Set(removed);
+  const byId = new Map(
+    (summary?.services || [])
+      .filter((service) => !removedIds.has(service.id))
+      .map((service) => [service.id, service]),
+  );
+
+  for (const { points, ...metrics } of changed) {
+    const previous = byId.get(metrics.id);
+    const history = previous?.traffic_history || [];
+    const newest = history.length
+      ? Date.parse(history[history.length - 1].timestamp)
+      : null;
+    // A delta can repeat points already in the snapshot
+    const fresh =
+      newest === null
+        ? points
+        : points.filter((point) => Date.parse(point.timestamp) > newest);
+    byId.set(metrics.id, {
+      ...previous,
+      ...metrics,
+      traffic_history: history.concat(fresh).slice(-HISTORY_POINTS),
+    });
+  }
+
+  return { ...summary, ...totals, services: [...byId.values()] };
+}
 
 export function useTrafficWebSocket() {
   const queryClient = useQueryClient();
@@ -13,7 +72,7 @@ export function useTrafficWebSocket() {
     const protocol = window.location.protocol === "https:" ? "wss:" : "ws:";
     const wsUrl = `${protocol}//${window.location.host}/api/traffic/ws`;
 
-    const ws = new WebSocket(wsUrl);
+    const ws = new WebSocket(wsUrl, [COLUMNAR_PROTOCOL]);
 
     ws.onopen = () => {
       // Clear any pending reconnect timer
@@ -25,9 +84,18 @@ export function useTrafficWebSocket() {
 
     ws.onmessage = (event) => {
       try {
-        const data = JSON.parse(event.data);
+        const { type, ...data } = JSON.parse(event.data);
+        if (ws.protocol === COLUMNAR_PROTOCOL) {
+          data.services = data.services.map(fromColumnar);
+        }
         // Update React Query cache directly — no refetch needed
-        queryClient.setQueryData(["traffic"], data);
+        if (type === "delta") {
+          queryClient.setQueryData(["traffic"], (summary) =>
+            mergeDelta(summary, data),
+          );
+        } else {
+          queryClient.setQueryData(["traffic"], data);
+        }
       } catch {
         // Ignore malformed messages
       }